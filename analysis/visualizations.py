@@ -2,28 +2,68 @@ from __future__ import annotations
 
 import os
 import json
+import hashlib
 import sqlite3
 import argparse
-import pandas as pd
-import matplotlib
-matplotlib.use("Agg")  # Renderiza sin necesidad de UI/display
-import matplotlib.pyplot as plt
-import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+
+# pandas/matplotlib/seaborn se importan bajo demanda: importar este módulo es barato
+if TYPE_CHECKING:
+    import pandas as pd
 
 DEFAULT_DB_PATH = os.getenv("DB_PATH", os.path.join("data", "db", "reports.sqlite"))
+DEFAULT_PARQUET_DIR = os.getenv("PARQUET_DIR", os.path.join("data", "processed", "reports_parquet"))
 OUTPUT_DIR = os.path.join("data", "analysis")
 
+# Columnas que realmente usan las gráficas (evita leer nombre/comentario)
+ANALYSIS_COLUMNS = [
+    "id",
+    "edad",
+    "ciudad",
+    "categoria_problema",
+    "urgente",
+    "fecha_reporte",
+    "acceso_internet",
+    "atencion_previa_gobierno",
+    "zona_rural",
+]
+
 
 def _ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def load_reports(db_path: str) -> pd.DataFrame:
-    conn = sqlite3.connect(db_path)
-    try:
-        df = pd.read_sql_query("SELECT * FROM reports", conn)
-    finally:
-        conn.close()
+def _pyplot():
+    import matplotlib
+
+    matplotlib.use("Agg")  # Renderiza sin necesidad de UI/display
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    return plt, sns
+
+
+def load_reports(
+    db_path: str,
+    columns: list[str] | None = None,
+    parquet_dir: str | None = None,
+    filters: dict | None = None,
+) -> pd.DataFrame:
+    """Carga reportes desde el dataset Parquet (si existe) o desde SQLite.
+
+    - `columns`: proyección de columnas (todas si es None)
+    - `filters`: mismas claves que la API (ciudad, categoria_problema, urgente, fecha_desde, fecha_antes, fecha_hasta);
+      en Parquet se empujan a la poda de particiones por mes
+    """
+    import pandas as pd
+
+    if parquet_dir and os.path.isdir(parquet_dir):
+        from etl.load.store_parquet import read_parquet_reports
+
+        df = read_parquet_reports(parquet_dir, columns=columns, filters=filters)
+    else:
+        df = _load_reports_sqlite(db_path, columns, filters)
 
     # Normaliza tipos útiles para gráficas
     if "fecha_reporte" in df.columns:
@@ -31,12 +71,40 @@ def load_reports(db_path: str) -> pd.DataFrame:
     return df
 
 
+def _load_reports_sqlite(db_path: str, columns: list[str] | None, filters: dict | None) -> pd.DataFrame:
+    import pandas as pd
+
+    cols = ", ".join(columns) if columns else "*"
+    where: list[str] = []
+    params: list = []
+    f = filters or {}
+    for key, cond in (
+        ("ciudad", "ciudad = ?"),
+        ("categoria_problema", "categoria_problema = ?"),
+        ("fecha_desde", "fecha_reporte >= ?"),
+        ("fecha_antes", "fecha_reporte < ?"),
+        ("fecha_hasta", "fecha_reporte <= ?"),
+    ):
+        if f.get(key):
+            where.append(cond)
+            params.append(f[key])
+    if f.get("urgente") is not None:
+        where.append("urgente = ?")
+        params.append(int(f["urgente"]))
+    where_clause = " AND ".join(where) if where else "1=1"
+    conn = sqlite3.connect(db_path)
+    try:
+        return pd.read_sql_query(f"SELECT {cols} FROM reports WHERE {where_clause}", conn, params=params)
+    finally:
+        conn.close()
+
+
 def assess_db(db_path: str) -> dict:
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     try:
         # Verifica tablas e índices básicos
-        tbls = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+        tbls = conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')").fetchall()
         names = {t[0] for t in tbls}
         has_reports = "reports" in names
         has_fts = "report_search" in names
@@ -54,148 +122,300 @@ def assess_db(db_path: str) -> dict:
         conn.close()
 
 
-def plot_heatmap_correlations(df: pd.DataFrame, out_dir: str) -> str:
+# Cada gráfica se divide en dos pasos:
+# - _agg_*: reduce el DataFrame a la serie/matriz pequeña que necesita (listas JSON-serializables)
+# - _render_*: dibuja esa serie; corre en un proceso aparte (matplotlib no es thread-safe)
+# El hash del agregado identifica el contenido de la gráfica: si no cambia, no se vuelve a dibujar.
+
+# Súbelo cuando cambie el estilo de alguna gráfica para invalidar las salidas cacheadas
+RENDER_VERSION = 1
+DPI = 150
+MANIFEST_NAME = "charts_manifest.json"
+
+
+def _series(counts: pd.Series) -> dict:
+    return {"index": [str(i) for i in counts.index], "values": [int(v) for v in counts.values]}
+
+
+def _agg_heatmap_correlations(df: pd.DataFrame) -> dict | None:
     num_cols = [c for c in [
         "edad", "acceso_internet", "atencion_previa_gobierno", "zona_rural", "urgente"
     ] if c in df.columns]
+    if not num_cols:
+        return None
     corr = df[num_cols].corr(numeric_only=True)
+    return {"columns": list(corr.columns), "values": [[round(float(v), 6) for v in row] for row in corr.values]}
+
+
+def _render_heatmap_correlations(data: dict, out_path: str) -> str:
+    import pandas as pd
+
+    plt, sns = _pyplot()
+    corr = pd.DataFrame(data["values"], index=data["columns"], columns=data["columns"])
     plt.figure(figsize=(6, 4))
     sns.heatmap(corr, annot=True, cmap="Reds", fmt=".2f")
     plt.title("Correlaciones (numéricas)")
-    out_path = os.path.join(out_dir, "heatmap_correlaciones.png")
     plt.tight_layout()
-    plt.savefig(out_path, dpi=150)
+    plt.savefig(out_path, dpi=DPI)
     plt.close()
     return out_path
 
 
-def plot_heatmap_ciudad_categoria(df: pd.DataFrame, out_dir: str, top_cities: int = 12, top_cats: int = 12) -> str:
+def _agg_heatmap_ciudad_categoria(df: pd.DataFrame, top_cities: int = 12, top_cats: int = 12) -> dict | None:
+    import pandas as pd
+
     if "ciudad" not in df.columns or "categoria_problema" not in df.columns:
-        return ""
+        return None
     top_ciudades = df["ciudad"].value_counts().nlargest(top_cities).index
     top_categorias = df["categoria_problema"].value_counts().nlargest(top_cats).index
     sub = df[df["ciudad"].isin(top_ciudades) & df["categoria_problema"].isin(top_categorias)]
-    pivot = sub.pivot_table(index="ciudad", columns="categoria_problema", values="id", aggfunc="count", fill_value=0)
+    pivot = pd.crosstab(sub["ciudad"].astype(str), sub["categoria_problema"].astype(str))
+    return {
+        "index": list(pivot.index),
+        "columns": list(pivot.columns),
+        "values": [[int(v) for v in row] for row in pivot.values],
+    }
+
+
+def _render_heatmap_ciudad_categoria(data: dict, out_path: str) -> str:
+    import pandas as pd
+
+    plt, sns = _pyplot()
+    pivot = pd.DataFrame(
+        data["values"],
+        index=pd.Index(data["index"], name="ciudad"),
+        columns=pd.Index(data["columns"], name="categoria_problema"),
+    )
     plt.figure(figsize=(10, 6))
     sns.heatmap(pivot, cmap="Blues")
     plt.title("Mapa de calor: Ciudad vs Categoría (Top)")
-    out_path = os.path.join(out_dir, "heatmap_ciudad_categoria.png")
     plt.tight_layout()
-    plt.savefig(out_path, dpi=150)
+    plt.savefig(out_path, dpi=DPI)
     plt.close()
     return out_path
 
 
-def plot_bar_categorias(df: pd.DataFrame, out_dir: str, top: int = 15) -> str:
+def _agg_bar_categorias(df: pd.DataFrame, top: int = 15) -> dict | None:
     if "categoria_problema" not in df.columns:
-        return ""
-    counts = df["categoria_problema"].value_counts().nlargest(top)
+        return None
+    return _series(df["categoria_problema"].value_counts().nlargest(top))
+
+
+def _render_bar_categorias(data: dict, out_path: str) -> str:
+    plt, sns = _pyplot()
     plt.figure(figsize=(10, 5))
-    sns.barplot(x=counts.index, y=counts.values, color="tab:blue")
+    sns.barplot(x=data["index"], y=data["values"], color="tab:blue")
     plt.xticks(rotation=45, ha="right")
     plt.title("Distribución de categorías (Top)")
     plt.ylabel("# reportes")
-    out_path = os.path.join(out_dir, "bar_categorias.png")
     plt.tight_layout()
-    plt.savefig(out_path, dpi=150)
+    plt.savefig(out_path, dpi=DPI)
     plt.close()
     return out_path
 
 
-def plot_bar_urgente(df: pd.DataFrame, out_dir: str) -> str:
+def _agg_bar_urgente(df: pd.DataFrame) -> dict | None:
     if "urgente" not in df.columns:
-        return ""
+        return None
     counts = df["urgente"].value_counts().sort_index()
-    labels = ["No urgente (0)", "Urgente (1)"] if set(counts.index) == {0, 1} else counts.index
+    data = _series(counts)
+    if set(counts.index) == {0, 1}:
+        data["index"] = ["No urgente (0)", "Urgente (1)"]
+    return data
+
+
+def _render_bar_urgente(data: dict, out_path: str) -> str:
+    plt, sns = _pyplot()
     plt.figure(figsize=(5, 4))
-    sns.barplot(x=labels, y=counts.values, palette=["tab:gray", "tab:red"])
+    sns.barplot(x=data["index"], y=data["values"], palette=["tab:gray", "tab:red"])
     plt.title("Urgencia")
     plt.ylabel("# reportes")
-    out_path = os.path.join(out_dir, "bar_urgente.png")
     plt.tight_layout()
-    plt.savefig(out_path, dpi=150)
+    plt.savefig(out_path, dpi=DPI)
     plt.close()
     return out_path
 
 
-def plot_bar_ciudades(df: pd.DataFrame, out_dir: str, top: int = 15) -> str:
+def _agg_bar_ciudades(df: pd.DataFrame, top: int = 15) -> dict | None:
     if "ciudad" not in df.columns:
-        return ""
-    counts = df["ciudad"].value_counts().nlargest(top)
+        return None
+    return _series(df["ciudad"].value_counts().nlargest(top))
+
+
+def _render_bar_ciudades(data: dict, out_path: str) -> str:
+    plt, sns = _pyplot()
     plt.figure(figsize=(10, 5))
-    sns.barplot(x=counts.index, y=counts.values, color="tab:green")
+    sns.barplot(x=data["index"], y=data["values"], color="tab:green")
     plt.xticks(rotation=45, ha="right")
     plt.title("Top ciudades por # de reportes")
     plt.ylabel("# reportes")
-    out_path = os.path.join(out_dir, "bar_ciudades.png")
     plt.tight_layout()
-    plt.savefig(out_path, dpi=150)
+    plt.savefig(out_path, dpi=DPI)
     plt.close()
     return out_path
 
 
-def plot_linea_tiempo(df: pd.DataFrame, out_dir: str) -> str:
+def _agg_timeseries(df: pd.DataFrame, freq: str) -> dict | None:
     if "fecha_reporte" not in df.columns:
-        return ""
-    ts = df.dropna(subset=["fecha_reporte"]).copy()
-    ts["fecha"] = ts["fecha_reporte"].dt.to_period("D").dt.to_timestamp()
-    daily = ts.groupby("fecha").size().sort_index()
+        return None
+    fechas = df["fecha_reporte"].dropna().dt.to_period(freq).dt.to_timestamp()
+    counts = fechas.value_counts().sort_index()
+    return {"index": [d.date().isoformat() for d in counts.index], "values": [int(v) for v in counts.values]}
+
+
+def _render_line(data: dict, out_path: str, title: str, xlabel: str, color: str) -> str:
+    import pandas as pd
+
+    plt, sns = _pyplot()
+    x = pd.to_datetime(data["index"])
     plt.figure(figsize=(10, 4))
-    plt.plot(daily.index, daily.values, color="tab:blue")
-    plt.title("Reportes por día")
+    plt.plot(x, data["values"], color=color)
+    plt.title(title)
     plt.ylabel("# reportes")
-    plt.xlabel("Fecha")
-    out_path = os.path.join(out_dir, "line_diario.png")
+    plt.xlabel(xlabel)
     plt.tight_layout()
-    plt.savefig(out_path, dpi=150)
+    plt.savefig(out_path, dpi=DPI)
     plt.close()
     return out_path
 
 
+def _render_linea_tiempo(data: dict, out_path: str) -> str:
+    return _render_line(data, out_path, "Reportes por día", "Fecha", "tab:blue")
+
+
+def _render_linea_mensual(data: dict, out_path: str) -> str:
+    return _render_line(data, out_path, "Reportes por mes", "Mes", "tab:orange")
+
+
+# nombre -> (archivo, agregador, renderizador)
+CHARTS = {
+    "heatmap_correlaciones": ("heatmap_correlaciones.png", _agg_heatmap_correlations, _render_heatmap_correlations),
+    "heatmap_ciudad_categoria": ("heatmap_ciudad_categoria.png", _agg_heatmap_ciudad_categoria, _render_heatmap_ciudad_categoria),
+    "bar_categorias": ("bar_categorias.png", _agg_bar_categorias, _render_bar_categorias),
+    "bar_ciudades": ("bar_ciudades.png", _agg_bar_ciudades, _render_bar_ciudades),
+    "bar_urgente": ("bar_urgente.png", _agg_bar_urgente, _render_bar_urgente),
+    "line_diario": ("line_diario.png", lambda df: _agg_timeseries(df, "D"), _render_linea_tiempo),
+    "line_mensual": ("line_mensual.png", lambda df: _agg_timeseries(df, "M"), _render_linea_mensual),
+}
+
+
+def _plot(name: str, df: pd.DataFrame, out_dir: str) -> str:
+    filename, agg, render = CHARTS[name]
+    data = agg(df)
+    return render(data, os.path.join(out_dir, filename)) if data is not None else ""
+
+
+def plot_heatmap_correlations(df: pd.DataFrame, out_dir: str) -> str:
+    return _plot("heatmap_correlaciones", df, out_dir)
+
+
+def plot_heatmap_ciudad_categoria(df: pd.DataFrame, out_dir: str, top_cities: int = 12, top_cats: int = 12) -> str:
+    data = _agg_heatmap_ciudad_categoria(df, top_cities, top_cats)
+    return _render_heatmap_ciudad_categoria(data, os.path.join(out_dir, "heatmap_ciudad_categoria.png")) if data else ""
+
+
+def plot_bar_categorias(df: pd.DataFrame, out_dir: str, top: int = 15) -> str:
+    data = _agg_bar_categorias(df, top)
+    return _render_bar_categorias(data, os.path.join(out_dir, "bar_categorias.png")) if data else ""
+
+
+def plot_bar_urgente(df: pd.DataFrame, out_dir: str) -> str:
+    return _plot("bar_urgente", df, out_dir)
+
+
+def plot_bar_ciudades(df: pd.DataFrame, out_dir: str, top: int = 15) -> str:
+    data = _agg_bar_ciudades(df, top)
+    return _render_bar_ciudades(data, os.path.join(out_dir, "bar_ciudades.png")) if data else ""
+
+
+def plot_linea_tiempo(df: pd.DataFrame, out_dir: str) -> str:
+    return _plot("line_diario", df, out_dir)
+
+
 def plot_linea_mensual(df: pd.DataFrame, out_dir: str) -> str:
-    if "fecha_reporte" not in df.columns:
-        return ""
-    ts = df.dropna(subset=["fecha_reporte"]).copy()
-    ts["mes"] = ts["fecha_reporte"].dt.to_period("M").dt.to_timestamp()
-    monthly = ts.groupby("mes").size().sort_index()
-    plt.figure(figsize=(10, 4))
-    plt.plot(monthly.index, monthly.values, color="tab:orange")
-    plt.title("Reportes por mes")
-    plt.ylabel("# reportes")
-    plt.xlabel("Mes")
-    out_path = os.path.join(out_dir, "line_mensual.png")
-    plt.tight_layout()
-    plt.savefig(out_path, dpi=150)
-    plt.close()
-    return out_path
+    return _plot("line_mensual", df, out_dir)
+
+
+def _content_hash(name: str, data: dict) -> str:
+    payload = json.dumps({"chart": name, "v": RENDER_VERSION, "dpi": DPI, "data": data}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
-def generate_all(db_path: str, out_dir: str = OUTPUT_DIR) -> dict:
+def _read_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _render_job(name: str, data: dict, out_path: str) -> str:
+    # Punto de entrada en el proceso hijo
+    return CHARTS[name][2](data, out_path)
+
+
+def render_charts(df: pd.DataFrame, out_dir: str, workers: int | None = None) -> tuple[dict, list[str]]:
+    """Agrega cada gráfica, omite las que no cambiaron (hash del agregado) y dibuja el resto en paralelo.
+
+    Devuelve ({nombre: ruta}, [nombres re-dibujados]).
+    """
+    manifest = _read_manifest(out_dir)
+    outputs: dict = {}
+    pending: list[tuple[str, dict, str, str]] = []
+    for name, (filename, agg, _render) in CHARTS.items():
+        data = agg(df)
+        if data is None:
+            outputs[name] = ""
+            manifest.pop(name, None)
+            continue
+        out_path = os.path.join(out_dir, filename)
+        digest = _content_hash(name, data)
+        outputs[name] = out_path
+        if manifest.get(name) == digest and os.path.isfile(out_path):
+            continue
+        pending.append((name, data, out_path, digest))
+
+    if len(pending) == 1 or workers == 1:
+        for name, data, out_path, _digest in pending:
+            _render_job(name, data, out_path)
+    elif pending:
+        max_workers = min(len(pending), workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_render_job, name, data, out_path) for name, data, out_path, _digest in pending]
+            for fut in futures:
+                fut.result()
+
+    for name, _data, _out_path, digest in pending:
+        manifest[name] = digest
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return outputs, [p[0] for p in pending]
+
+
+def generate_all(
+    db_path: str,
+    out_dir: str = OUTPUT_DIR,
+    parquet_dir: str | None = DEFAULT_PARQUET_DIR,
+    workers: int | None = None,
+) -> dict:
     _ensure_dir(out_dir)
-    df = load_reports(db_path)
+    df = load_reports(db_path, columns=ANALYSIS_COLUMNS, parquet_dir=parquet_dir)
     summary = assess_db(db_path)
 
-    outputs = {
-        "heatmap_correlaciones": plot_heatmap_correlations(df, out_dir),
-        "heatmap_ciudad_categoria": plot_heatmap_ciudad_categoria(df, out_dir),
-        "bar_categorias": plot_bar_categorias(df, out_dir),
-        "bar_ciudades": plot_bar_ciudades(df, out_dir),
-        "bar_urgente": plot_bar_urgente(df, out_dir),
-        "line_diario": plot_linea_tiempo(df, out_dir),
-        "line_mensual": plot_linea_mensual(df, out_dir),
-    }
+    outputs, rendered = render_charts(df, out_dir, workers)
 
     # Guarda resumen de integración de DB + rutas de salida
     summary_out = {
         "db": summary,
         "charts": {k: os.path.abspath(v) if v else "" for k, v in outputs.items()},
+        "rendered": rendered,
         "rows": len(df),
     }
     with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
         json.dump(summary_out, f, ensure_ascii=False, indent=2)
 
     # Mensaje final
-    print("Análisis completado. Salidas:")
+    print(f"Análisis completado. Gráficas re-dibujadas: {len(rendered)}/{len(outputs)}. Salidas:")
     for k, v in summary_out["charts"].items():
         print(f"- {k}: {v}")
     print(f"Resumen DB: {json.dumps(summary_out['db'], ensure_ascii=False)}")
@@ -206,8 +426,14 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Genera gráficas (heatmap, barras, líneas) desde SQLite")
     parser.add_argument("--db-path", default=DEFAULT_DB_PATH, help="Ruta de la base SQLite (por defecto data/db/reports.sqlite)")
     parser.add_argument("--out-dir", default=OUTPUT_DIR, help="Carpeta de salida para las gráficas")
+    parser.add_argument(
+        "--parquet-dir",
+        default=DEFAULT_PARQUET_DIR,
+        help="Dataset Parquet particionado generado por el ETL (si no existe se lee desde SQLite)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para dibujar (por defecto, núcleos disponibles)")
     args = parser.parse_args()
-    generate_all(args.db_path, args.out_dir)
+    generate_all(args.db_path, args.out_dir, args.parquet_dir, args.workers)
 
 
 if __name__ == "__main__":
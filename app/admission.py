@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple, Union
+
+from .settings import (
+    API_KEY_WEIGHTS,
+    FAIR_QUEUE_MAX_PER_CLIENT,
+    FAIR_QUEUE_SLOTS,
+    LLM_URLS,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_PER_MINUTE,
+    TRUSTED_PROXIES,
+)
+
+# Carriles del planificador: interactivo siempre antes que batch
+LANES = ("interactive", "batch")
+
+# Clientes recordados (buckets y métricas); los menos recientes se olvidan
+MAX_CLIENTS = 10000
+
+
+def parse_weights(spec: str) -> Dict[str, int]:
+    """'clave1:3,clave2:1' -> {'clave1': 3, 'clave2': 1}; entradas mal formadas se ignoran."""
+    weights: Dict[str, int] = {}
+    for item in spec.split(","):
+        key, _, weight = item.strip().rpartition(":")
+        if key and weight.isdigit() and int(weight) > 0:
+            weights[key] = int(weight)
+    return weights
+
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_networks(spec: str) -> List[Network]:
+    """'10.0.0.0/8,172.17.0.1' -> redes; entradas mal formadas se ignoran."""
+    networks: List[Network] = []
+    for item in spec.split(","):
+        try:
+            networks.append(ipaddress.ip_network(item.strip(), strict=False))
+        except ValueError:
+            pass
+    return networks
+
+
+TRUSTED_PROXY_NETWORKS = parse_networks(TRUSTED_PROXIES)
+
+
+def _trusted(ip: str, networks: List[Network]) -> bool:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in networks)
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str], networks: List[Network] = TRUSTED_PROXY_NETWORKS) -> Optional[str]:
+    """IP del cliente: la del socket o, si viene de un proxy de confianza, la de X-Forwarded-For.
+
+    Se recorre X-Forwarded-For de derecha a izquierda saltando proxies de confianza: la primera
+    dirección que no lo es la agregó un proxy propio y no se puede falsificar desde fuera.
+    """
+    if not peer or not forwarded_for or not _trusted(peer, networks):
+        return peer
+    hops = [h.strip() for h in forwarded_for.split(",") if h.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop, networks):
+            return hop
+    return hops[0] if hops else peer
+
+
+@dataclass
+class Client:
+    """Identidad de quien llama: API key configurada (X-API-Key) o, si no, la IP."""
+
+    id: str
+    label: str
+    weight: int
+    lane: str
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float) -> None:
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> Tuple[bool, float]:
+        """(admitido, segundos hasta el próximo token si no)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+
+def _new_usage() -> Dict[str, Any]:
+    return {"requests": 0, "rejected_rate": 0, "rejected_queue": 0, "llm_requests": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+
+class FairScheduler:
+    """Limita las peticiones simultáneas al LLM y reparte los turnos entre clientes.
+
+    - Un token bucket por cliente rechaza (429) antes de hacer cualquier trabajo
+    - Las peticiones que esperan turno se encolan por cliente; al liberarse un slot se elige
+      cliente por round-robin ponderado (smooth WRR) y el carril interactivo va antes que batch
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        rate_per_minute: float = RATE_LIMIT_PER_MINUTE,
+        burst: int = RATE_LIMIT_BURST,
+        max_queued_per_client: int = FAIR_QUEUE_MAX_PER_CLIENT,
+        weights: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.slots = slots
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_queued_per_client = max_queued_per_client
+        self.weights = weights or {}
+        self.active = 0
+        self._queues: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {lane: OrderedDict() for lane in LANES}
+        self._credit: Dict[str, int] = {}
+        self._weight: Dict[str, int] = {}
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.usage: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._labels: Dict[str, str] = {}
+
+    def client(self, api_key: Optional[str], ip: Optional[str], priority: Optional[str] = None) -> Client:
+        lane = "batch" if (priority or "").strip().lower() == "batch" else "interactive"
+        # Solo las claves de API_KEY_WEIGHTS identifican: con claves inventadas en cada petición
+        # se obtendría un bucket nuevo cada vez y se desalojaría a los clientes reales del LRU
+        if api_key and api_key in self.weights:
+            # En métricas solo se muestra el inicio de la clave
+            return Client(f"key:{api_key}", f"key:{api_key[:4]}…", self.weights[api_key], lane)
+        return Client(f"ip:{ip or 'desconocida'}", f"ip:{ip or 'desconocida'}", 1, lane)
+
+    def _usage(self, client: Client) -> Dict[str, Any]:
+        usage = self.usage.get(client.id)
+        if usage is None:
+            usage = self.usage[client.id] = _new_usage()
+            self._labels[client.id] = client.label
+            if len(self.usage) > MAX_CLIENTS:
+                old, _ = self.usage.popitem(last=False)
+                self._labels.pop(old, None)
+        else:
+            self.usage.move_to_end(client.id)
+        return usage
+
+    def _queued(self, client_id: str) -> int:
+        return sum(len(q.get(client_id, ())) for q in self._queues.values())
+
+    def admit(self, client: Client) -> Tuple[bool, float]:
+        """Decide antes de cualquier trabajo: (admitido, Retry-After en segundos)."""
+        usage = self._usage(client)
+        usage["requests"] += 1
+        if self.rate_per_minute > 0:
+            bucket = self._buckets.get(client.id)
+            if bucket is None:
+                bucket = self._buckets[client.id] = TokenBucket(self.rate_per_minute / 60.0, max(1, self.burst))
+                if len(self._buckets) > MAX_CLIENTS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client.id)
+            ok, retry_after = bucket.take(time.monotonic())
+            if not ok:
+                usage["rejected_rate"] += 1
+                return False, retry_after
+        if self.max_queued_per_client > 0 and self._queued(client.id) >= self.max_queued_per_client:
+            usage["rejected_queue"] += 1
+            return False, 1.0
+        return True, 0.0
+
+    def waiting(self) -> int:
+        return sum(len(q) for lane in self._queues.values() for q in lane.values())
+
+    def _next(self) -> Optional[asyncio.Future]:
+        for lane in LANES:
+            queues = self._queues[lane]
+            while queues:
+                # Smooth weighted round-robin entre los clientes con peticiones en este carril
+                total = 0
+                best: Optional[str] = None
+                for cid in queues:
+                    w = self._weight.get(cid, 1)
+                    self._credit[cid] = self._credit.get(cid, 0) + w
+                    total += w
+                    if best is None or self._credit[cid] > self._credit[best]:
+                        best = cid
+                assert best is not None
+                self._credit[best] -= total
+                queue = queues[best]
+                fut = queue.popleft()
+                if not queue:
+                    del queues[best]
+                    self._credit.pop(best, None)
+                    if not self._queued(best):
+                        self._weight.pop(best, None)
+                if not fut.done():
+                    return fut
+        return None
+
+    def _dispatch(self) -> None:
+        while self.active < self.slots:
+            fut = self._next()
+            if fut is None:
+                return
+            self.active += 1
+            fut.set_result(None)
+
+    async def acquire(self, client: Client) -> None:
+        started = time.monotonic()
+        if self.active < self.slots and not self.waiting():
+            self.active += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            self._weight[client.id] = client.weight
+            self._queues[client.lane].setdefault(client.id, deque()).append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self.release()  # el turno llegó justo al cancelar: devolverlo
+                else:
+                    fut.cancel()
+                    queues = self._queues[client.lane]
+                    if fut in queues.get(client.id, ()):
+                        queues[client.id].remove(fut)
+                        if not queues[client.id]:
+                            del queues[client.id]
+                            self._credit.pop(client.id, None)
+                            if not self._queued(client.id):
+                                self._weight.pop(client.id, None)
+                raise
+        usage = self._usage(client)
+        waited = time.monotonic() - started
+        usage["llm_requests"] += 1
+        usage["wait_seconds"] += waited
+        usage["max_wait_seconds"] = max(usage["max_wait_seconds"], waited)
+
+    def release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, client: Client) -> AsyncIterator[None]:
+        await self.acquire(client)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        clients = {}
+        for cid, u in self.usage.items():
+            clients[self._labels.get(cid, cid)] = {
+                **u,
+                "wait_seconds": round(u["wait_seconds"], 3),
+                "max_wait_seconds": round(u["max_wait_seconds"], 3),
+                "avg_wait_ms": round(1000 * u["wait_seconds"] / u["llm_requests"], 1) if u["llm_requests"] else None,
+                "queued": self._queued(cid),
+            }
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "waiting": {lane: sum(len(q) for q in self._queues[lane].values()) for lane in LANES},
+            "rate_limit_per_minute": self.rate_per_minute,
+            "burst": self.burst,
+            "clients": clients,
+        }
+
+
+fair_queue = FairScheduler(FAIR_QUEUE_SLOTS or len(LLM_URLS), weights=parse_weights(API_KEY_WEIGHTS))
@@ -0,0 +1,167 @@
+"""Throughput de /ask según el número de workers de uvicorn.
+
+Levanta la API con 1..N workers, la satura con peticiones concurrentes y reporta peticiones/s
+y latencias. El LLM apunta a un puerto cerrado con el circuito abierto tras el primer fallo, así
+que cada petición hace todo el trabajo de SQLite/Python (estadísticas + búsqueda) y responde en
+modo degradado: se mide la parte que un solo proceso no puede repartir entre núcleos.
+
+    python -m app.bench --workers 1 2 4 --requests 2000 --concurrency 32
+
+Con `--rows N` la base se arma antes con el ETL sobre un dataset sintético de N filas
+(etl/extract/synthetic_dataset.py, misma semilla = mismos datos); sin él se usa DB_PATH.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+QUESTIONS = [
+    "¿Cuántos reportes urgentes hay en Cali?",
+    "¿Qué ciudad tiene más reportes de salud?",
+    "¿Cuáles son los principales problemas en Medellín el año pasado?",
+    "¿Cuántos registros hay de educación en 2023?",
+    "¿En qué mes hubo más reportes de seguridad?",
+    "falta de agua potable en zonas rurales",
+    "¿Qué categoría tiene más reportes urgentes en Bogotá?",
+    "problemas de transporte en el segundo trimestre de 2024",
+]
+
+
+def build_synthetic_db(rows: int, seed: int, directory: str) -> str:
+    """Dataset sintético -> ETL (limpieza, clústeres, SQLite) en `directory`; devuelve la ruta de la base."""
+    from etl.extract.dataset import read_dataset
+    from etl.extract.synthetic_dataset import write_dataset
+    from etl.load.store_sqlite import build_sqlite_db
+    from etl.transform.clean_dataset import transform_dataset
+
+    csv_path = write_dataset(os.path.join(directory, "synthetic.csv"), rows, seed)
+    return build_sqlite_db(transform_dataset(read_dataset(csv_path)), os.path.join(directory, "reports.sqlite"))
+
+
+def _server_env(cache: bool, cache_path: str, db_path: Optional[str] = None) -> Dict[str, str]:
+    env = dict(os.environ)
+    if db_path:
+        env["DB_PATH"] = db_path
+    env.update(
+        {
+            "WARMUP_ENABLED": "0",
+            "LLM_URLS": "http://127.0.0.1:9",
+            "LLM_HEALTH_INTERVAL_SECONDS": "0",
+            "LLM_EJECT_FAILURES": "1",
+            "LLM_EJECT_SECONDS": "3600",
+            # Toda la carga sale de una IP: sin límite por cliente
+            "RATE_LIMIT_PER_MINUTE": "0",
+            "FAIR_QUEUE_MAX_PER_CLIENT": "0",
+            "QUERY_CACHE_MAX_BYTES": env.get("QUERY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)) if cache else "0",
+            "CACHE_PATH": cache_path if cache else "",
+        }
+    )
+    return env
+
+
+async def _wait_ready(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/status")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"La API no arrancó en {timeout:.0f}s")
+
+
+async def _load(base_url: str, n_requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(n_requests))
+
+    async def user(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        for i in counter:
+            t0 = time.perf_counter()
+            try:
+                r = await client.post("/ask", json={"texto": QUESTIONS[i % len(QUESTIONS)]})
+                r.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+    }
+
+
+def run(workers: int, n_requests: int, concurrency: int, port: int, cache: bool, db_path: Optional[str] = None) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+        proc = subprocess.Popen(cmd, env=_server_env(cache, os.path.join(tmp, "cache.sqlite"), db_path))
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            asyncio.run(_wait_ready(base_url))
+            # Una ronda corta para abrir el circuito del LLM y cargar conexiones en cada worker
+            asyncio.run(_load(base_url, 4 * workers * len(QUESTIONS), concurrency))
+            result = asyncio.run(_load(base_url, n_requests, concurrency))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    result["workers"] = workers
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput de /ask por número de workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--cache", action="store_true", help="Activa la caché de consultas compartida (CACHE_PATH temporal)")
+    parser.add_argument("--rows", type=int, default=0, help="Filas del dataset sintético (0 = usar DB_PATH)")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla del dataset sintético")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        db_path = None
+        if args.rows:
+            started = time.perf_counter()
+            db_path = build_synthetic_db(args.rows, args.seed, data_dir)
+            print(f"Base sintética: {args.rows} filas (semilla {args.seed}) en {time.perf_counter() - started:.1f}s")
+
+        print(f"CPUs: {os.cpu_count()}  peticiones: {args.requests}  concurrencia: {args.concurrency}  caché: {args.cache}")
+        print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errores':>8}")
+        base_rps = None
+        for w in args.workers:
+            r = run(w, args.requests, args.concurrency, args.port, args.cache, db_path)
+            base_rps = base_rps or r["rps"]
+            speedup = r["rps"] / base_rps if base_rps else 0.0
+            print(f"{w:>7} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['errors']:>8}   x{speedup:.2f}")
+
+
+if __name__ == "__main__":
+    main()
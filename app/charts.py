@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import io
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .retrieval import count_reports_by_category, count_reports_by_city, monthly_counts
+from .settings import CACHE_PATH, CHART_CACHE_SIZE, CHART_WORKERS, QUERY_CACHE_MAX_BYTES
+from .shared_cache import SharedCache
+
+# tipo de gráfica -> (función de agregados de retrieval, clave de etiqueta, título, estilo)
+CHART_KINDS = {
+    "mensual": (monthly_counts, "mes", "Reportes por mes", "line"),
+    "ciudades": (count_reports_by_city, "ciudad", "Reportes por ciudad", "bar"),
+    "categorias": (count_reports_by_category, "categoria", "Reportes por categoría", "bar"),
+}
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+def chart_series(kind: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Serie lista para graficar (también es la respuesta JSON para clientes que dibujan por su cuenta)."""
+    fn, label_key, title, style = CHART_KINDS[kind]
+    rows = fn(filters or None)
+    return {
+        "kind": kind,
+        "title": title,
+        "style": style,
+        "filters": filters or {},
+        "x": [r[label_key] for r in rows],
+        "y": [int(r["count"]) for r in rows],
+    }
+
+
+def render_chart(series: Dict[str, Any], fmt: str = "png") -> bytes:
+    """Dibuja la serie y devuelve los bytes del archivo. Corre en un proceso del pool."""
+    # Importación diferida: matplotlib solo se carga en los procesos que dibujan
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 4))
+    ax = fig.add_subplot()
+    if series["style"] == "line":
+        ax.plot(series["x"], series["y"], color="tab:orange", marker="o")
+    else:
+        ax.bar(series["x"], series["y"], color="tab:blue")
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.set_title(series["title"])
+    ax.set_ylabel("# reportes")
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=100)
+    return buf.getvalue()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def render_pool() -> ProcessPoolExecutor:
+    """Pool de procesos compartido para dibujar (se crea al primer uso)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: no heredar hilos ni sockets del servidor
+            _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_render_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+CacheKey = Tuple[str, str, Tuple[Tuple[str, str], ...], Tuple[int, ...]]
+
+
+class ChartCache:
+    """LRU de gráficas ya calculadas, indexada por tipo + formato + filtros + versión de datos.
+
+    Con `shared` las entradas viven en el archivo de caché común a todos los workers.
+    """
+
+    def __init__(self, max_entries: int = CHART_CACHE_SIZE, shared: Optional[SharedCache] = None) -> None:
+        self.max_entries = max_entries
+        self.shared = shared
+        self._data: "OrderedDict[CacheKey, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(kind: str, fmt: str, filters: Dict[str, Any], version: Tuple[int, ...]) -> CacheKey:
+        norm = tuple(sorted((k, str(v)) for k, v in filters.items() if v is not None and v != ""))
+        return kind, fmt, norm, version
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        if self.shared is not None:
+            hit, value = self.shared.get(("chart",) + key[:3], key[3])
+            with self._lock:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return value
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: CacheKey, value: Any) -> None:
+        if self.shared is not None:
+            self.shared.put(("chart",) + key[:3], key[3], value, 0.0)
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        if self.shared is not None:
+            return self.shared.stats()
+        with self._lock:
+            return {"entries": len(self._data), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+chart_cache = ChartCache(shared=SharedCache(CACHE_PATH, "charts", QUERY_CACHE_MAX_BYTES) if CACHE_PATH else None)
+
+
+def chart_filters(**params: Any) -> Dict[str, Any]:
+    """Quita parámetros vacíos para obtener el diccionario de filtros de retrieval._apply_filters."""
+    return {k: v for k, v in params.items() if v is not None and v != ""}
+
+
+def describe_kinds() -> List[Dict[str, str]]:
+    return [{"kind": k, "title": v[2], "style": v[3]} for k, v in CHART_KINDS.items()]
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import calendar
+import re
+import unicodedata
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+# Rango semiabierto [desde, antes): `antes` es el primer día que YA NO se incluye.
+DateRange = Tuple[date, date]
+
+MONTHS_ES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4,
+    "mayo": 5, "junio": 6, "julio": 7, "agosto": 8,
+    "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+
+NUMBERS_ES = {
+    "un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6,
+    "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11, "doce": 12,
+}
+
+_ORDINALS_ES = {"primer": 1, "primero": 1, "segundo": 2, "tercer": 3, "tercero": 3, "cuarto": 4}
+
+_MONTH_RE = "|".join(MONTHS_ES)
+_YEAR_RE = r"(?:19|20)\d{2}"
+
+_RE_DAY = re.compile(rf"\b({_YEAR_RE})-(\d{{1,2}})-(\d{{1,2}})\b")
+_RE_YEAR_MONTH = re.compile(rf"\b({_YEAR_RE})-(\d{{1,2}})\b")
+_RE_MONTH_YEAR = re.compile(rf"\b({_MONTH_RE})\b(?:\s+(?:de|del))?\s+({_YEAR_RE})\b")
+_RE_QUARTER_YEAR = re.compile(rf"\b(primer|primero|segundo|tercer|tercero|cuarto)\s+trimestre\b(?:\s+(?:de|del))?\s+({_YEAR_RE})\b")
+_RE_LAST_N = re.compile(r"\b(?:ultim[oa]s|pasad[oa]s)\s+(\d+|" + "|".join(NUMBERS_ES) + r")\s+(dias|semanas|meses|anos)\b")
+_RE_YEAR = re.compile(rf"\b({_YEAR_RE})\b")
+
+# Expresiones relativas sin número, compiladas una vez (en orden de prioridad)
+_RE_TODAY = re.compile(r"\bhoy\b")
+_RE_YESTERDAY = re.compile(r"\bayer\b")
+_RE_THIS_WEEK = re.compile(r"\besta semana\b")
+_RE_LAST_WEEK = re.compile(r"\b(?:la )?semana (?:pasada|anterior)\b|\bultima semana\b")
+_RE_THIS_MONTH = re.compile(r"\beste mes\b")
+_RE_LAST_MONTH = re.compile(r"\bmes (?:pasado|anterior)\b|\bultimo mes\b")
+_RE_THIS_QUARTER = re.compile(r"\beste trimestre\b")
+_RE_LAST_QUARTER = re.compile(r"\b(?:ultimo trimestre|trimestre (?:pasado|anterior))\b")
+_RE_THIS_YEAR = re.compile(r"\beste ano\b")
+_RE_LAST_YEAR = re.compile(r"\b(?:ano (?:pasado|anterior)|ultimo ano)\b")
+
+
+def _strip_accents(s: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+def add_months(d: date, months: int) -> date:
+    """Suma meses conservando el día cuando existe (31-ene + 1 mes -> 28/29-feb)."""
+    idx = d.year * 12 + (d.month - 1) + months
+    year, month = divmod(idx, 12)
+    month += 1
+    return date(year, month, min(d.day, calendar.monthrange(year, month)[1]))
+
+
+def month_range(year: int, month: int) -> DateRange:
+    start = date(year, month, 1)
+    return start, add_months(start, 1)
+
+
+def quarter_range(year: int, quarter: int) -> DateRange:
+    start = date(year, 3 * (quarter - 1) + 1, 1)
+    return start, add_months(start, 3)
+
+
+def year_range(first_year: int, last_year: Optional[int] = None) -> DateRange:
+    return date(first_year, 1, 1), date((last_year or first_year) + 1, 1, 1)
+
+
+def _relative_range(q: str, today: date) -> Optional[DateRange]:
+    tomorrow = today + timedelta(days=1)
+    if (m := _RE_LAST_N.search(q)):
+        n = int(m.group(1)) if m.group(1).isdigit() else NUMBERS_ES[m.group(1)]
+        unit = m.group(2)
+        try:
+            if unit == "dias":
+                return today - timedelta(days=n - 1), tomorrow
+            if unit == "semanas":
+                return today - timedelta(weeks=n), tomorrow
+            if unit == "meses":
+                return add_months(today, -n), tomorrow
+            return add_months(today, -12 * n), tomorrow
+        except (OverflowError, ValueError):
+            # "últimos 5000 años" cae antes del año 1: la pregunta queda sin rango de fechas
+            return None
+    if _RE_TODAY.search(q):
+        return today, tomorrow
+    if _RE_YESTERDAY.search(q):
+        return today - timedelta(days=1), today
+    week_start = today - timedelta(days=today.weekday())
+    if _RE_THIS_WEEK.search(q):
+        return week_start, week_start + timedelta(weeks=1)
+    if _RE_LAST_WEEK.search(q):
+        return week_start - timedelta(weeks=1), week_start
+    if _RE_THIS_MONTH.search(q):
+        return month_range(today.year, today.month)
+    if _RE_LAST_MONTH.search(q):
+        prev = add_months(today.replace(day=1), -1)
+        return month_range(prev.year, prev.month)
+    current_q = (today.month - 1) // 3 + 1
+    if _RE_THIS_QUARTER.search(q):
+        return quarter_range(today.year, current_q)
+    if _RE_LAST_QUARTER.search(q):
+        # Último trimestre calendario completo
+        start = add_months(quarter_range(today.year, current_q)[0], -3)
+        return start, add_months(start, 3)
+    if _RE_THIS_YEAR.search(q):
+        return year_range(today.year)
+    if _RE_LAST_YEAR.search(q):
+        return year_range(today.year - 1)
+    return None
+
+
+def parse_date_range(question: str, today: Optional[date] = None) -> Optional[DateRange]:
+    """Interpreta la expresión temporal de una pregunta como rango semiabierto [desde, antes).
+
+    Soporta fechas exactas (YYYY-MM-DD), meses (YYYY-MM, "marzo de 2023"), trimestres
+    ("segundo trimestre de 2023"), años o rangos de años ("2022 y 2023") y expresiones
+    relativas a `today` ("el año pasado", "último trimestre", "últimos 3 meses", "este mes").
+    """
+    return parse_normalized_range(_strip_accents(question.lower()), today)
+
+
+def parse_normalized_range(q: str, today: Optional[date] = None) -> Optional[DateRange]:
+    """Igual que parse_date_range para un texto ya en minúsculas y sin tildes (ver app/intent.py)."""
+    if (m := _RE_DAY.search(q)):
+        try:
+            d = date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+            return d, d + timedelta(days=1)
+        except ValueError:
+            pass
+    if (m := _RE_YEAR_MONTH.search(q)) and 1 <= int(m.group(2)) <= 12:
+        return month_range(int(m.group(1)), int(m.group(2)))
+    if (m := _RE_MONTH_YEAR.search(q)):
+        return month_range(int(m.group(2)), MONTHS_ES[m.group(1)])
+    if (m := _RE_QUARTER_YEAR.search(q)):
+        return quarter_range(int(m.group(2)), _ORDINALS_ES[m.group(1)])
+    if (rel := _relative_range(q, today or date.today())):
+        return rel
+    years = _RE_YEAR.findall(q)
+    if years:
+        y1, y2 = sorted((int(years[0]), int(years[-1])))
+        return year_range(y1, y2)
+    return None
+
+
+def range_to_filters(rng: Optional[DateRange]) -> Dict[str, str]:
+    """Convierte el rango a las claves de filtro de retrieval (fecha_desde inclusiva, fecha_antes exclusiva)."""
+    if not rng:
+        return {}
+    start, end = rng
+    return {"fecha_desde": start.isoformat(), "fecha_antes": end.isoformat()}
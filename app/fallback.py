@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import Dict, List
+
+# Motivo -> explicación mostrada al usuario
+REASONS = {
+    "deadline": "el modelo no alcanzaría a responder dentro del tiempo objetivo",
+    "queue": "el modelo tiene demasiadas consultas en espera",
+    "timeout": "el modelo tardó demasiado en responder",
+    "unavailable": "el modelo no está disponible en este momento",
+    "error": "no se pudo contactar el modelo",
+}
+
+FALLBACK_CONTEXTS = 3
+COMMENT_CHARS = 200
+
+# Respuestas degradadas por motivo desde el arranque
+fallback_counts: Counter = Counter()
+
+
+def _render_context(c: Dict) -> str:
+    comment = str(c.get("comentario") or "").strip()
+    if len(comment) > COMMENT_CHARS:
+        comment = comment[:COMMENT_CHARS].rstrip() + "…"
+    urgent = " (urgente)" if str(c.get("urgente")) in ("1", "True", "true") else ""
+    similar = f" [{c['cluster_size']} reportes similares]" if (c.get("cluster_size") or 1) > 1 else ""
+    return f"- #{c['id']} {c['fecha_reporte']}, {c['ciudad']}, {c['categoria_problema']}{urgent}{similar}: {comment}"
+
+
+def fallback_answer(stats_lines: List[str], contexts: List[Dict], reason: str) -> str:
+    """Respuesta sin LLM armada con las estadísticas y los reportes ya recuperados para la pregunta."""
+    fallback_counts[reason] += 1
+    parts = [f"Respuesta generada directamente desde los datos porque {REASONS.get(reason, REASONS['error'])}."]
+    if stats_lines:
+        parts.append("Estadísticas:\n" + "\n".join(f"- {line}" for line in stats_lines))
+    if contexts:
+        parts.append("Reportes relacionados:\n" + "\n".join(_render_context(c) for c in contexts[:FALLBACK_CONTEXTS]))
+    else:
+        parts.append("No se encontraron reportes relacionados con la pregunta.")
+    return "\n\n".join(parts)
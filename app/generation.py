@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List
+
+from .settings import (
+    LLM_CTX_TOKENS,
+    N_PREDICT,
+    N_PREDICT_MAX,
+    N_PREDICT_NUMERIC,
+    N_PREDICT_SUMMARY,
+    TEMPERATURE,
+    TOP_K,
+    TOP_P,
+)
+
+# Cortes comunes: el modelo a veces repite los encabezados del prompt tras responder
+BASE_STOP = ["\nPregunta:", "\nContexto:", "\nEstadísticas agregadas:", "[INST]", "</s>"]
+
+# Aproximación conservadora de tokens por carácter para español con el tokenizador de Mistral
+CHARS_PER_TOKEN = 3.5
+
+
+@dataclass
+class GenerationParams:
+    intent: str
+    n_predict: int
+    temperature: float
+    top_k: int
+    top_p: float
+    stop: List[str] = field(default_factory=list)
+    # Recorta la respuesta al primer párrafo con contenido (ver finish)
+    first_paragraph: bool = False
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            "n_predict": self.n_predict,
+            "temperature": self.temperature,
+            "top_k": self.top_k,
+            "top_p": self.top_p,
+            "stop": self.stop,
+        }
+
+    def finish(self, text: str) -> str:
+        """Texto final de la respuesta: sin líneas en blanco iniciales y, si corresponde, solo el primer párrafo."""
+        text = text.strip()
+        if self.first_paragraph:
+            text = text.split("\n\n", 1)[0].rstrip()
+        return text
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def choose_params(intent: str, prompt: str, n_contexts: int = 0) -> GenerationParams:
+    """Presupuesto y muestreo según la intención y el tamaño del contexto empaquetado."""
+    if intent == "numeric":
+        # Respuesta corta y determinista; un salto de párrafo ya indica que terminó. No va como stop:
+        # muchas plantillas de chat empiezan la respuesta con una línea en blanco y cortaría en 0 tokens
+        n_predict = N_PREDICT_NUMERIC
+        temperature = min(TEMPERATURE, 0.1)
+        stop = list(BASE_STOP)
+        first_paragraph = True
+    elif intent == "summary":
+        # Más evidencia -> más que resumir: crece con el número de contextos
+        n_predict = N_PREDICT_SUMMARY + 16 * n_contexts
+        temperature = TEMPERATURE
+        stop = list(BASE_STOP)
+        first_paragraph = False
+    else:
+        n_predict = N_PREDICT + 8 * n_contexts
+        temperature = TEMPERATURE
+        stop = list(BASE_STOP)
+        first_paragraph = False
+
+    # Nunca pedir más de lo que cabe en la ventana de contexto del servidor
+    room = LLM_CTX_TOKENS - estimate_tokens(prompt)
+    n_predict = max(16, min(n_predict, N_PREDICT_MAX, room))
+    return GenerationParams(
+        intent=intent, n_predict=n_predict, temperature=temperature, top_k=TOP_K, top_p=TOP_P, stop=stop,
+        first_paragraph=first_paragraph,
+    )
+
+
+class GenerationStats:
+    """Registro acotado de tokens generados vs. presupuesto y velocidad por petición, para ajustar la política."""
+
+    def __init__(self, max_records: int = 1000) -> None:
+        self._records: Deque[Dict[str, Any]] = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, params: GenerationParams, response: Dict[str, Any], elapsed_seconds: float) -> Dict[str, Any]:
+        timings = response.get("timings") or {}
+        tokens = int(response.get("tokens_predicted") or timings.get("predicted_n") or 0)
+        tps = timings.get("predicted_per_second")
+        if tps is None and tokens and elapsed_seconds > 0:
+            tps = tokens / elapsed_seconds
+        rec = {
+            "intent": params.intent,
+            "budget": params.n_predict,
+            "tokens": tokens,
+            "hit_limit": bool(response.get("stopped_limit")) or response.get("stop_type") == "limit" or tokens >= params.n_predict,
+            "tokens_per_second": round(float(tps), 2) if tps else None,
+            "prompt_tokens": response.get("tokens_evaluated"),
+            "elapsed_seconds": round(elapsed_seconds, 3),
+        }
+        with self._lock:
+            self._records.append(rec)
+        return rec
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            records = list(self._records)
+        by_intent: Dict[str, Dict[str, Any]] = {}
+        for intent in sorted({r["intent"] for r in records}):
+            rs = [r for r in records if r["intent"] == intent]
+            speeds = sorted(r["tokens_per_second"] for r in rs if r["tokens_per_second"])
+            by_intent[intent] = {
+                "requests": len(rs),
+                "avg_tokens": round(sum(r["tokens"] for r in rs) / len(rs), 1),
+                "avg_budget": round(sum(r["budget"] for r in rs) / len(rs), 1),
+                "budget_use": round(sum(r["tokens"] / r["budget"] for r in rs) / len(rs), 3),
+                "hit_limit_rate": round(sum(1 for r in rs if r["hit_limit"]) / len(rs), 3),
+                "p50_tokens_per_second": speeds[len(speeds) // 2] if speeds else None,
+            }
+        return {"requests": len(records), "by_intent": by_intent, "recent": records[-20:]}
+
+
+generation_stats = GenerationStats()
@@ -0,0 +1,441 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado entre procesos
+    fcntl = None  # type: ignore[assignment]
+from typing import IO, Any, Deque, Dict, List, Optional, Tuple
+
+from etl.transform.minhash import VariantIndex
+from etl.transform.rules import SIMILARITY_THRESHOLD, normalize_comment
+
+from .settings import DB_PATH, INGEST_FLUSH_MS, INGEST_FLUSH_ROWS, INGEST_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+# Columna de texto -> (tabla de dimensión, columna en report_facts), igual que etl/load/store_sqlite.py
+DIMENSIONS = {
+    "ciudad": ("ciudades", "ciudad_id"),
+    "categoria_problema": ("categorias", "categoria_id"),
+    "genero": ("generos", "genero_id"),
+    "nivel_urgencia": ("niveles_urgencia", "nivel_urgencia_id"),
+}
+
+FACT_COLUMNS = (
+    "id", "nombre", "edad", "genero_id", "ciudad_id", "comentario", "categoria_id", "nivel_urgencia_id",
+    "urgente", "fecha_dia", "mes", "acceso_internet", "atencion_previa_gobierno", "zona_rural",
+)
+
+# Textos de comentario recientes -> grupo (se vacía al llenarse)
+TEXT_CACHE_SIZE = 100_000
+
+
+class IngestBusy(Exception):
+    """Hay demasiadas filas esperando escritura: el cliente debe reintentar."""
+
+
+class IngestUnavailable(Exception):
+    pass
+
+
+class IngestConflict(Exception):
+    """Algún id explícito de la petición ya existe (reporte o clúster)."""
+
+    def __init__(self, ids: List[int]) -> None:
+        super().__init__(f"Ya existen los ids {ids}")
+        self.ids = ids
+
+
+class ReportWriter:
+    """Escritor único de reportes en vivo con commits agrupados.
+
+    Las peticiones dejan filas ya validadas en memoria y esperan su confirmación. Una tarea junta
+    lo pendiente hasta `flush_rows` filas o `flush_seconds` de espera y lo escribe en una sola
+    transacción desde un hilo, con su propia conexión de escritura. Con WAL los lectores siguen
+    leyendo su snapshot sin bloquearse. Los triggers de la base mantienen los agregados mensuales
+    y los tamaños de clúster; la caché de consultas se invalida sola porque cambia la versión de
+    la base (ver retrieval.cache_version).
+    """
+
+    def __init__(
+        self,
+        path: str = DB_PATH,
+        flush_rows: int = INGEST_FLUSH_ROWS,
+        flush_seconds: float = INGEST_FLUSH_MS / 1000.0,
+        max_pending: int = INGEST_MAX_PENDING,
+    ) -> None:
+        self.path = path
+        self.flush_rows = max(1, flush_rows)
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._pending: Deque[Tuple[List[Dict[str, Any]], asyncio.Future, float]] = deque()
+        self._pending_rows = 0
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._lock_file: Optional[IO[str]] = None
+        # Solo se usan desde el hilo de escritura (una transacción a la vez)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._inode = 0
+        self._clustered = False
+        self._has_fts = False
+        self._dims: Dict[str, Dict[str, int]] = {}
+        self._variants: Dict[str, int] = {}
+        # Variantes conocidas por buckets LSH: un texto nuevo solo se compara con las de su bucket
+        self._variant_index = VariantIndex()
+        self._next_grupo = 1
+        self._text_grupo: Dict[str, int] = {}
+        self._cluster_texts: Dict[Tuple[int, str], int] = {}
+        self._clusters: Dict[Tuple[int, int, int], int] = {}
+        # Entradas de caché agregadas por la petición en curso: se olvidan si se deshace (ver _write)
+        self._undo: List[Tuple[Dict[Any, Any], Any]] = []
+        self._undo_variants: List[str] = []
+        self.counters = {"rows": 0, "batches": 0, "rejected_busy": 0, "errors": 0, "new_clusters": 0}
+        self._commit_ms: Deque[float] = deque(maxlen=500)
+        self._batch_rows: Deque[int] = deque(maxlen=500)
+
+    # --- lado asyncio ---
+
+    def start(self) -> None:
+        """Arranca la tarea de escritura; IngestUnavailable si otro proceso ya escribe en la misma base."""
+        if self._task is None:
+            self._acquire_lock()
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    def _acquire_lock(self) -> None:
+        # Un solo escritor por base: con varios workers cada uno tendría el suyo y competirían por
+        # BEGIN IMMEDIATE, sin commits agrupados. El candado se suelta solo si el proceso muere
+        if fcntl is None:
+            return
+        f = open(f"{self.path}.ingest.lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            raise IngestUnavailable(f"Otro proceso ya escribe en {self.path}; la ingesta necesita un solo worker")
+        self._lock_file = f
+
+    def _release_lock(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def stop(self) -> None:
+        """Escribe lo pendiente y termina la tarea."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        self._full.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._release_lock()
+
+    async def submit(self, rows: List[Dict[str, Any]]) -> List[int]:
+        """Encola filas limpias (ver etl.transform.rules.clean_record) y devuelve sus ids al confirmarse."""
+        if self._task is None or self._closing:
+            raise IngestUnavailable("La ingesta no está activa")
+        if self._pending_rows + len(rows) > self.max_pending:
+            self.counters["rejected_busy"] += 1
+            raise IngestBusy(f"{self._pending_rows} filas pendientes de escritura")
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((rows, fut, time.monotonic()))
+        self._pending_rows += len(rows)
+        self._wakeup.set()
+        if self._pending_rows >= self.flush_rows:
+            self._full.set()
+        # shield: si el cliente se desconecta, sus filas igual se escriben
+        return await asyncio.shield(fut)
+
+    def _take_batch(self) -> List[Tuple[List[Dict[str, Any]], asyncio.Future, float]]:
+        batch = [self._pending.popleft()]
+        n = len(batch[0][0])
+        while self._pending and n + len(self._pending[0][0]) <= self.flush_rows:
+            item = self._pending.popleft()
+            batch.append(item)
+            n += len(item[0])
+        self._pending_rows -= n
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # Commit agrupado: espera a que se llene el lote o venza el plazo de la fila más antigua
+            wait = self.flush_seconds - (time.monotonic() - self._pending[0][2])
+            if self._pending_rows < self.flush_rows and wait > 0 and not self._closing:
+                self._full.clear()
+                try:
+                    async with asyncio.timeout(wait):
+                        await self._full.wait()
+                except TimeoutError:
+                    pass
+            batch = self._take_batch()
+            try:
+                results = await asyncio.to_thread(self._write, [item_rows for item_rows, _, _ in batch])
+            except Exception as e:  # noqa: BLE001 - falló la transacción entera: el error se entrega a todo el lote
+                self.counters["errors"] += 1
+                logger.error("Ingesta: fallo al escribir %d filas (%r)", sum(len(r) for r, _, _ in batch), e)
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut, _), result in zip(batch, results):
+                if fut.done():
+                    continue
+                if isinstance(result, Exception):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+    # --- hilo de escritura ---
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # con WAL: durable salvo corte de energía, sin fsync por commit
+        names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        if "report_facts" not in names:
+            conn.close()
+            raise IngestUnavailable("La base no tiene el esquema normalizado (report_facts); vuelve a correr el ETL")
+        self._clustered = "comment_clusters" in names
+        fts_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'report_search'").fetchone()
+        # Con clústeres el índice es por texto distinto de cada clúster; uno anterior (solo representantes) no se toca
+        self._has_fts = fts_sql is not None and (not self._clustered or "cluster_text_search" in (fts_sql[0] or ""))
+        self._load_caches(conn)
+        return conn
+
+    def _load_caches(self, conn: sqlite3.Connection) -> None:
+        self._text_grupo.clear()
+        self._cluster_texts.clear()
+        for table, _ in DIMENSIONS.values():
+            self._dims[table] = dict(conn.execute(f"SELECT nombre, id FROM {table}").fetchall())
+        if self._clustered:
+            self._variants = dict(conn.execute("SELECT clave, grupo FROM comment_variants").fetchall())
+            self._variant_index = VariantIndex()
+            self._variant_index.update(self._variants.items())
+            # Sin índice por grupo, MAX(grupo) recorrería toda la tabla en cada texto nuevo
+            self._next_grupo = max(self._variants.values(), default=0) + 1
+            self._clusters = {
+                (g, c, k): cid for cid, g, c, k in conn.execute("SELECT id, grupo, ciudad_id, categoria_id FROM comment_clusters WHERE grupo IS NOT NULL")
+            }
+
+    def _remember(self, cache: Dict[Any, Any], key: Any, value: Any) -> Any:
+        cache[key] = value
+        self._undo.append((cache, key))
+        return value
+
+    def _forget_request(self) -> None:
+        """Quita de las cachés lo que agregó una petición deshecha con ROLLBACK TO."""
+        for cache, key in reversed(self._undo):
+            cache.pop(key, None)
+        for key in self._undo_variants:
+            self._variant_index.discard(key)
+        self._undo.clear()
+        self._undo_variants.clear()
+
+    def _dim_id(self, conn: sqlite3.Connection, table: str, name: str) -> int:
+        ids = self._dims[table]
+        if name not in ids:
+            conn.execute(f"INSERT OR IGNORE INTO {table} (nombre) VALUES (?)", (name,))
+            self._remember(ids, name, conn.execute(f"SELECT id FROM {table} WHERE nombre = ?", (name,)).fetchone()[0])
+        return ids[name]
+
+    def _grupo(self, conn: sqlite3.Connection, comentario: str) -> int:
+        # El grupo de un texto no cambia una vez asignado: se evita normalizar textos repetidos
+        grupo = self._text_grupo.get(comentario)
+        if grupo is None:
+            if len(self._text_grupo) >= TEXT_CACHE_SIZE:
+                self._text_grupo.clear()
+            grupo = self._remember(self._text_grupo, comentario, self._grupo_of_key(conn, normalize_comment(comentario)))
+        return grupo
+
+    def _grupo_of_key(self, conn: sqlite3.Connection, key: str) -> int:
+        if key not in self._variants:
+            row = conn.execute("SELECT grupo FROM comment_variants WHERE clave = ?", (key,)).fetchone()
+            if row is None:
+                # Texto nuevo: se une al grupo más parecido o abre uno (como el ETL, sin recalcular los demás)
+                best = self._variant_index.best(key)
+                if best[0] >= SIMILARITY_THRESHOLD:
+                    grupo = best[1]
+                else:
+                    # Un grupo de una petición deshecha queda sin usar: los huecos no importan
+                    grupo = self._next_grupo
+                    self._next_grupo += 1
+                conn.execute("INSERT INTO comment_variants (clave, grupo) VALUES (?, ?)", (key, grupo))
+                self._variant_index.add(key, grupo)
+                self._undo_variants.append(key)
+            else:
+                grupo = row[0]
+            self._remember(self._variants, key, grupo)
+        return self._variants[key]
+
+    def _cluster_id(self, conn: sqlite3.Connection, report_id: int, fact: Dict[str, Any], new_clusters: List[int]) -> int:
+        grupo = self._grupo(conn, fact["comentario"])
+        key = (grupo, fact["ciudad_id"], fact["categoria_id"])
+        if key not in self._clusters:
+            # _clusters tiene todos los clústeres con grupo (solo este escritor los crea): si no está, no
+            # existe. Consultarlo en la base recorrería comment_clusters, que no tiene índice por grupo
+            conn.execute(
+                "INSERT INTO comment_clusters (id, grupo, ciudad_id, categoria_id, comentario, size) VALUES (?, ?, ?, ?, ?, 0)",
+                (report_id, grupo, fact["ciudad_id"], fact["categoria_id"], fact["comentario"]),
+            )
+            new_clusters.append(report_id)
+            self._remember(self._clusters, key, report_id)
+        return self._clusters[key]
+
+    def _texto_id(self, conn: sqlite3.Connection, cluster_id: int, fact: Dict[str, Any], fts_rows: List[Tuple[Any, ...]]) -> int:
+        # Cada texto distinto de un clúster entra una vez al índice FTS (ver cluster_texts en el ETL)
+        key = (cluster_id, fact["comentario"])
+        texto_id = self._cluster_texts.get(key)
+        if texto_id is None:
+            if len(self._cluster_texts) >= TEXT_CACHE_SIZE:
+                self._cluster_texts.clear()
+            row = conn.execute("SELECT id FROM cluster_texts WHERE cluster_id = ? AND comentario = ?", key).fetchone()
+            if row is None:
+                texto_id = conn.execute("INSERT INTO cluster_texts (cluster_id, comentario) VALUES (?, ?)", key).lastrowid
+                if self._has_fts:
+                    fts_rows.append((texto_id, fact["comentario"], fact["ciudad"], fact["categoria_problema"]))
+            else:
+                texto_id = row[0]
+            self._remember(self._cluster_texts, key, texto_id)
+        return texto_id
+
+    def _write(self, requests: List[List[Dict[str, Any]]]) -> List[Any]:
+        """Escribe el lote en una transacción; devuelve por petición sus ids o la excepción que la rechazó."""
+        inode = os.stat(self.path).st_ino
+        if self._conn is not None and self._inode != inode:
+            # El ETL publicó una base nueva: se escribe en ella y se recargan las cachés
+            self._conn.close()
+            self._conn = None
+        if self._conn is None:
+            self._conn = self._open()
+            self._inode = inode
+        conn = self._conn
+        started = time.perf_counter()
+        results: List[Any] = []
+        written = 0
+        new_clusters: List[int] = []
+        conn.execute("BEGIN IMMEDIATE")  # toma el candado de escritura ya: los ids se asignan dentro
+        try:
+            # Los clústeres nuevos toman el id de su primer reporte: ninguno de los dos espacios se reutiliza
+            next_id = conn.execute(
+                "SELECT MAX(COALESCE((SELECT MAX(id) FROM report_facts), 0), "
+                + ("COALESCE((SELECT MAX(id) FROM comment_clusters), 0)" if self._clustered else "0")
+                + ") + 1"
+            ).fetchone()[0]
+            for rows in requests:
+                # Cada petición en su savepoint: si falla, solo ella se deshace y el resto del lote se confirma
+                conn.execute("SAVEPOINT request")
+                self._undo.clear()
+                self._undo_variants.clear()
+                request_clusters: List[int] = []
+                try:
+                    ids = self._insert_rows(conn, rows, next_id, request_clusters)
+                except Exception as e:  # noqa: BLE001 - se entrega a la petición que lo causó
+                    conn.execute("ROLLBACK TO request")
+                    conn.execute("RELEASE request")
+                    # Solo se olvida lo que agregó esta petición: recargar todo frenaría al resto del lote
+                    self._forget_request()
+                    self.counters["errors"] += 1
+                    logger.info("Ingesta: petición de %d filas rechazada (%r)", len(rows), e)
+                    results.append(e)
+                    continue
+                conn.execute("RELEASE request")
+                next_id = max([next_id, *(i + 1 for i in ids)])
+                written += len(ids)
+                new_clusters += request_clusters
+                results.append(ids)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            # Las cachés pueden tener filas de la transacción deshecha
+            self._conn = None
+            conn.close()
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.counters["rows"] += written
+        self.counters["batches"] += 1
+        self.counters["new_clusters"] += len(new_clusters)
+        self._commit_ms.append(elapsed_ms)
+        self._batch_rows.append(written)
+        return results
+
+    def _insert_rows(self, conn: sqlite3.Connection, rows: List[Dict[str, Any]], next_id: int, new_clusters: List[int]) -> List[int]:
+        explicit = [row["id"] for row in rows if row.get("id") is not None]
+        if explicit:
+            # Un id explícito nunca pisa un reporte ni un clúster existente
+            marks = ", ".join("?" * len(explicit))
+            sql = f"SELECT id FROM report_facts WHERE id IN ({marks})"
+            if self._clustered:
+                sql += f" UNION SELECT id FROM comment_clusters WHERE id IN ({marks})"
+            taken = sorted(r[0] for r in conn.execute(sql, explicit * (2 if self._clustered else 1)))
+            if taken:
+                raise IngestConflict(taken)
+            next_id = max(next_id, max(explicit) + 1)
+        facts: List[Tuple[Any, ...]] = []
+        fts_rows: List[Tuple[Any, ...]] = []
+        ids: List[int] = []
+        for row in rows:
+            report_id = row.get("id")
+            if report_id is None:
+                report_id = next_id
+                next_id += 1
+            fact = dict(row)
+            fact["id"] = report_id
+            for col, (table, fact_col) in DIMENSIONS.items():
+                fact[fact_col] = self._dim_id(conn, table, row[col])
+            fact["fecha_dia"] = int(row["fecha_reporte"].replace("-", ""))
+            fact["mes"] = fact["fecha_dia"] // 100
+            values = tuple(fact[c] for c in FACT_COLUMNS)
+            if self._clustered:
+                cluster_id = self._cluster_id(conn, report_id, fact, new_clusters)
+                values += (cluster_id, self._texto_id(conn, cluster_id, fact, fts_rows))
+            elif self._has_fts:
+                fts_rows.append((report_id, row["comentario"], row["ciudad"], row["categoria_problema"]))
+            facts.append(values)
+            ids.append(report_id)
+
+        cols = FACT_COLUMNS + (("cluster_id", "texto_id") if self._clustered else ())
+        conn.executemany(
+            f"INSERT INTO report_facts ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", facts
+        )
+        if self._has_fts and fts_rows:
+            conn.executemany(
+                "INSERT INTO report_search (rowid, comentario, ciudad, categoria_problema) VALUES (?, ?, ?, ?)", fts_rows
+            )
+        return ids
+
+    def stats(self) -> Dict[str, Any]:
+        commits = sorted(self._commit_ms)
+        return {
+            "enabled": self._task is not None,
+            "pending_rows": self._pending_rows,
+            "flush_rows": self.flush_rows,
+            "flush_ms": round(self.flush_seconds * 1000, 1),
+            **self.counters,
+            "avg_batch_rows": round(sum(self._batch_rows) / len(self._batch_rows), 1) if self._batch_rows else None,
+            "p50_commit_ms": round(commits[len(commits) // 2], 2) if commits else None,
+            "max_commit_ms": round(commits[-1], 2) if commits else None,
+        }
+
+
+report_writer = ReportWriter()
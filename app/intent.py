@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import re
+import sys
+import time
+import unicodedata
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .dates import NUMBERS_ES, DateRange, parse_normalized_range, range_to_filters
+from .settings import FECHA_REFERENCIA
+
+# Vocabulario de la pregunta, ya en minúsculas y sin tildes
+_TOKEN_RE = re.compile(r"\w+")
+_COUNT_PREFIXES = ("cuant",)
+_COUNT_WORDS = frozenset({"cantidad", "numero", "total"})
+_REPORT_WORDS = frozenset({"registro", "registros", "reporte", "reportes"})
+_MORE_WORDS = frozenset({"mas", "mayor", "mayores"})
+_LESS_WORDS = frozenset({"menos", "menor", "menores"})
+_MONTH_WORDS = frozenset({"mes", "meses", "mensual"})
+# Palabras que hacen de "mes"/"meses" parte de una expresión de fecha
+_DATE_BEFORE_MONTH = frozenset({"este", "ultimo", "ultimos", "pasados"} | set(NUMBERS_ES) | {str(n) for n in range(1, 37)})
+_DATE_AFTER_MONTH = frozenset({"pasado", "anterior", "pasados", "anteriores"})
+_SUMMARY_PREFIXES = ("resum", "principal", "panorama", "describ", "explic", "analiz", "compar", "tendencia")
+# Plurales que admiten "las 3 ciudades ..." (no "meses": "últimos 3 meses" es un rango de fechas)
+_TOP_PLURALS = {"ciudades": "ciudad", "categorias": "categoria"}
+MAX_TOP_N = 10
+
+# Etiquetas de los textos del Contexto por dimensión
+_DIM_LABELS = {
+    "ciudad": ("Ciudad", "ciudad", "ciudades"),
+    "categoria": ("Categoría", "categoría", "categorías"),
+    "mes": ("Mes", "mes", "meses"),
+}
+
+
+def normalize(text: str) -> str:
+    """Minúsculas sin tildes: la forma en que se comparan preguntas, nombres y fechas."""
+    return "".join(c for c in unicodedata.normalize("NFD", text.lower()) if unicodedata.category(c) != "Mn")
+
+
+@dataclass(frozen=True)
+class Intent:
+    """Lo que pide la pregunta, en una sola pasada sobre sus tokens."""
+
+    kind: str  # 'numeric', 'summary' o 'general' (presupuesto de generación, ver generation.py)
+    metric: str  # 'registros' o 'urgentes'
+    count: bool  # pide un total de reportes ("¿cuántos reportes...?")
+    group_by: Tuple[str, ...]  # agrupaciones pedidas: 'ciudad', 'categoria', 'mes'
+    rank: bool  # "más"/"menos": las primeras top_n según order; si no, desglose completo (o pico mensual)
+    order: str  # 'desc' (más) o 'asc' (menos)
+    top_n: int
+    ciudades: Tuple[str, ...]
+    categorias: Tuple[str, ...]
+    date_range: Optional[DateRange]
+
+    @property
+    def urgent(self) -> bool:
+        return self.metric == "urgentes"
+
+    def date_filters(self) -> Dict[str, str]:
+        return range_to_filters(self.date_range)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        out["date_range"] = [d.isoformat() for d in self.date_range] if self.date_range else None
+        return out
+
+
+class Query(NamedTuple):
+    measure: str  # 'registros' | 'urgentes'
+    group: Optional[str]  # None | 'ciudad' | 'categoria' | 'mes'
+    filters: Tuple[Tuple[str, Any], ...]
+
+
+@dataclass(frozen=True)
+class PlanLine:
+    """Una línea de estadísticas del Contexto y las consultas que necesita."""
+
+    kind: str  # 'total' | 'entity' | 'rank' | 'breakdown'
+    dim: Optional[str]
+    name: Optional[str]
+    queries: Tuple[Query, ...]
+    order: str = "desc"
+    top_n: int = 1
+
+
+def _frozen(filters: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple(sorted(filters.items()))
+
+
+class IntentParser:
+    """Interpreta preguntas con los nombres de ciudades y categorías compilados en un índice de tokens."""
+
+    def __init__(self, ciudades: Sequence[str], categorias: Sequence[str]) -> None:
+        self.ciudades = tuple(ciudades)
+        self.categorias = tuple(categorias)
+        # primer token -> [(tokens del nombre, dimensión, nombre)], los más largos primero
+        self._entities: Dict[str, List[Tuple[Tuple[str, ...], str, str]]] = {}
+        for dim, names in (("ciudad", self.ciudades), ("categoria", self.categorias)):
+            for name in names:
+                tokens = tuple(_TOKEN_RE.findall(normalize(name)))
+                if tokens:
+                    self._entities.setdefault(tokens[0], []).append((tokens, dim, name))
+        for candidates in self._entities.values():
+            candidates.sort(key=lambda c: -len(c[0]))
+
+    def parse(self, question: str, today: Optional[date] = None) -> Intent:
+        q = normalize(question.strip())
+        tokens = _TOKEN_RE.findall(q)
+        count = report = more = less = urgent = summary = False
+        groups: List[str] = []
+        by: List[str] = []
+        found: Dict[str, List[str]] = {"ciudad": [], "categoria": []}
+        top_n = 1
+        prev = ""
+        i = 0
+        while i < len(tokens):
+            tok = tokens[i]
+            candidates = self._entities.get(tok)
+            if candidates:
+                match = next((c for c in candidates if tuple(tokens[i:i + len(c[0])]) == c[0]), None)
+                if match is not None:
+                    if match[2] not in found[match[1]]:
+                        found[match[1]].append(match[2])
+                    i += len(match[0])
+                    prev = tokens[i - 1]
+                    continue
+            if tok.startswith(_COUNT_PREFIXES) or tok in _COUNT_WORDS:
+                count = True
+            elif tok in _REPORT_WORDS:
+                report = True
+            elif tok in _MORE_WORDS:
+                more = True
+            elif tok in _LESS_WORDS:
+                less = True
+            elif tok.startswith("urgent"):
+                urgent = True
+            elif tok.startswith(_SUMMARY_PREFIXES):
+                summary = True
+            group = "ciudad" if tok.startswith("ciudad") else "categoria" if tok.startswith("categor") else "mes" if tok in _MONTH_WORDS else None
+            if group == "mes" and (prev in _DATE_BEFORE_MONTH or (i + 1 < len(tokens) and tokens[i + 1] in _DATE_AFTER_MONTH)):
+                group = None  # "este mes", "últimos 3 meses", "el mes pasado": es un rango de fechas (dates.py)
+            if group is not None:
+                if group not in groups:
+                    groups.append(group)
+                # "por ciudad", "cada mes", "mensual": desglose pedido aunque no haya "más"/"menos"
+                if (prev in ("por", "cada") or tok == "mensual") and group not in by:
+                    by.append(group)
+            # "top 3", "las tres ciudades ..."
+            if prev == "top":
+                n = int(tok) if tok.isdigit() else NUMBERS_ES.get(tok)
+                top_n = n or top_n
+            elif tok in _TOP_PLURALS:
+                n = int(prev) if prev.isdigit() else NUMBERS_ES.get(prev)
+                top_n = n or top_n
+            prev = tok
+            i += 1
+
+        rank = more or less
+        group_by = tuple(g for g in groups if rank or g in by)
+        if summary:
+            kind = "summary"
+        elif count or (rank and groups):
+            kind = "numeric"
+        else:
+            kind = "general"
+        return Intent(
+            kind=kind,
+            metric="urgentes" if urgent else "registros",
+            # "el mayor número de reportes" es un ranking, no un total
+            count=count and report and not (rank and groups),
+            group_by=group_by,
+            rank=rank,
+            order="asc" if less and not more else "desc",
+            top_n=max(1, min(top_n, MAX_TOP_N)),
+            ciudades=tuple(found["ciudad"]),
+            categorias=tuple(found["categoria"]),
+            date_range=parse_normalized_range(q, today or _today()),
+        )
+
+
+def _today() -> date:
+    return date.fromisoformat(FECHA_REFERENCIA) if FECHA_REFERENCIA else date.today()
+
+
+def build_plan(intent: Intent) -> Tuple[PlanLine, ...]:
+    """Líneas de estadísticas para la pregunta; cada consulta distinta se ejecuta una sola vez."""
+    dates = intent.date_filters()
+    base = _frozen(dates)
+    lines: List[PlanLine] = []
+
+    # Totales (y urgentes si se pide)
+    if intent.count:
+        queries = (Query("urgentes", None, base),) if intent.urgent else ()
+        lines.append(PlanLine("total", None, None, queries + (Query("registros", None, base),)))
+
+    # Una línea por ciudad o categoría mencionada
+    for dim, names, key in (("ciudad", intent.ciudades, "ciudad"), ("categoria", intent.categorias, "categoria_problema")):
+        for name in names:
+            filters = _frozen({**dates, key: name})
+            queries = (Query("registros", None, filters),)
+            if intent.urgent:
+                queries += (Query("urgentes", None, filters),)
+            lines.append(PlanLine("entity", dim, name, queries))
+
+    # Rankings: dentro de la única ciudad/categoría mencionada, si la hay
+    mentioned = {"ciudad": intent.ciudades, "categoria": intent.categorias}
+    for dim in intent.group_by:
+        if mentioned.get(dim):
+            continue  # ya hay una línea por cada una
+        filters = dict(dates)
+        if len(intent.ciudades) == 1 and dim != "ciudad":
+            filters["ciudad"] = intent.ciudades[0]
+        if len(intent.categorias) == 1 and dim != "categoria":
+            filters["categoria_problema"] = intent.categorias[0]
+        # Sin "más"/"menos" el mes se resume en su pico; ciudades y categorías se listan todas
+        kind = "rank" if intent.rank or dim == "mes" else "breakdown"
+        lines.append(PlanLine(kind, dim, None, (Query(intent.metric, dim, _frozen(filters)),), intent.order, intent.top_n))
+    return tuple(lines)
+
+
+def _query_funcs() -> Dict[Tuple[str, Optional[str]], Callable[[Optional[Dict[str, Any]]], Any]]:
+    from .retrieval import (
+        count_reports,
+        count_reports_by_category,
+        count_reports_by_city,
+        count_urgent_by_category,
+        count_urgent_by_city,
+        count_urgent_reports,
+        monthly_counts,
+    )
+
+    return {
+        ("registros", None): count_reports,
+        ("urgentes", None): count_urgent_reports,
+        ("registros", "ciudad"): count_reports_by_city,
+        ("urgentes", "ciudad"): count_urgent_by_city,
+        ("registros", "categoria"): count_reports_by_category,
+        ("urgentes", "categoria"): count_urgent_by_category,
+        ("registros", "mes"): monthly_counts,
+        ("urgentes", "mes"): lambda f: monthly_counts({**(f or {}), "urgente": True}),
+    }
+
+
+def _ranked(rows: List[Dict[str, Any]], dim: str, order: str, top_n: int) -> List[Tuple[str, int]]:
+    key = {"ciudad": "ciudad", "categoria": "categoria", "mes": "mes"}[dim]
+    pairs = [(str(r[key]), int(r["count"])) for r in rows if r.get(key)]
+    # Empates: el primero en el orden de la consulta (nombre o mes ascendente)
+    pairs = sorted(pairs, key=lambda p: p[1], reverse=order == "desc")
+    return pairs[:top_n]
+
+
+def _render(line: PlanLine, results: Dict[Query, Any]) -> Optional[str]:
+    values = [results[q] for q in line.queries]
+    if line.kind == "total":
+        return "\n".join(
+            f"Total urgentes: {v}" if q.measure == "urgentes" else f"Total registros: {v}" for q, v in zip(line.queries, values)
+        )
+    if line.kind == "entity":
+        label = _DIM_LABELS[line.dim][0]
+        text = f"{label}: {line.name}; registros: {int(values[0])}"
+        if len(values) > 1:
+            text += f"; urgentes: {int(values[1])}"
+        return text
+    measure = line.queries[0].measure
+    label, singular, plural = _DIM_LABELS[line.dim]
+    if line.kind == "breakdown":
+        ranked = _ranked(values[0], line.dim, "desc", len(values[0]))
+        return f"{measure.capitalize()} por {singular}: " + ", ".join(f"{name} ({cnt})" for name, cnt in ranked) if ranked else None
+    ranked = _ranked(values[0], line.dim, line.order, line.top_n)
+    if not ranked:
+        return None
+    items = ", ".join(f"{name} ({cnt})" for name, cnt in ranked)
+    if line.order == "asc":
+        return f"{label} con menos {measure}: {items}" if line.top_n == 1 else f"{line.top_n} {plural} con menos {measure}: {items}"
+    if line.dim == "mes":
+        return f"Mes pico de {measure}: {items}" if line.top_n == 1 else f"Meses pico de {measure}: {items}"
+    return f"Top {singular} por {measure}: {items}" if line.top_n == 1 else f"Top {line.top_n} {plural} por {measure}: {items}"
+
+
+def run_plan(plan: Sequence[PlanLine]) -> List[str]:
+    funcs = _query_funcs()
+    results: Dict[Query, Any] = {}
+    for line in plan:
+        for q in line.queries:
+            if q not in results:
+                results[q] = funcs[(q.measure, q.group)](dict(q.filters) or None)
+    out: List[str] = []
+    for line in plan:
+        text = _render(line, results)
+        if text:
+            out.extend(text.split("\n"))
+    return out
+
+
+_parser_cache: Dict[str, Any] = {"names": None, "parser": None}
+
+
+def intent_parser() -> IntentParser:
+    """Parser con los nombres actuales de la base; se recompila solo si cambian (ver retrieval.entity_names)."""
+    from .retrieval import entity_names
+
+    ciudades, categorias = entity_names()
+    names = (tuple(ciudades), tuple(categorias))
+    if _parser_cache["names"] != names:
+        _parser_cache["parser"] = IntentParser(*names)
+        _parser_cache["names"] = names
+    return _parser_cache["parser"]
+
+
+# --- Corpus de preguntas reales con la interpretación esperada ---
+
+# Fecha y nombres fijos para que el corpus no dependa de la base ni del día en que se corre
+CORPUS_TODAY = date(2025, 3, 15)
+CORPUS_CIUDADES = ("Barranquilla", "Bogotá", "Bucaramanga", "Cali", "Cartagena", "Cúcuta", "Manizales", "Medellín", "Pereira", "Santa Marta")
+CORPUS_CATEGORIAS = ("Educación", "Medio Ambiente", "Salud", "Seguridad")
+
+# (pregunta, campos esperados de Intent.to_dict(); los que no aparecen no se comparan)
+CORPUS: List[Tuple[str, Dict[str, Any]]] = [
+    ("¿Cuántos reportes hay en total?", {"kind": "numeric", "count": True, "metric": "registros", "group_by": (), "ciudades": (), "date_range": None}),
+    ("¿Cuántos reportes urgentes hay?", {"kind": "numeric", "count": True, "metric": "urgentes"}),
+    ("cantidad de registros en 2024", {"count": True, "date_range": ["2024-01-01", "2025-01-01"]}),
+    ("¿Cuántos reportes urgentes hubo en Cali en 2024?", {"count": True, "metric": "urgentes", "ciudades": ("Cali",), "date_range": ["2024-01-01", "2025-01-01"]}),
+    ("¿Qué ciudad tiene más reportes?", {"kind": "numeric", "count": False, "group_by": ("ciudad",), "order": "desc", "top_n": 1}),
+    ("¿Cuál es la ciudad con más reportes urgentes?", {"group_by": ("ciudad",), "metric": "urgentes"}),
+    ("¿Qué categoría tiene más registros en Medellín?", {"group_by": ("categoria",), "ciudades": ("Medellín",)}),
+    ("¿Cuál fue el mes con más reportes?", {"kind": "numeric", "group_by": ("mes",), "order": "desc"}),
+    ("¿Qué mes tuvo más reportes de salud en Bogotá?", {"group_by": ("mes",), "ciudades": ("Bogotá",), "categorias": ("Salud",)}),
+    ("¿Cuáles son las 3 ciudades con más reportes?", {"group_by": ("ciudad",), "top_n": 3}),
+    ("top 5 ciudades con más reportes urgentes", {"group_by": ("ciudad",), "top_n": 5, "metric": "urgentes"}),
+    ("las tres categorías con menos reportes", {"group_by": ("categoria",), "top_n": 3, "order": "asc"}),
+    ("¿Qué ciudad tiene menos reportes de seguridad?", {"group_by": ("ciudad",), "order": "asc", "categorias": ("Seguridad",)}),
+    ("¿Cuántos reportes hubo en los últimos 3 meses?", {"count": True, "top_n": 1, "group_by": (), "date_range": ["2024-12-15", "2025-03-16"]}),
+    ("reportes de educación en marzo de 2023", {"kind": "general", "categorias": ("Educación",), "date_range": ["2023-03-01", "2023-04-01"]}),
+    ("¿Cuántos reportes de medio ambiente hay en Santa Marta?", {"count": True, "ciudades": ("Santa Marta",), "categorias": ("Medio Ambiente",)}),
+    ("problemas de salud en Cucuta y Pereira", {"kind": "general", "ciudades": ("Cúcuta", "Pereira"), "categorias": ("Salud",), "group_by": ()}),
+    ("¿Cómo está la calidad del agua?", {"kind": "general", "ciudades": (), "group_by": ()}),
+    ("¿Qué problemas hay en Cali?", {"kind": "general", "ciudades": ("Cali",), "group_by": ()}),
+    ("Resume los principales problemas de Barranquilla", {"kind": "summary", "ciudades": ("Barranquilla",)}),
+    ("Compara la seguridad en Medellín y Bogotá", {"kind": "summary", "ciudades": ("Medellín", "Bogotá"), "categorias": ("Seguridad",)}),
+    ("¿Cuál es la tendencia mensual de reportes urgentes?", {"kind": "summary", "group_by": ("mes",), "rank": False, "metric": "urgentes"}),
+    ("¿Cuántos reportes hubo el año pasado?", {"count": True, "date_range": ["2024-01-01", "2025-01-01"]}),
+    ("reportes del segundo trimestre de 2024 en Manizales", {"ciudades": ("Manizales",), "date_range": ["2024-04-01", "2024-07-01"]}),
+    ("¿Cuántos reportes hubo entre 2023 y 2024?", {"count": True, "date_range": ["2023-01-01", "2025-01-01"]}),
+    ("número de reportes en Bucaramanga el mes pasado", {"count": True, "ciudades": ("Bucaramanga",), "group_by": (), "date_range": ["2025-02-01", "2025-03-01"]}),
+    ("¿Cuántos reportes hay por ciudad?", {"count": True, "group_by": ("ciudad",), "rank": False}),
+    ("reportes urgentes por categoría en 2023", {"group_by": ("categoria",), "rank": False, "metric": "urgentes", "date_range": ["2023-01-01", "2024-01-01"]}),
+    ("¿Hay más reportes rurales o urbanos?", {"kind": "general", "group_by": ()}),
+    ("¿Qué ciudad y qué categoría tienen más reportes?", {"group_by": ("ciudad", "categoria")}),
+    ("¿Qué ciudad tuvo más reportes el mes pasado?", {"group_by": ("ciudad",), "date_range": ["2025-02-01", "2025-03-01"]}),
+    ("¿Cuál es la ciudad con mayor número de reportes?", {"kind": "numeric", "count": False, "group_by": ("ciudad",), "order": "desc"}),
+    ("reportes del 2024-05-10 en Cartagena", {"ciudades": ("Cartagena",), "date_range": ["2024-05-10", "2024-05-11"]}),
+    # Rangos relativos fuera del calendario: sin rango de fechas, no un error
+    ("¿Cuántos reportes hubo en los últimos 5000 años?", {"count": True, "date_range": None}),
+    ("reportes de los últimos 99999999 días", {"date_range": None}),
+    ("reportes de las últimas 99999999999999999999 semanas", {"date_range": None}),
+]
+
+
+def check_corpus() -> List[str]:
+    """Errores del parser frente al corpus (lista vacía = todo coincide)."""
+    parser = IntentParser(CORPUS_CIUDADES, CORPUS_CATEGORIAS)
+    errors: List[str] = []
+    for question, expected in CORPUS:
+        got = parser.parse(question, CORPUS_TODAY).to_dict()
+        for key, want in expected.items():
+            value = got[key]
+            if isinstance(value, tuple):
+                want = tuple(want)
+            if value != want:
+                errors.append(f"{question!r}: {key}={value!r}, esperado {want!r}")
+    return errors
+
+
+def main(argv: Sequence[str]) -> int:
+    """`python -m app.intent --check` valida el corpus; `python -m app.intent "pregunta"` muestra intención y plan."""
+    if not argv or argv[0] == "--check":
+        errors = check_corpus()
+        for e in errors:
+            print(e)
+        parser = IntentParser(CORPUS_CIUDADES, CORPUS_CATEGORIAS)
+        started = time.perf_counter()
+        rounds = 200
+        for _ in range(rounds):
+            for question, _expected in CORPUS:
+                parser.parse(question, CORPUS_TODAY)
+        per_question = (time.perf_counter() - started) / (rounds * len(CORPUS)) * 1e6
+        print(f"{len(CORPUS) - len({e.split(':')[0] for e in errors})}/{len(CORPUS)} preguntas correctas; {per_question:.1f} µs por pregunta")
+        return 1 if errors else 0
+    parser = IntentParser(CORPUS_CIUDADES, CORPUS_CATEGORIAS)
+    intent = parser.parse(" ".join(argv), CORPUS_TODAY)
+    print(intent.to_dict())
+    for line in build_plan(intent):
+        print(f"- {line.kind} {line.dim or ''} {line.name or ''}: {[tuple(q) for q in line.queries]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .prompts import SYSTEM
+from .settings import (
+    LLM_AFFINITY_CHARS,
+    LLM_AFFINITY_SLACK,
+    LLM_EJECT_FAILURES,
+    LLM_EJECT_SECONDS,
+    LLM_HEALTH_INTERVAL_SECONDS,
+    LLM_HEDGE_SECONDS,
+    LLM_SLOW_SECONDS,
+    LLM_URLS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Peso del último valor en la media móvil de latencia
+EWMA_ALPHA = 0.3
+
+
+class LLMUnavailable(Exception):
+    """Ninguna réplica puede recibir peticiones (circuito abierto o /health fallando en todas)."""
+
+
+class Backend:
+    """Estado de una réplica de llama.cpp tal como la ve este proceso."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        # Último sondeo de /slots (incluye peticiones de otros clientes del mismo servidor)
+        self.busy_slots = 0
+        self.total_slots = 1
+        self.healthy = True
+        self.failures = 0  # fallos consecutivos
+        # Circuito: abierto hasta ejected_until; después semiabierto (una sola petición de prueba)
+        self.ejected_until = 0.0
+        self.half_open = False
+        self.probing = False
+        self.ewma_seconds: Optional[float] = None
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.hedges_won = 0
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until and not (self.half_open and self.probing)
+
+    def circuit(self, now: float) -> str:
+        if now < self.ejected_until:
+            return "open"
+        return "half_open" if self.half_open else "closed"
+
+    def busy(self) -> int:
+        return max(self.in_flight, self.busy_slots)
+
+    def load(self) -> float:
+        return self.busy() / max(1, self.total_slots)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "url": self.url,
+            "available": self.available(now),
+            "healthy": self.healthy,
+            "circuit": self.circuit(now),
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - now), 1),
+            "in_flight": self.in_flight,
+            "busy_slots": self.busy_slots,
+            "total_slots": self.total_slots,
+            "ewma_seconds": round(self.ewma_seconds, 3) if self.ewma_seconds is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "hedges_won": self.hedges_won,
+        }
+
+
+def _rendezvous_score(key: str, url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{key}|{url}".encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def affinity_key(prompt: str) -> str:
+    """Inicio de la parte variable del prompt (el SYSTEM es común y ya está en caché en todas las réplicas)."""
+    body = prompt[len(SYSTEM):] if prompt.startswith(SYSTEM) else prompt
+    return body[:LLM_AFFINITY_CHARS]
+
+
+class LLMRouter:
+    """Cliente de /completion repartido entre varias réplicas de llama.cpp.
+
+    - Elige la réplica con menos carga (peticiones en curso o slots ocupados según /slots)
+    - Prompts con el mismo inicio van a la misma réplica (rendezvous hashing) para reutilizar su KV-cache,
+      salvo que esté `affinity_slack` peticiones más cargada que la más libre
+    - Circuit breaker: tras `eject_failures` fallos o respuestas lentas seguidas, la réplica queda fuera `eject_seconds`;
+      luego recibe una sola petición de prueba que cierra el circuito si sale bien o lo reabre si falla
+    - Si la respuesta tarda más de `hedge_seconds`, lanza una copia en otra réplica con slots libres y usa la primera
+    - `transport` permite inyectar un httpx.MockTransport o apuntar a servidores falsos locales
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        hedge_seconds: float = LLM_HEDGE_SECONDS,
+        eject_failures: int = LLM_EJECT_FAILURES,
+        eject_seconds: float = LLM_EJECT_SECONDS,
+        slow_seconds: float = LLM_SLOW_SECONDS,
+        affinity_slack: int = LLM_AFFINITY_SLACK,
+    ) -> None:
+        if not urls:
+            raise ValueError("Se necesita al menos una URL de LLM")
+        self.backends = [Backend(u) for u in urls]
+        self.hedge_seconds = hedge_seconds
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.slow_seconds = slow_seconds
+        self.affinity_slack = affinity_slack
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.hedges = 0
+        self.retries = 0
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(transport=self._transport)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def choose(self, affinity: Optional[str] = None, exclude: Optional[List[Backend]] = None) -> Optional[Backend]:
+        exclude = exclude or []
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+        if not candidates:
+            return None
+        least = min(candidates, key=lambda b: (b.load(), b.ewma_seconds or 0.0))
+        if affinity:
+            sticky = max(candidates, key=lambda b: _rendezvous_score(affinity, b.url))
+            if sticky.busy() - least.busy() <= self.affinity_slack:
+                return sticky
+        return least
+
+    def _hedge_target(self, tried: List[Backend]) -> Optional[Backend]:
+        now = time.monotonic()
+        # Solo réplicas con capacidad ociosa: la copia no debe quitarle el turno a otra petición
+        spare = [b for b in self.backends if b not in tried and b.available(now) and b.busy() < b.total_slots]
+        return min(spare, key=lambda b: (b.load(), b.ewma_seconds or 0.0)) if spare else None
+
+    def queue_depth(self) -> int:
+        """Peticiones esperando slot en las réplicas disponibles."""
+        now = time.monotonic()
+        return sum(max(0, b.busy() - b.total_slots) for b in self.backends if b.available(now))
+
+    def expected_seconds(self) -> Optional[float]:
+        """Latencia esperada de una petición nueva cuando todas las réplicas están ocupadas.
+
+        None si hay algún slot libre (se intenta y el plazo lo controla el timeout) o no hay historial.
+        """
+        now = time.monotonic()
+        estimates: List[float] = []
+        for b in self.backends:
+            if not b.available(now):
+                continue
+            if b.busy() < b.total_slots:
+                return None
+            if b.ewma_seconds is not None:
+                # Espera a que se liberen los slots ocupados por las peticiones por delante + la propia
+                estimates.append(b.ewma_seconds * (1 + (b.busy() + 1 - b.total_slots) / b.total_slots))
+        return min(estimates) if estimates else None
+
+    def _strike(self, backend: Backend) -> None:
+        now = time.monotonic()
+        if now < backend.ejected_until:
+            return  # ya abierto; peticiones que estaban en curso no alargan la expulsión
+        backend.failures += 1
+        if backend.half_open or backend.failures >= self.eject_failures:
+            backend.ejected_until = now + self.eject_seconds
+            backend.half_open = True
+            backend.ejections += 1
+            backend.failures = 0
+            logger.warning("LLM: circuito abierto para %s durante %.0fs", backend.url, self.eject_seconds)
+
+    def _succeed(self, backend: Backend) -> None:
+        backend.failures = 0
+        if backend.half_open:
+            backend.half_open = False
+            logger.info("LLM: circuito cerrado para %s", backend.url)
+
+    def _release(self, backend: Backend, probe: bool) -> None:
+        backend.in_flight -= 1
+        if probe:
+            backend.probing = False
+
+    async def _attempt(self, backend: Backend, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            r = await self.client().post(f"{backend.url}/completion", json=payload, timeout=timeout)
+            r.raise_for_status()
+            try:
+                data = r.json()
+            except ValueError as e:
+                # 200 con cuerpo truncado o que no es JSON: falla de la réplica como un 5xx
+                raise httpx.DecodingError(f"Respuesta inválida de {backend.url}: {e}", request=r.request) from e
+            if not isinstance(data, dict):
+                raise httpx.DecodingError(f"Respuesta inválida de {backend.url}: se esperaba un objeto", request=r.request)
+        except httpx.HTTPError:
+            backend.errors += 1
+            self._strike(backend)
+            raise
+        elapsed = time.monotonic() - started
+        prev = backend.ewma_seconds
+        backend.ewma_seconds = elapsed if prev is None else EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * prev
+        if elapsed > self.slow_seconds:
+            self._strike(backend)
+        else:
+            self._succeed(backend)
+        return data
+
+    async def complete(self, payload: Dict[str, Any], timeout: float, affinity: Optional[str] = None) -> Dict[str, Any]:
+        """POST /completion con reparto, copia de cola y reintento en otra réplica ante errores de conexión o 5xx.
+
+        Propaga httpx.TimeoutException / httpx.HTTPError como un cliente httpx normal y
+        LLMUnavailable si ninguna réplica acepta peticiones.
+        """
+        tried: List[Backend] = []
+        pending: Dict[asyncio.Task, Backend] = {}
+        hedge: Optional[Backend] = None
+
+        def launch(backend: Backend) -> None:
+            # Se cuenta al crear la tarea (no al empezar) para que peticiones simultáneas vean la carga
+            backend.in_flight += 1
+            backend.requests += 1
+            probe = backend.half_open
+            if probe:
+                backend.probing = True
+            task = asyncio.create_task(self._attempt(backend, payload, timeout))
+            task.add_done_callback(lambda _t: self._release(backend, probe))
+            tried.append(backend)
+            pending[task] = backend
+
+        first = self.choose(affinity)
+        if first is None:
+            raise LLMUnavailable("Ninguna réplica del LLM disponible")
+        launch(first)
+        hedged = self.hedge_seconds <= 0 or len(self.backends) < 2
+        last_error: Optional[httpx.HTTPError] = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=None if hedged else self.hedge_seconds, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    if (hedge := self._hedge_target(tried)) is not None:
+                        self.hedges += 1
+                        launch(hedge)
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    try:
+                        data = task.result()
+                    except httpx.HTTPError as e:
+                        last_error = e
+                        continue
+                    if backend is hedge:
+                        backend.hedges_won += 1
+                    return data
+                # Todos los intentos en curso fallaron; un timeout ya consumió el plazo, no se reintenta
+                retryable = not isinstance(last_error, httpx.TimeoutException)
+                if not pending and retryable and (nxt := self.choose(affinity, tried)) is not None:
+                    self.retries += 1
+                    launch(nxt)
+        except asyncio.CancelledError:
+            # Cancelada desde fuera (plazo de /ask vencido): cuenta como respuesta lenta de las réplicas en curso
+            for backend in pending.values():
+                self._strike(backend)
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        assert last_error is not None
+        raise last_error
+
+    async def _poll_backend(self, backend: Backend, timeout: float) -> None:
+        client = self.client()
+        try:
+            r = await client.get(f"{backend.url}/health", timeout=timeout)
+            # llama.cpp responde 503 mientras carga el modelo
+            backend.healthy = r.status_code == 200
+        except httpx.HTTPError:
+            backend.healthy = False
+            return
+        try:
+            r = await client.get(f"{backend.url}/slots", timeout=timeout)
+            if r.status_code == 200:
+                slots = r.json()
+                backend.total_slots = max(1, len(slots))
+                # Según la versión del servidor: is_processing (bool) o state (0 = libre)
+                backend.busy_slots = sum(1 for s in slots if s.get("is_processing") or s.get("state", 0) != 0)
+        except (httpx.HTTPError, ValueError, AttributeError):
+            pass  # /slots puede estar deshabilitado (--no-slots); se usa solo el conteo local
+
+    async def poll(self, timeout: float = 2.0) -> None:
+        await asyncio.gather(*(self._poll_backend(b, timeout) for b in self.backends))
+
+    async def run_health_checks(self, interval: float = LLM_HEALTH_INTERVAL_SECONDS) -> None:
+        while True:
+            await self.poll()
+            await asyncio.sleep(interval)
+
+    async def prime(self, payload: Dict[str, Any], timeout: float) -> Dict[str, bool]:
+        """Envía el mismo payload a todas las réplicas (calentamiento del KV-cache del prefijo común)."""
+
+        async def one(backend: Backend) -> bool:
+            try:
+                r = await self.client().post(f"{backend.url}/completion", json=payload, timeout=timeout)
+                r.raise_for_status()
+                return True
+            except httpx.HTTPError as e:
+                logger.warning("Warm-up: no se pudo preparar %s (%r); se continúa sin ella.", backend.url, e)
+                return False
+
+        results = await asyncio.gather(*(one(b) for b in self.backends))
+        return {b.url: ok for b, ok in zip(self.backends, results)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backends": [b.snapshot() for b in self.backends],
+            "hedges": self.hedges,
+            "retries": self.retries,
+            "queue_depth": self.queue_depth(),
+            "expected_seconds": self.expected_seconds(),
+        }
+
+
+llm_router = LLMRouter(LLM_URLS)
@@ -1,20 +1,90 @@
 from __future__ import annotations
 
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+
+# settings va primero: marca el inicio de la importación de la app (base del arranque en frío)
+from .settings import MAX_CTX_DOCS, LLM_TIMEOUT_SECONDS, WARMUP_ENABLED, APP_IMPORT_STARTED, LLM_HEALTH_INTERVAL_SECONDS, LLM_DEADLINE_SECONDS, LLM_QUEUE_THRESHOLD, INGEST_ENABLED, INGEST_MAX_BATCH, INGEST_TOKEN, API_WORKERS, TRACE_ENABLED, ADMIN_TOKEN, PROFILE_MAX_SECONDS, LOG_LEVEL
 
 import os
+import csv
+import hmac
+import io
+import json
+import logging
+import math
+import sqlite3
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
 import httpx
-from fastapi import FastAPI
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
-from .settings import LLM_URL, N_PREDICT, TEMPERATURE, TOP_K, TOP_P, MAX_CTX_DOCS, LLM_TIMEOUT_SECONDS
-from .retrieval import search_reports, count_reports, count_reports_by_city, count_reports_by_category, count_urgent_reports, count_urgent_by_city, count_urgent_by_category, monthly_counts
+from .retrieval import search_reports, data_version, query_cache, REPORT_COLUMNS, InvalidCursor, iter_search, search_page
+from .charts import CHART_KINDS, MEDIA_TYPES, ChartCache, chart_cache, chart_filters, chart_series, describe_kinds, render_chart, render_pool, shutdown_render_pool
+from .warmup import run_warmup
+from .generation import choose_params, generation_stats
+from .intent import Intent, build_plan, intent_parser, run_plan
+from .llm import LLMUnavailable, affinity_key, llm_router
+from .fallback import fallback_answer, fallback_counts
+from .admission import Client, client_ip, fair_queue
+from .ingest import IngestBusy, IngestConflict, IngestUnavailable, report_writer
+from .tracing import ProfilerBusy, TraceMiddleware, add_span, profiler, span, trace_store
 from .prompts import build_prompt
-import unicodedata
-import re
 
-app = FastAPI(title="RAG API - Mistral + SQLite FTS5")
+from etl.transform.rules import clean_record
+
+# uvicorn solo configura sus propios loggers: los de app.* van a stderr con este formato
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger("app").setLevel(LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Estado de arranque: /status responde "ok" solo cuando ready=True
+_startup: Dict[str, Any] = {"ready": False}
+
+
+async def _warmup_and_measure() -> None:
+    await run_warmup(_startup)
+    _startup["cold_start_seconds"] = time.perf_counter() - APP_IMPORT_STARTED
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _startup["import_seconds"] = time.perf_counter() - APP_IMPORT_STARTED
+    task: Optional[asyncio.Task] = None
+    if WARMUP_ENABLED:
+        # En segundo plano: el servidor acepta conexiones y /status informa "warming" mientras tanto
+        task = asyncio.create_task(_warmup_and_measure())
+    else:
+        _startup["ready"] = True
+    health: Optional[asyncio.Task] = None
+    if LLM_HEALTH_INTERVAL_SECONDS > 0:
+        health = asyncio.create_task(llm_router.run_health_checks(LLM_HEALTH_INTERVAL_SECONDS))
+    if INGEST_ENABLED and INGEST_TOKEN:
+        # Un solo escritor por base (commits agrupados): con varios workers la ingesta no arranca y
+        # POST /reports responde 503; se sirve desde una instancia aparte con API_WORKERS=1
+        if API_WORKERS > 1:
+            logger.error("Ingesta desactivada: requiere API_WORKERS=1 (hay %d)", API_WORKERS)
+        else:
+            try:
+                report_writer.start()
+            except IngestUnavailable as e:
+                logger.error("Ingesta desactivada: %s", e)
+    yield
+    for t in (task, health):
+        if t is not None and not t.done():
+            t.cancel()
+    # Confirma lo que quedó en el búfer antes de cerrar
+    await report_writer.stop()
+    await llm_router.aclose()
+    shutdown_render_pool()
+
+
+app = FastAPI(title="RAG API - Mistral + SQLite FTS5", lifespan=lifespan)
 
 _origins_env = os.getenv("CORS_ALLOW_ORIGINS", "*")
 _origins = ["*"] if _origins_env.strip() == "*" else [o.strip() for o in _origins_env.split(",") if o.strip()]
@@ -25,6 +95,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if TRACE_ENABLED:
+    # Después de CORS en la lista: queda por fuera y mide la petición completa
+    app.add_middleware(TraceMiddleware)
 
 
 class AskRequest(BaseModel):
@@ -33,187 +106,368 @@ class AskRequest(BaseModel):
 
 class AskSimpleResponse(BaseModel):
     answer: str
-
-
-# Detector simple de intenciones de cálculo para respuestas determinísticas
-def _try_calc_intent(question: str) -> Optional[str]:
-    q = question.strip().lower()
-    # Conteo total / urgentes
-    if (("cuant" in q or "cantidad" in q) and any(w in q for w in ["registro", "registros", "reporte", "reportes"])):
-        urgent = ("urgente" in q or "urgentes" in q)
-        total = count_urgent_reports(None) if urgent else count_reports(None)
-        return (
-            f"Hay {total} reportes urgentes en total." if urgent else f"Hay {total} registros en total."
-        )
-    # Ciudad con más reportes
-    if ("ciudad" in q and ("más" in q or "mas" in q) and any(w in q for w in ["reporte", "reportes", "registro", "registros"])):
-        by_city = count_reports_by_city(None)
-        if by_city:
-            top = by_city[0]
-            return f"La ciudad con más reportes es {top['ciudad']} con {top['count']} registros."
-    # Categoría con más reportes
-    if ("categor" in q and ("más" in q or "mas" in q)):
-        by_cat = count_reports_by_category(None)
-        if by_cat:
-            top = by_cat[0]
-            return f"La categoría con más reportes es {top['categoria']} con {top['count']} registros."
-    # Mes con más reportes
-    if ("mes" in q and ("más" in q or "mas" in q)):
-        monthly = monthly_counts(None)
-        if monthly:
-            top = max(monthly, key=lambda x: x["count"])
-            return f"El mes con más reportes es {top['mes']} con {top['count']} registros."
+    # True si la respuesta se armó sin el LLM (ver app/fallback.py); degraded_reason indica por qué
+    degraded: bool = False
+    degraded_reason: Optional[str] = None
+
+
+# Estadísticas agregadas para el Contexto: una pasada sobre la pregunta y un plan de consultas sin repetidas (ver app/intent.py)
+def _build_stats_context(intent: Intent) -> List[str]:
+    return run_plan(build_plan(intent))
+
+
+# Motivo para no esperar al LLM: cola por encima del umbral o plazo imposible de cumplir
+def _degrade_reason(started: float) -> Optional[str]:
+    # En cola: las que esperan turno en la cola justa + las que esperan slot en las réplicas
+    if LLM_QUEUE_THRESHOLD > 0 and fair_queue.waiting() + llm_router.queue_depth() >= LLM_QUEUE_THRESHOLD:
+        return "queue"
+    if LLM_DEADLINE_SECONDS > 0:
+        remaining = LLM_DEADLINE_SECONDS - (time.perf_counter() - started)
+        expected = llm_router.expected_seconds()
+        if remaining <= 0 or (expected is not None and expected > remaining):
+            return "deadline"
     return None
 
 
-# Utilidad para normalizar y comparar nombres con y sin acentos
-def _strip_accents(s: str) -> str:
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-
-# Extrae filtros de fecha (YYYY o YYYY-MM) desde la pregunta
-def _extract_date_filters(question: str) -> Dict[str, Any]:
-    q = question.lower()
-    filters: Dict[str, Any] = {}
-    # YYYY-MM
-    mm = re.search(r"\b((?:19|20)\d{2})-(\d{1,2})\b", q)
-    if mm:
-        year = mm.group(1)
-        month = int(mm.group(2))
-        filters["fecha_desde"] = f"{year}-{month:02d}-01"
-        filters["fecha_hasta"] = f"{year}-{month:02d}-31"
-        return filters
-    # Mes en español + año
-    MONTHS_ES = {
-        "enero": "01", "febrero": "02", "marzo": "03", "abril": "04",
-        "mayo": "05", "junio": "06", "julio": "07", "agosto": "08",
-        "septiembre": "09", "setiembre": "09", "octubre": "10", "noviembre": "11", "diciembre": "12"
-    }
-    ys = re.findall(r"\b((?:19|20)\d{2})\b", q)
-    for mname, mnum in MONTHS_ES.items():
-        if mname in q and ys:
-            year = ys[0]
-            filters["fecha_desde"] = f"{year}-{mnum}-01"
-            filters["fecha_hasta"] = f"{year}-{mnum}-31"
-            return filters
-    # Rango de años (uno o dos)
-    if ys:
-        y1 = ys[0]
-        y2 = ys[-1]
-        filters["fecha_desde"] = f"{y1}-01-01"
-        filters["fecha_hasta"] = f"{y2}-12-31"
-        return filters
-    return filters
-
-# Construye líneas de estadísticas agregadas basadas en la intención de la pregunta
-def _build_stats_context(question: str) -> List[str]:
-    q = question.strip().lower()
-    norm_q = _strip_accents(q)
-    date_filters = _extract_date_filters(q)
-    lines: List[str] = []
-
-    # Totales (y urgentes si se pide)
-    if (("cuant" in q or "cantidad" in q) and any(w in q for w in ["registro", "registros", "reporte", "reportes"])):
-        if ("urgente" in q or "urgentes" in q):
-            total_urg = count_urgent_reports(date_filters or None)
-            lines.append(f"Total urgentes: {total_urg}")
-        total = count_reports(date_filters or None)
-        lines.append(f"Total registros: {total}")
-
-    # Por ciudad, si se mencionan ciudades
-    by_city_all = count_reports_by_city(None)  # solo para descubrir nombres existentes
-    for c in by_city_all:
-        name = c["ciudad"]
-        if not name:
-            continue
-        name_norm = _strip_accents(name.lower())
-        if name_norm and name_norm in norm_q:
-            base_filters = dict(date_filters) if date_filters else {}
-            base_filters["ciudad"] = name
-            cnt = int(count_reports(base_filters))
-            line = f"Ciudad: {name}; registros: {cnt}"
-            if ("urgente" in q or "urgentes" in q):
-                u = int(count_urgent_reports(base_filters))
-                line += f"; urgentes: {u}"
-            lines.append(line)
-
-    # Por categoría, si se mencionan
-    by_cat_all = count_reports_by_category(None)  # para descubrir nombres de categorías
-    for cat in by_cat_all:
-        cname = cat["categoria"]
-        if not cname:
-            continue
-        cname_norm = _strip_accents(cname.lower())
-        if cname_norm in norm_q:
-            base_filters = dict(date_filters) if date_filters else {}
-            base_filters["categoria_problema"] = cname
-            cnt = int(count_reports(base_filters))
-            line = f"Categoría: {cname}; registros: {cnt}"
-            if ("urgente" in q or "urgentes" in q):
-                u = int(count_urgent_reports(base_filters))
-                line += f"; urgentes: {u}"
-            lines.append(line)
-
-    # Top ciudad / categoría si se pide "más" (aplica filtros de fecha)
-    if (("más" in q or "mas" in q) and "ciudad" in q and not any(l.startswith("Ciudad:") for l in lines)):
-        by_city_filtered = count_reports_by_city(date_filters or None)
-        if by_city_filtered:
-            top = by_city_filtered[0]
-            lines.append(f"Top ciudad por registros: {top['ciudad']} ({int(top['count'])})")
-    if (("más" in q or "mas" in q) and "categor" in q and not any(l.startswith("Categoría:") for l in lines)):
-        by_cat_filtered = count_reports_by_category(date_filters or None)
-        if by_cat_filtered:
-            topc = by_cat_filtered[0]
-            lines.append(f"Top categoría por registros: {topc['categoria']} ({int(topc['count'])})")
-
-    # Pico mensual si se menciona "mes" (aplica filtros de fecha)
-    if ("mes" in q):
-        monthly = monthly_counts(date_filters or None)
-        if monthly:
-            peak = max(monthly, key=lambda x: x["count"])
-            lines.append(f"Mes pico de registros: {peak['mes']} ({int(peak['count'])})")
-
-    return lines
+# Admisión antes de cualquier trabajo: 429 si el cliente agotó su cuota o ya tiene demasiadas preguntas en cola
+def admit(request: Request) -> Client:
+    client = fair_queue.client(
+        request.headers.get("x-api-key"),
+        client_ip(request.client.host if request.client else None, request.headers.get("x-forwarded-for")),
+        request.headers.get("x-priority"),
+    )
+    ok, retry_after = fair_queue.admit(client)
+    if not ok:
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiadas consultas; intenta de nuevo en unos segundos.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+    return client
 
 
 @app.post("/ask", response_model=AskSimpleResponse)
-async def ask(req: AskRequest) -> AskSimpleResponse:
+async def ask(req: AskRequest, client: Client = Depends(admit)) -> AskSimpleResponse:
+    started = time.perf_counter()
+    with span("intent") as s:
+        intent = intent_parser().parse(req.texto)
+        s.set(**intent.to_dict())
+
     # Construir estadísticas para que el MODELO las use en la respuesta
-    stats_lines = _build_stats_context(req.texto)
+    with span("stats_context") as s:
+        stats_lines = _build_stats_context(intent)
+        s.set(lines=len(stats_lines))
 
-    contexts, used_fts = search_reports(req.texto, k=MAX_CTX_DOCS, filters=None)
+    with span("search") as s:
+        contexts, used_fts = search_reports(req.texto, k=MAX_CTX_DOCS, filters=None)
+        s.set(used_fts=used_fts, docs=len(contexts))
 
-    # Siempre invocar al LLM, incluyendo estadísticas agregadas en el Contexto
-    prompt = build_prompt(contexts, req.texto, stats_lines=stats_lines if stats_lines else None)
+    with span("prompt") as s:
+        # Siempre invocar al LLM, incluyendo estadísticas agregadas en el Contexto
+        prompt = build_prompt(contexts, req.texto, stats_lines=stats_lines if stats_lines else None)
 
+        # Presupuesto, cortes y muestreo según el tipo de pregunta y el tamaño del contexto
+        gen = choose_params(intent.kind, prompt, len(contexts))
+        s.set(chars=len(prompt), intent=gen.intent, n_predict=gen.n_predict)
     payload = {
         "prompt": prompt,
-        "n_predict": N_PREDICT,
-        "temperature": TEMPERATURE,
-        "top_k": TOP_K,
-        "top_p": TOP_P,
+        **gen.payload(),
+        # Reutiliza el KV-cache del prefijo estático (SYSTEM) preparado en el warm-up
+        "cache_prompt": True,
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS)) as client:
+    reason = _degrade_reason(started)
+    if reason is None:
+        timeout = LLM_TIMEOUT_SECONDS
+        if LLM_DEADLINE_SECONDS > 0:
+            timeout = min(timeout, LLM_DEADLINE_SECONDS - (time.perf_counter() - started))
+        got_turn = False
         try:
-            r = await client.post(f"{LLM_URL}/completion", json=payload)
-            r.raise_for_status()
-            data = r.json()
+            # El plazo cubre la espera de turno en la cola justa, reintentos y copias
+            async with asyncio.timeout(timeout):
+                queued = time.perf_counter()
+                async with fair_queue.slot(client):
+                    got_turn = True
+                    llm_started = time.perf_counter()
+                    add_span("queue", llm_started - queued, client=client.label)
+                    with span("llm") as s:
+                        # Réplica elegida por carga y afinidad de prefijo (ver app/llm.py)
+                        data = await llm_router.complete(payload, timeout=timeout, affinity=affinity_key(prompt))
+                        s.set(tokens=data.get("tokens_predicted"))
+            generation_stats.record(gen, data, time.perf_counter() - llm_started)
             # Try multiple possible keys depending on server version
             text = data.get("content") or data.get("result") or data.get("text") or ""
-        except httpx.TimeoutException:
-            text = (
-                "El modelo tardó demasiado en responder; se agotó el tiempo de espera. "
-                "Prueba una consulta más breve o vuelve a intentarlo más tarde."
-            )
+            return AskSimpleResponse(answer=gen.finish(text))
+        except (httpx.TimeoutException, TimeoutError):
+            reason = "timeout" if got_turn else "queue"
+        except LLMUnavailable:
+            reason = "unavailable"
         except httpx.HTTPError as e:
-            text = f"No se pudo contactar el modelo: {str(e)}"
-
-    return AskSimpleResponse(answer=text)
-
-
-
+            logger.warning("LLM: error al generar (%r)", e)
+            reason = "error"
+
+    # Sin LLM: respuesta inmediata con las estadísticas y los reportes ya calculados
+    add_span("fallback", 0.0, reason=reason)
+    return AskSimpleResponse(answer=fallback_answer(stats_lines, contexts, reason), degraded=True, degraded_reason=reason)
+
+
+
+
+
+@app.get("/charts")
+async def charts_index() -> Dict[str, Any]:
+    return {"kinds": describe_kinds(), "formats": ["json", *MEDIA_TYPES], "cache": chart_cache.stats()}
+
+
+# Filtros comunes de /charts y /reports/search (mismas claves que retrieval._apply_filters).
+# Las fechas se validan como YYYY-MM-DD completas: '2024-03' o 'abc' responden 422.
+def report_filters(
+    ciudad: Optional[str] = None,
+    categoria_problema: Optional[str] = None,
+    urgente: Optional[bool] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_antes: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    zona_rural: Optional[int] = None,
+    acceso_internet: Optional[int] = None,
+    atencion_previa_gobierno: Optional[int] = None,
+) -> Dict[str, Any]:
+    return chart_filters(
+        ciudad=ciudad,
+        categoria_problema=categoria_problema,
+        urgente=urgente,
+        fecha_desde=fecha_desde and fecha_desde.isoformat(),
+        fecha_antes=fecha_antes and fecha_antes.isoformat(),
+        fecha_hasta=fecha_hasta and fecha_hasta.isoformat(),
+        zona_rural=zona_rural,
+        acceso_internet=acceso_internet,
+        atencion_previa_gobierno=atencion_previa_gobierno,
+    )
+
+
+# Gráfica filtrada bajo demanda: format=json devuelve solo la serie para que el cliente la dibuje
+@app.get("/charts/{kind}")
+async def chart(
+    kind: str,
+    formato: str = Query("png", alias="format"),
+    filters: Dict[str, Any] = Depends(report_filters),
+) -> Response:
+    if kind not in CHART_KINDS:
+        raise HTTPException(status_code=404, detail=f"Gráfica desconocida: {kind}")
+    if formato != "json" and formato not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {formato}")
+    key = ChartCache.key(kind, formato, filters, data_version())
+    content = chart_cache.get(key)
+    if content is None:
+        series = await run_in_threadpool(chart_series, kind, filters)
+        if formato == "json":
+            content = series
+        else:
+            loop = asyncio.get_running_loop()
+            content = await loop.run_in_executor(render_pool(), render_chart, series, formato)
+        chart_cache.put(key, content)
+    if formato == "json":
+        return JSONResponse(content)
+    return Response(content=content, media_type=MEDIA_TYPES[formato])
+
+
+# Búsqueda completa para analistas: páginas por keyset (format=json) o exportación en streaming (ndjson/csv)
+@app.get("/reports/search")
+async def reports_search(
+    q: str = "",
+    orden: str = Query("relevancia", pattern="^(relevancia|fecha)$"),
+    formato: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    filters: Dict[str, Any] = Depends(report_filters),
+) -> Response:
+    if formato == "json":
+        try:
+            with span("search_page", orden=orden, limit=limit):
+                page = await run_in_threadpool(search_page, q, filters, orden, limit, cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return JSONResponse(page)
+    rows = iter_search(q, filters, orden)
+    if formato == "ndjson":
+        return StreamingResponse(_ndjson_chunks(rows), media_type="application/x-ndjson")
+    return StreamingResponse(
+        _csv_chunks(rows),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="reportes.csv"'},
+    )
+
+
+# Mayor id que cabe en un INTEGER de SQLite
+MAX_REPORT_ID = 2**63 - 1
+
+
+def _validate_reports(reports: List[Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    rows: List[Dict[str, Any]] = []
+    rejected: List[Dict[str, Any]] = []
+    seen_ids = set()
+    for i, raw in enumerate(reports):
+        row, errors = clean_record(raw) if isinstance(raw, dict) else (None, ["se esperaba un objeto"])
+        if row is not None and row["id"] is not None:
+            if row["id"] > MAX_REPORT_ID:
+                row, errors = None, [f"id: como máximo {MAX_REPORT_ID}"]
+            elif row["id"] in seen_ids:
+                row, errors = None, ["id: repetido en la petición"]
+            else:
+                seen_ids.add(row["id"])
+        if row is None:
+            rejected.append({"index": i, "errors": errors})
+        else:
+            rows.append(row)
+    return rows, rejected
+
+
+# Escritura de reportes: solo con INGEST_ENABLED, una clave configurada y la cabecera X-Ingest-Token correcta
+def ingest_auth(request: Request) -> None:
+    if not (INGEST_ENABLED and INGEST_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-ingest-token", ""), INGEST_TOKEN):
+        raise HTTPException(status_code=403, detail="X-Ingest-Token inválido")
+
+
+# Ingesta en vivo: valida con las reglas del ETL y espera el commit agrupado del escritor único.
+# Las filas inválidas se informan por índice; las válidas se guardan igual (201) salvo que ninguna lo sea (422).
+# Cada petición se confirma o se rechaza entera (409 si un id ya existe) sin afectar a las demás del lote
+@app.post("/reports", status_code=201, dependencies=[Depends(ingest_auth)])
+async def ingest_reports(reports: List[Any] = Body(...)) -> Dict[str, Any]:
+    if len(reports) > INGEST_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"Máximo {INGEST_MAX_BATCH} reportes por petición")
+    # En un hilo para no frenar el event loop con lotes grandes
+    with span("validate") as s:
+        rows, rejected = await run_in_threadpool(_validate_reports, reports)
+        s.set(rows=len(rows), rejected=len(rejected))
+    if not rows:
+        raise HTTPException(status_code=422, detail={"accepted": 0, "rejected": rejected})
+    try:
+        with span("commit_wait"):
+            ids = await report_writer.submit(rows)
+    except IngestBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except IngestUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except IngestConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "ids": e.ids})
+    except sqlite3.IntegrityError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except sqlite3.OperationalError as e:
+        # Base bloqueada u ocupada por otro proceso (p. ej. el ETL publicando): reintentable
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"accepted": len(ids), "ids": ids, "rejected": rejected}
+
+
+# Agrupa filas en bloques para no escribir al socket una vez por reporte
+EXPORT_CHUNK_ROWS = 500
+
+
+def _ndjson_chunks(rows: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    buf: List[str] = []
+    for row in rows:
+        buf.append(json.dumps(row, ensure_ascii=False))
+        if len(buf) >= EXPORT_CHUNK_ROWS:
+            yield "\n".join(buf) + "\n"
+            buf = []
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+
+def _csv_chunks(rows: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=REPORT_COLUMNS)
+    writer.writeheader()
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % EXPORT_CHUNK_ROWS == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+
+# Endpoints de diagnóstico: solo con ADMIN_TOKEN configurado y la cabecera X-Admin-Token correcta
+def admin(request: Request) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="X-Admin-Token inválido")
+
+
+@app.get("/stats/generation")
+async def stats_generation() -> Dict[str, Any]:
+    return generation_stats.summary()
+
+
+@app.get("/stats/cache")
+async def stats_cache() -> Dict[str, Any]:
+    return {"queries": query_cache.stats(), "charts": chart_cache.stats()}
+
+
+# Muestra IPs y uso por cliente: solo para administración
+@app.get("/stats/clients", dependencies=[Depends(admin)])
+async def stats_clients() -> Dict[str, Any]:
+    return fair_queue.stats()
+
+
+@app.get("/stats/ingest")
+async def stats_ingest() -> Dict[str, Any]:
+    return report_writer.stats()
+
+
+@app.get("/stats/llm")
+async def stats_llm() -> Dict[str, Any]:
+    return {**llm_router.stats(), "degraded": dict(fallback_counts)}
+
+
+@app.get("/admin/traces", dependencies=[Depends(admin)])
+async def admin_traces(limit: int = Query(50, ge=1, le=1000), min_ms: float = 0.0) -> Dict[str, Any]:
+    return {"enabled": TRACE_ENABLED, "traces": trace_store.recent(limit, min_ms)}
+
+
+@app.get("/admin/traces/{trace_id}", dependencies=[Depends(admin)])
+async def admin_trace(trace_id: str) -> Dict[str, Any]:
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Traza no encontrada (ya salió del búfer o es de otro worker)")
+    return trace
+
+
+@app.get("/admin/slow", dependencies=[Depends(admin)])
+async def admin_slow() -> Dict[str, Any]:
+    return {"threshold_ms": trace_store.slow_ms, "requests": trace_store.slow()}
+
+
+# Perfil por muestreo del worker que atiende la petición, en formato collapsed (flamegraph.pl, speedscope)
+@app.post("/admin/profile", dependencies=[Depends(admin)])
+async def admin_profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    idle: bool = False,
+) -> Response:
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    try:
+        # En un hilo aparte: el event loop sigue atendiendo (y aparece en las muestras)
+        folded, meta = await asyncio.to_thread(profiler.profile, seconds, interval_ms / 1000.0, idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(
+        content=folded,
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{os.getpid()}.folded"',
+            "X-Profile-Samples": str(meta["samples"]),
+            "X-Profile-Stacks": str(meta["stacks"]),
+        },
+    )
 
 
 @app.get("/status")
-async def status() -> Dict[str, str]:
-    return {"status": "ok"}
\ No newline at end of file
+async def status() -> JSONResponse:
+    if not _startup["ready"]:
+        return JSONResponse({"status": "warming"}, status_code=503)
+    return JSONResponse({"status": "ok", "startup": {k: v for k, v in _startup.items() if k != "ready"}})
\ No newline at end of file
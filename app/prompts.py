@@ -15,9 +15,11 @@ SYSTEM = (
 def render_contexts(contexts: List[Dict]) -> str:
     lines = []
     for c in contexts:
+        # Un contexto puede representar un grupo de reportes casi idénticos (ver retrieval.search_reports)
+        similares = f" similares={c['cluster_size']}" if (c.get("cluster_size") or 1) > 1 else ""
         line = (
             f"- id={c['id']} fecha={c['fecha_reporte']} ciudad={c['ciudad']} "
-            f"categoria={c['categoria_problema']} urgente={c['urgente']}: {c['comentario']}"
+            f"categoria={c['categoria_problema']} urgente={c['urgente']}{similares}: {c['comentario']}"
         )
         lines.append(line)
     return "\n".join(lines)
@@ -30,6 +32,7 @@ def build_prompt(contexts: List[Dict], question: str, stats_lines: Optional[List
         "Responde ÚNICAMENTE en español y limita tus afirmaciones al Contexto anterior cuando esté disponible. "
         "Usa también las Estadísticas agregadas si están presentes para respaldar números. "
         "Devuelve hallazgos y conclusiones basadas en ese Contexto y cita IDs solo si aplica. "
+        "Una línea con similares=N resume N reportes casi idénticos; tenlo en cuenta al estimar su peso. "
         "No repitas los encabezados 'Contexto:' ni 'Pregunta:' ni el contenido del prompt; "
         "entrega la respuesta directamente en un párrafo o lista concisa."
     )
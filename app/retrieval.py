@@ -1,24 +1,289 @@
 from __future__ import annotations
 
+import base64
+import calendar
+import functools
+import inspect
+import json
+import os
 import sqlite3
 import re
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
 
-from .settings import DB_PATH
+from .settings import CACHE_PATH, DB_PATH, QUERY_CACHE_MAX_BYTES, SQLITE_MMAP_BYTES, TRACE_ENABLED
+from .shared_cache import SharedCache
+from .tracing import annotate, record_sql, span
 
 
-def _connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# One read-only connection per thread (event loop + threadpool threads of each worker process),
+# kept open so the schema is parsed once and the mmap'd pages stay mapped between requests.
+_local = threading.local()
+
+
+def _open_readonly() -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    if SQLITE_MMAP_BYTES > 0:
+        conn.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_BYTES)}")
+    if TRACE_ENABLED:
+        # Every statement lands in the active request span (no-op outside traced requests)
+        conn.set_trace_callback(record_sql)
+    return conn
+
+
+def _connect() -> sqlite3.Connection:
+    inode = data_version()[0]
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.inode == inode:
+        return conn
+    if conn is not None:
+        conn.close()  # the ETL published a new file: drop the handle on the old one
+    conn = _open_readonly()
+    _local.conn = conn
+    _local.inode = inode
     return conn
 
 
+def data_version() -> Tuple[int, ...]:
+    """Identity of the DB contents: changes whenever the file or its WAL is rewritten (ETL publish, writes)."""
+    parts: List[int] = []
+    for path in (DB_PATH, f"{DB_PATH}-wal"):
+        try:
+            st = os.stat(path)
+            parts.extend([st.st_ino, st.st_mtime_ns, st.st_size])
+        except OSError:
+            parts.extend([0, 0, 0])
+    return tuple(parts)
+
+
+# Long-lived connection used only to read PRAGMA data_version, which changes when any other
+# connection commits; reopened when the file identity changes (ETL publish replaces the file).
+_watch: Dict[str, Any] = {"conn": None, "inode": None}
+_watch_lock = threading.Lock()
+
+
+def _commit_version() -> int:
+    inode = data_version()[0]
+    with _watch_lock:
+        if _watch["conn"] is None or _watch["inode"] != inode:
+            if _watch["conn"] is not None:
+                _watch["conn"].close()
+            _watch["conn"] = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+            _watch["inode"] = inode
+        return int(_watch["conn"].execute("PRAGMA data_version").fetchone()[0])
+
+
+def cache_version() -> Tuple[int, ...]:
+    """Version query_cache entries are stored under: any ETL publish or committed write changes it.
+
+    PRAGMA data_version is only comparable within one connection, so it is added only for the
+    per-process QueryCache. The SharedCache compares versions across workers and uses the file
+    identity alone, which every process computes the same way (commits grow or rewrite the WAL).
+    """
+    if isinstance(query_cache, SharedCache):
+        return data_version()
+    try:
+        return data_version() + (_commit_version(),)
+    except sqlite3.Error:
+        return data_version()
+
+
+def _estimate_bytes(value: Any) -> int:
+    """Rough in-memory size of a cached result (CPython object overheads included)."""
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(_estimate_bytes(k) + _estimate_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(_estimate_bytes(v) for v in value)
+    return 28
+
+
+class QueryCache:
+    """LRU of query results bounded by estimated bytes, cleared whenever cache_version() changes.
+
+    Each entry records its size and how long it took to compute, so stats() can report
+    the memory used and the query time saved by hits.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Tuple[Any, ...], Tuple[Any, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple[int, ...]] = None
+        self.bytes = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self.calls: Dict[str, Dict[str, int]] = {}
+
+    def _sync(self, version: Tuple[int, ...]) -> None:
+        if version != self._version:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self.bytes = 0
+            self._version = version
+
+    def get(self, key: Tuple[Any, ...], version: Tuple[int, ...]) -> Tuple[bool, Any]:
+        with self._lock:
+            self._sync(version)
+            counters = self.calls.setdefault(key[0], {"hits": 0, "misses": 0})
+            entry = self._data.get(key)
+            if entry is None:
+                counters["misses"] += 1
+                return False, None
+            self._data.move_to_end(key)
+            counters["hits"] += 1
+            self.saved_seconds += entry[2]
+            return True, entry[0]
+
+    def put(self, key: Tuple[Any, ...], version: Tuple[int, ...], value: Any, seconds: float) -> None:
+        cost = _estimate_bytes(value) + _estimate_bytes(key)
+        # A single result bigger than a quarter of the budget would just flush everything else
+        if cost > self.max_bytes // 4:
+            return
+        with self._lock:
+            if version != self._version:
+                return  # the DB changed while this result was being computed
+            if key in self._data:
+                self.bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, cost, seconds)
+            self.bytes += cost
+            while self.bytes > self.max_bytes and self._data:
+                self.bytes -= self._data.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(c["hits"] for c in self.calls.values())
+            total = hits + sum(c["misses"] for c in self.calls.values())
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": hits,
+                "misses": total - hits,
+                "hit_rate": round(hits / total, 3) if total else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "by_function": {name: dict(c) for name, c in sorted(self.calls.items())},
+            }
+
+
+# With several uvicorn workers, CACHE_PATH makes them share one SQLite-backed cache instead of a copy each
+query_cache: Any = (
+    SharedCache(CACHE_PATH, "queries", QUERY_CACHE_MAX_BYTES) if CACHE_PATH else QueryCache(QUERY_CACHE_MAX_BYTES)
+)
+
+
+def _normalize_filters(filters: Optional[Dict[str, Any]]) -> Tuple[Tuple[str, Any], ...]:
+    # Same semantics as _apply_filters: empty values are ignored, booleans compare as 0/1
+    out = []
+    for key, value in (filters or {}).items():
+        if value is None or value == "":
+            continue
+        out.append((key, int(value) if isinstance(value, bool) else value))
+    return tuple(sorted(out))
+
+
+def _cached(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Memoize a query function on (name, arguments with normalized filters) until the DB changes.
+
+    Cached results are shared between callers and must not be mutated.
+    """
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with span(fn.__name__) as s:
+            if query_cache.max_bytes <= 0:
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (fn.__name__,) + tuple(
+                _normalize_filters(v) if name == "filters" else v for name, v in bound.arguments.items()
+            )
+            version = cache_version()
+            hit, value = query_cache.get(key, version)
+            s.set(args=dict(bound.arguments), cache="hit" if hit else "miss")
+            if hit:
+                return value
+            started = time.perf_counter()
+            value = fn(*args, **kwargs)
+            query_cache.put(key, version, value, time.perf_counter() - started)
+            return value
+
+    return wrapper
+
+
 def _has_fts(conn: sqlite3.Connection) -> bool:
     cur = conn.execute(
         "SELECT sql FROM sqlite_master WHERE type='table' AND name='report_search'"
     )
     row = cur.fetchone()
-    return bool(row and row["sql"] and "using fts5" in row["sql"].lower())
+    if not (row and row["sql"] and "using fts5" in row["sql"].lower()):
+        return False
+    # With comment clusters only the per-text index (cluster_text_search) covers variant texts; any
+    # other one comes from an older ETL: LIKE until the ETL reruns (same check as app/ingest.py)
+    clustered = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='comment_clusters'").fetchone()
+    return clustered is None or "cluster_text_search" in row["sql"]
+
+
+def _has_clusters(conn: sqlite3.Connection) -> bool:
+    """True when report_search indexes the distinct texts of each comment cluster (rowid = texto_id)."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='report_search'").fetchone()
+    return bool(row and row["sql"] and "cluster_text_search" in row["sql"])
+
+
+def _is_normalized(conn: sqlite3.Connection) -> bool:
+    """True when `reports` is the compatibility view over report_facts (integer day/month keys available)."""
+    cols = {row["name"] for row in conn.execute("PRAGMA table_info(reports)")}
+    return "fecha_dia" in cols and "mes" in cols
+
+
+def _has_rollups(conn: sqlite3.Connection) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='rollup_mes_ciudad_categoria'"
+    ).fetchone()
+    return row is not None
+
+
+_ISO_DAY_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+
+def _split_date(value: Any) -> Tuple[int, int, int]:
+    # Only full ISO dates: a partial '2024-03' or free text must not become a silently wrong bound
+    m = _ISO_DAY_RE.fullmatch(str(value))
+    if m is None:
+        raise ValueError(f"Not an ISO date (YYYY-MM-DD): {value!r}")
+    y, mo, d = (int(x) for x in m.groups())
+    date(y, mo, d)  # raises ValueError for days that do not exist
+    return y, mo, d
+
+
+def _day_number(value: Any) -> int:
+    # 'YYYY-MM-DD' -> YYYYMMDD
+    y, m, d = _split_date(value)
+    return y * 10000 + m * 100 + d
+
+
+def _month_before(value: Any) -> int:
+    """YYYYMM of the last month that still has days before the exclusive bound `value`."""
+    y, m, d = _split_date(value)
+    if d > 1:
+        return y * 100 + m
+    return (y - 1) * 100 + 12 if m == 1 else y * 100 + m - 1
 
 
 def _fts_safe_query(q: str) -> str:
@@ -28,42 +293,229 @@ def _fts_safe_query(q: str) -> str:
     return s
 
 
-def _apply_filters(where: List[str], params: List[Any], filters: Optional[Dict[str, Any]]) -> None:
+# 0/1 columns that can be used as filters (and are materialized in rollup_mes_flags)
+_FLAG_FILTERS = ("zona_rural", "acceso_internet", "atencion_previa_gobierno")
+
+
+def _apply_filters(where: List[str], params: List[Any], filters: Optional[Dict[str, Any]], normalized: bool = False) -> None:
     if not filters:
         return
     if (city := filters.get("ciudad")):
-        where.append("r.ciudad = ?")
+        if normalized:
+            where.append("r.ciudad_id = (SELECT id FROM ciudades WHERE nombre = ?)")
+        else:
+            where.append("r.ciudad = ?")
         params.append(city)
     if (cat := filters.get("categoria_problema")):
-        where.append("r.categoria_problema = ?")
+        if normalized:
+            where.append("r.categoria_id = (SELECT id FROM categorias WHERE nombre = ?)")
+        else:
+            where.append("r.categoria_problema = ?")
         params.append(cat)
     if (urg := filters.get("urgente")) is not None:
         where.append("r.urgente = ?")
         params.append(int(urg))
+    # Dates: fecha_desde inclusive, fecha_antes exclusive (half-open), fecha_hasta inclusive (legacy).
+    # On the normalized schema the month key is bounded too, so month grouping can range-scan idx_reports_mes.
     if (dfrom := filters.get("fecha_desde")):
-        where.append("r.fecha_reporte >= ?")
-        params.append(dfrom)
+        if normalized:
+            where.append("r.mes >= ? AND r.fecha_dia >= ?")
+            params.extend([_day_number(dfrom) // 100, _day_number(dfrom)])
+        else:
+            where.append("r.fecha_reporte >= ?")
+            params.append(dfrom)
+    if (dbefore := filters.get("fecha_antes")):
+        if normalized:
+            where.append("r.mes <= ? AND r.fecha_dia < ?")
+            params.extend([_month_before(dbefore), _day_number(dbefore)])
+        else:
+            where.append("r.fecha_reporte < ?")
+            params.append(dbefore)
     if (dto := filters.get("fecha_hasta")):
-        where.append("r.fecha_reporte <= ?")
-        params.append(dto)
+        if normalized:
+            where.append("r.mes <= ? AND r.fecha_dia <= ?")
+            params.extend([_day_number(dto) // 100, _day_number(dto)])
+        else:
+            where.append("r.fecha_reporte <= ?")
+            params.append(dto)
+    for flag in _FLAG_FILTERS:
+        if (v := filters.get(flag)) is not None:
+            where.append(f"r.{flag} = ?")
+            params.append(int(v))
 
 
-def search_reports(query: str, k: int = 8, filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], bool]:
-    """Return top-k contexts for query; bool indicates whether FTS was used."""
-    conn = _connect()
+# Rollup table -> (filters it can answer besides urgente/month-aligned dates, columns it can group by)
+_ROLLUPS = {
+    "rollup_mes_ciudad_categoria": (("ciudad", "categoria_problema"), ("mes", "ciudad_id", "categoria_id")),
+    "rollup_mes_flags": (_FLAG_FILTERS, ("mes",)),
+}
+
+
+def _month_bounds(filters: Dict[str, Any]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """(first YYYYMM, last YYYYMM) when the date filters cover whole months, else None."""
+    lo: Optional[int] = None
+    hi: Optional[int] = None
     try:
-        used_fts = _has_fts(conn)
-        filters_params: List[Any] = []
+        if (dfrom := filters.get("fecha_desde")):
+            y, m, d = _split_date(dfrom)
+            if d != 1:
+                return None
+            lo = y * 100 + m
+        if (dbefore := filters.get("fecha_antes")):
+            if _split_date(dbefore)[2] != 1:
+                return None
+            hi = _month_before(dbefore)
+        if (dto := filters.get("fecha_hasta")):
+            y, m, d = _split_date(dto)
+            if d < calendar.monthrange(y, m)[1]:
+                return None
+            hi = min(hi, y * 100 + m) if hi is not None else y * 100 + m
+    except ValueError:
+        return None
+    return lo, hi
+
+
+def _rollup_query(
+    conn: sqlite3.Connection, filters: Optional[Dict[str, Any]], group_col: Optional[str] = None
+) -> Optional[Tuple[str, str, List[str], List[Any]]]:
+    """Plan a query against a rollup table when the filters can be answered at its grain.
+
+    Returns (table, measure expression, where, params) or None to fall back to report_facts.
+    """
+    if not _has_rollups(conn):
+        return None
+    f = {k: v for k, v in (filters or {}).items() if v is not None and v != ""}
+    bounds = _month_bounds(f)
+    if bounds is None:
+        return None
+    used = {k for k in f if k in ("ciudad", "categoria_problema") + _FLAG_FILTERS}
+    for table, (dims, groups) in _ROLLUPS.items():
+        if not used.issubset(dims) or (group_col is not None and group_col not in groups):
+            continue
         where: List[str] = []
-        _apply_filters(where, filters_params, filters)
-        where_clause = (" AND ".join(where)) if where else "1=1"
+        params: List[Any] = []
+        if (city := f.get("ciudad")):
+            where.append("r.ciudad_id = (SELECT id FROM ciudades WHERE nombre = ?)")
+            params.append(city)
+        if (cat := f.get("categoria_problema")):
+            where.append("r.categoria_id = (SELECT id FROM categorias WHERE nombre = ?)")
+            params.append(cat)
+        for flag in _FLAG_FILTERS:
+            if flag in f:
+                where.append(f"r.{flag} = ?")
+                params.append(int(f[flag]))
+        lo, hi = bounds
+        if lo is not None:
+            where.append("r.mes >= ?")
+            params.append(lo)
+        if hi is not None:
+            where.append("r.mes <= ?")
+            params.append(hi)
+        urg = f.get("urgente")
+        if urg is None:
+            measure = "r.total"
+        elif int(urg):
+            measure = "r.urgentes"
+        else:
+            measure = "r.total - r.urgentes"
+        return table, measure, where, params
+    return None
 
-        if used_fts:
-            fts_q = _fts_safe_query(query)
-            if not fts_q:
-                # If after sanitization the query is empty, skip FTS
-                used_fts = False
-            else:
+
+# Candidate clusters fetched per requested context; the extra ones let _diversify skip repeated comment groups
+DIVERSITY_POOL = 3
+
+# One row per cluster: its most recent matching report (bare column of MAX) and how many reports of the cluster match
+_CLUSTER_SELECT = "SELECT r.cluster_id AS cluster_id, r.id AS id, MAX(r.fecha_dia) AS latest, COUNT(*) AS cluster_size, cc.grupo AS grupo "
+
+
+def _diversify(rows: List[sqlite3.Row], k: int) -> List[sqlite3.Row]:
+    """Top-k of rank-ordered cluster rows, taking the best cluster of each comment group before repeating a group."""
+    seen = set()
+    first: List[int] = []
+    rest: List[int] = []
+    for i, row in enumerate(rows):
+        group = row["grupo"] if row["grupo"] is not None else -row["cluster_id"]
+        (rest if group in seen else first).append(i)
+        seen.add(group)
+    return [rows[i] for i in sorted((first + rest)[:k])]
+
+
+def _search_clusters(conn: sqlite3.Connection, query: str, k: int, filters: Optional[Dict[str, Any]], use_fts: bool) -> List[Dict[str, Any]]:
+    """Clustered retrieval: FTS ranks the distinct texts of each cluster, matching members are filtered and counted per cluster."""
+    filters = filters or {}
+    # Clusters never cross ciudad/categoria: those filters are checked once per cluster, the rest per member
+    where: List[str] = []
+    filters_params: List[Any] = []
+    if filters.get("ciudad"):
+        where.append("cc.ciudad_id = (SELECT id FROM ciudades WHERE nombre = ?)")
+        filters_params.append(filters["ciudad"])
+    if filters.get("categoria_problema"):
+        where.append("cc.categoria_id = (SELECT id FROM categorias WHERE nombre = ?)")
+        filters_params.append(filters["categoria_problema"])
+    member_filters = {key: v for key, v in filters.items() if key not in ("ciudad", "categoria_problema")}
+    _apply_filters(where, filters_params, member_filters, True)
+    where_clause = " AND ".join(where) if where else "1=1"
+    if use_fts:
+        # A cluster ranks by its best matching text and counts only the members carrying a matching
+        # text. Filters on normalized databases only use integer columns, so members are read from
+        # report_facts through idx_reports_texto; MATERIALIZED keeps bm25() inside the FTS query
+        sql = (
+            "WITH h AS MATERIALIZED (SELECT t.id AS texto_id, t.cluster_id AS cluster_id, bm25(report_search) AS score "
+            "FROM report_search JOIN cluster_texts t ON t.id = report_search.rowid WHERE report_search MATCH ?), "
+            "best AS (SELECT cluster_id, MIN(score) AS score FROM h GROUP BY cluster_id) "
+            + _CLUSTER_SELECT + "FROM h JOIN report_facts r ON r.texto_id = h.texto_id JOIN best ON best.cluster_id = h.cluster_id "
+            "JOIN comment_clusters cc ON cc.id = h.cluster_id "
+            "WHERE (" + where_clause + ") GROUP BY h.cluster_id ORDER BY best.score, cluster_size DESC LIMIT ?"
+        )
+        params = [_fts_safe_query(query)] + filters_params + [k * DIVERSITY_POOL]
+    else:
+        like = f"%{query}%"
+        sql = (
+            _CLUSTER_SELECT + "FROM reports r JOIN comment_clusters cc ON cc.id = r.cluster_id "
+            "WHERE (r.comentario LIKE ? OR r.ciudad LIKE ? OR r.categoria_problema LIKE ?) AND (" + where_clause + ") "
+            "GROUP BY r.cluster_id ORDER BY latest DESC LIMIT ?"
+        )
+        params = [like, like, like] + filters_params + [k * DIVERSITY_POOL]
+    picked = _diversify(conn.execute(sql, params).fetchall(), k)
+    if not picked:
+        return []
+    # Text columns only for the k chosen reports
+    rows = conn.execute(
+        "SELECT r.id, r.comentario, r.ciudad, r.categoria_problema, r.fecha_reporte, r.urgente FROM reports r "
+        f"WHERE r.id IN ({', '.join('?' * len(picked))})",
+        [p["id"] for p in picked],
+    ).fetchall()
+    by_id = {row["id"]: dict(row) for row in rows}
+    return [{**by_id[p["id"]], "cluster_id": p["cluster_id"], "cluster_size": p["cluster_size"]} for p in picked if p["id"] in by_id]
+
+
+@_cached
+def search_reports(query: str, k: int = 8, filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """Return top-k contexts for query; bool indicates whether FTS was used.
+
+    On clustered databases each context stands for a cluster of near-duplicate reports: the
+    most recent matching one, with `cluster_size` = how many reports of the cluster match.
+    """
+    conn = _connect()
+    used_fts = _has_fts(conn)
+    clustered = used_fts and _has_clusters(conn)
+    filters_params: List[Any] = []
+    where: List[str] = []
+    _apply_filters(where, filters_params, filters, _is_normalized(conn))
+    where_clause = (" AND ".join(where)) if where else "1=1"
+
+    if used_fts:
+        fts_q = _fts_safe_query(query)
+        if not fts_q:
+            # If after sanitization the query is empty, skip FTS
+            used_fts = False
+        else:
+            try:
+                if clustered:
+                    annotate(mode="fts_clusters")
+                    return _search_clusters(conn, query, k, filters, True), True
+                annotate(mode="fts")
                 sql_fts = (
                     "SELECT r.id, r.comentario, r.ciudad, r.categoria_problema, r.fecha_reporte, r.urgente "
                     "FROM report_search JOIN reports r ON r.id = report_search.rowid "
@@ -71,150 +523,307 @@ def search_reports(query: str, k: int = 8, filters: Optional[Dict[str, Any]] = N
                     "ORDER BY bm25(report_search) LIMIT ?"
                 )
                 params_fts = [fts_q] + filters_params + [k]
-                try:
-                    rows = conn.execute(sql_fts, params_fts).fetchall()
-                    contexts = [dict(row) for row in rows]
-                    return contexts, True
-                except sqlite3.OperationalError:
-                    # Fall through to LIKE mode
-                    used_fts = False
-
-        # Fallback LIKE across important text columns
-        like = f"%{query}%"
-        sql_like = (
-            "SELECT r.id, r.comentario, r.ciudad, r.categoria_problema, r.fecha_reporte, r.urgente "
-            "FROM reports r WHERE (r.comentario LIKE ? OR r.ciudad LIKE ? OR r.categoria_problema LIKE ?) "
-            "AND (" + where_clause + ") ORDER BY r.fecha_reporte DESC LIMIT ?"
-        )
-        params_like = [like, like, like] + filters_params + [k]
-        rows = conn.execute(sql_like, params_like).fetchall()
-        contexts = [dict(row) for row in rows]
-        return contexts, False
-    finally:
-        conn.close()
+                rows = conn.execute(sql_fts, params_fts).fetchall()
+                contexts = [dict(row) for row in rows]
+                return contexts, True
+            except sqlite3.OperationalError:
+                # Fall through to LIKE mode
+                used_fts = False
+                annotate(fts_error=True)
 
+    # Fallback LIKE across important text columns
+    if clustered:
+        annotate(mode="like_clusters")
+        return _search_clusters(conn, query, k, filters, False), False
+    annotate(mode="like")
+    like = f"%{query}%"
+    sql_like = (
+        "SELECT r.id, r.comentario, r.ciudad, r.categoria_problema, r.fecha_reporte, r.urgente "
+        "FROM reports r WHERE (r.comentario LIKE ? OR r.ciudad LIKE ? OR r.categoria_problema LIKE ?) "
+        "AND (" + where_clause + ") ORDER BY r.fecha_reporte DESC LIMIT ?"
+    )
+    params_like = [like, like, like] + filters_params + [k]
+    rows = conn.execute(sql_like, params_like).fetchall()
+    contexts = [dict(row) for row in rows]
+    return contexts, False
 
-def count_reports(filters: Optional[Dict[str, Any]] = None) -> int:
-    conn = _connect()
-    try:
-        where: List[str] = []
-        params: List[Any] = []
-        _apply_filters(where, params, filters)
-        where_clause = (" AND ".join(where)) if where else "1=1"
-        sql = "SELECT COUNT(*) AS cnt FROM reports r WHERE " + where_clause
-        row = conn.execute(sql, params).fetchone()
-        return int(row["cnt"]) if row else 0
-    finally:
-        conn.close()
 
+# Columns returned by search_page / iter_search (the original dataset schema)
+REPORT_COLUMNS = (
+    "id", "nombre", "edad", "genero", "ciudad", "comentario", "categoria_problema", "nivel_urgencia",
+    "urgente", "fecha_reporte", "acceso_internet", "atencion_previa_gobierno", "zona_rural",
+)
 
-def count_reports_by_city(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-    conn = _connect()
+# Result orders for search_page/iter_search: by FTS relevance (bm25, id) or newest first (day, id)
+SEARCH_ORDERS = ("relevancia", "fecha")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order: str, key: Tuple[Any, int]) -> str:
+    raw = json.dumps({"o": order, "k": list(key)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, order: str) -> Tuple[Any, int]:
     try:
-        where: List[str] = []
-        params: List[Any] = []
-        _apply_filters(where, params, filters)
-        where_clause = (" AND ".join(where)) if where else "1=1"
-        sql = (
-            "SELECT r.ciudad AS ciudad, COUNT(*) AS cnt FROM reports r WHERE "
-            + where_clause
-            + " GROUP BY r.ciudad ORDER BY cnt DESC"
-        )
-        rows = conn.execute(sql, params).fetchall()
-        return [{"ciudad": row["ciudad"], "count": int(row["cnt"])} for row in rows]
-    finally:
-        conn.close()
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        sort_value, last_id = data["k"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Cursor inválido") from e
+    if data.get("o") != order:
+        raise InvalidCursor("El cursor pertenece a otro orden")
+    return sort_value, int(last_id)
 
 
-def count_reports_by_category(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+def _search_plan(
+    conn: sqlite3.Connection, query: str, filters: Optional[Dict[str, Any]], order: str
+) -> Tuple[str, List[Any], str]:
+    """Inner SELECT for search_page/iter_search plus the effective order.
+
+    Returns (sql, params, order). The SELECT exposes REPORT_COLUMNS plus `sort_key`;
+    relevance falls back to date order when FTS is unavailable or the query is empty.
+    """
+    normalized = _is_normalized(conn)
+    where: List[str] = []
+    params: List[Any] = []
+    _apply_filters(where, params, filters, normalized)
+    cols = ", ".join(f"r.{c}" for c in REPORT_COLUMNS)
+    date_col = "r.fecha_dia" if normalized else "r.fecha_reporte"
+    fts_q = _fts_safe_query(query or "")
+    if fts_q and _has_fts(conn):
+        # Clustered FTS indexes each distinct text of a cluster once: a report matches when it carries that text
+        join = "r.texto_id" if _has_clusters(conn) else "r.id"
+        if order == "relevancia":
+            # bm25() is only valid in the FTS query itself: rank inside, page on the outside
+            sql = (
+                f"SELECT {cols}, bm25(report_search) AS sort_key FROM report_search "
+                f"JOIN reports r ON {join} = report_search.rowid WHERE report_search MATCH ?"
+            )
+        else:
+            sql = (
+                f"SELECT {cols}, {date_col} AS sort_key FROM report_search "
+                f"JOIN reports r ON {join} = report_search.rowid WHERE report_search MATCH ?"
+            )
+        params.insert(0, fts_q)
+    else:
+        order = "fecha"
+        sql = f"SELECT {cols}, {date_col} AS sort_key FROM reports r WHERE 1=1"
+        if query and query.strip():
+            like = f"%{query.strip()}%"
+            where.insert(0, "(r.comentario LIKE ? OR r.ciudad LIKE ? OR r.categoria_problema LIKE ?)")
+            params[0:0] = [like, like, like]
+    if where:
+        sql += " AND " + " AND ".join(where)
+    return sql, params, order
+
+
+def _keyset_sql(inner: str, params: List[Any], order: str, after: Optional[Tuple[Any, int]]) -> Tuple[str, List[Any]]:
+    params = list(params)
+    if order == "relevancia":
+        # Best bm25 first (lower is better), ties by ascending id
+        sql = f"SELECT * FROM ({inner}) t"
+        if after is not None:
+            sql += " WHERE t.sort_key > ? OR (t.sort_key = ? AND t.id > ?)"
+            params.extend([after[0], after[0], after[1]])
+        return sql + " ORDER BY t.sort_key ASC, t.id ASC", params
+    # Newest first; the leading <= bound lets SQLite range-scan the date index
+    sql = f"SELECT * FROM ({inner}) t"
+    if after is not None:
+        sql += " WHERE t.sort_key <= ? AND (t.sort_key < ? OR t.id < ?)"
+        params.extend([after[0], after[0], after[1]])
+    return sql + " ORDER BY t.sort_key DESC, t.id DESC", params
+
+
+def _row_out(row: sqlite3.Row) -> Dict[str, Any]:
+    return {c: row[c] for c in REPORT_COLUMNS}
+
+
+def search_page(
+    query: str = "",
+    filters: Optional[Dict[str, Any]] = None,
+    order: str = "relevancia",
+    limit: int = 100,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """One page of matching reports with keyset pagination (no OFFSET): cost per page is independent of depth.
+
+    `cursor` is the `next_cursor` of the previous page; None when there are no more rows.
+    """
     conn = _connect()
+    inner, params, order = _search_plan(conn, query, filters, order)
+    after = decode_cursor(cursor, order) if cursor else None
+    sql, params = _keyset_sql(inner, params, order, after)
+    rows = conn.execute(sql + " LIMIT ?", params + [limit + 1]).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(order, (rows[-1]["sort_key"], rows[-1]["id"])) if more and rows else None
+    return {"items": [_row_out(r) for r in rows], "order": order, "next_cursor": next_cursor}
+
+
+def iter_search(query: str = "", filters: Optional[Dict[str, Any]] = None, order: str = "fecha") -> Iterator[Dict[str, Any]]:
+    """Stream every matching report from a server-side cursor (constant memory).
+
+    Uses its own connection: the generator may be resumed from different threads and keeps one
+    read snapshot for the whole export.
+    """
+    conn = _open_readonly()
     try:
-        where: List[str] = []
-        params: List[Any] = []
-        _apply_filters(where, params, filters)
-        where_clause = (" AND ".join(where)) if where else "1=1"
-        sql = (
-            "SELECT r.categoria_problema AS categoria, COUNT(*) AS cnt FROM reports r WHERE "
-            + where_clause
-            + " GROUP BY r.categoria_problema ORDER BY cnt DESC"
-        )
-        rows = conn.execute(sql, params).fetchall()
-        return [{"categoria": row["categoria"], "count": int(row["cnt"])} for row in rows]
+        inner, params, order = _search_plan(conn, query, filters, order)
+        sql, params = _keyset_sql(inner, params, order, None)
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(500)
+            if not rows:
+                break
+            for row in rows:
+                yield _row_out(row)
     finally:
         conn.close()
 
 
-def count_urgent_reports(filters: Optional[Dict[str, Any]] = None) -> int:
+# Group-by dimensions: (text column in reports, integer key in report_facts, dimension table, output key)
+_GROUP_DIMS = {
+    "ciudad": ("ciudad", "ciudad_id", "ciudades", "ciudad"),
+    "categoria": ("categoria_problema", "categoria_id", "categorias", "categoria"),
+}
+
+
+@_cached
+def _count(filters: Optional[Dict[str, Any]]) -> int:
     conn = _connect()
-    try:
-        where: List[str] = []
-        params: List[Any] = []
-        # Force urgente=1 in filters copy
-        f = dict(filters) if filters else {}
-        f["urgente"] = True
-        _apply_filters(where, params, f)
+    if (plan := _rollup_query(conn, filters)) is not None:
+        table, measure, where, params = plan
         where_clause = (" AND ".join(where)) if where else "1=1"
-        sql = "SELECT COUNT(*) AS cnt FROM reports r WHERE " + where_clause
-        row = conn.execute(sql, params).fetchone()
+        row = conn.execute(f"SELECT COALESCE(SUM({measure}), 0) AS cnt FROM {table} r WHERE " + where_clause, params).fetchone()
         return int(row["cnt"]) if row else 0
-    finally:
-        conn.close()
+    where: List[str] = []
+    params: List[Any] = []
+    normalized = _is_normalized(conn)
+    _apply_filters(where, params, filters, normalized)
+    where_clause = (" AND ".join(where)) if where else "1=1"
+    # On the normalized schema count straight from the fact table (no dimension joins)
+    source = "report_facts r" if normalized else "reports r"
+    sql = "SELECT COUNT(*) AS cnt FROM " + source + " WHERE " + where_clause
+    row = conn.execute(sql, params).fetchone()
+    return int(row["cnt"]) if row else 0
 
 
-def count_urgent_by_city(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+@_cached
+def _count_by(filters: Optional[Dict[str, Any]], dim: str) -> List[Dict[str, Any]]:
+    text_col, key_col, table, out_key = _GROUP_DIMS[dim]
     conn = _connect()
-    try:
-        where: List[str] = []
-        params: List[Any] = []
-        f = dict(filters) if filters else {}
-        f["urgente"] = True
-        _apply_filters(where, params, f)
+    if (plan := _rollup_query(conn, filters, key_col)) is not None:
+        rollup, measure, where, params = plan
         where_clause = (" AND ".join(where)) if where else "1=1"
         sql = (
-            "SELECT r.ciudad AS ciudad, COUNT(*) AS cnt FROM reports r WHERE "
+            f"SELECT d.nombre AS label, t.cnt AS cnt FROM ("
+            f"SELECT r.{key_col} AS key_id, SUM({measure}) AS cnt FROM {rollup} r WHERE "
             + where_clause
-            + " GROUP BY r.ciudad ORDER BY cnt DESC"
+            + f" GROUP BY r.{key_col}) t JOIN {table} d ON d.id = t.key_id WHERE t.cnt > 0 ORDER BY cnt DESC, label ASC"
         )
         rows = conn.execute(sql, params).fetchall()
-        return [{"ciudad": row["ciudad"], "count": int(row["cnt"])} for row in rows]
-    finally:
-        conn.close()
+        return [{out_key: row["label"], "count": int(row["cnt"])} for row in rows]
+    where: List[str] = []
+    params: List[Any] = []
+    normalized = _is_normalized(conn)
+    _apply_filters(where, params, filters, normalized)
+    where_clause = (" AND ".join(where)) if where else "1=1"
+    if normalized:
+        # Aggregate on integer keys, decode names only for the (few) resulting groups
+        sql = (
+            f"SELECT d.nombre AS label, t.cnt AS cnt FROM ("
+            f"SELECT r.{key_col} AS key_id, COUNT(*) AS cnt FROM report_facts r WHERE "
+            + where_clause
+            + f" GROUP BY r.{key_col}) t JOIN {table} d ON d.id = t.key_id ORDER BY cnt DESC, label ASC"
+        )
+    else:
+        sql = (
+            f"SELECT r.{text_col} AS label, COUNT(*) AS cnt FROM reports r WHERE "
+            + where_clause
+            + f" GROUP BY r.{text_col} ORDER BY cnt DESC, label ASC"
+        )
+    rows = conn.execute(sql, params).fetchall()
+    return [{out_key: row["label"], "count": int(row["cnt"])} for row in rows]
+
+
+def _urgent(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # Force urgente=1 in filters copy
+    f = dict(filters) if filters else {}
+    f["urgente"] = True
+    return f
+
+
+def count_reports(filters: Optional[Dict[str, Any]] = None) -> int:
+    return _count(filters)
+
+
+def count_reports_by_city(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    return _count_by(filters, "ciudad")
+
+
+def count_reports_by_category(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    return _count_by(filters, "categoria")
+
+
+def count_urgent_reports(filters: Optional[Dict[str, Any]] = None) -> int:
+    return _count(_urgent(filters))
+
+
+def count_urgent_by_city(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    return _count_by(_urgent(filters), "ciudad")
 
 
 def count_urgent_by_category(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    return _count_by(_urgent(filters), "categoria")
+
+
+@_cached
+def monthly_counts(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Counts grouped by YYYY-MM month (stored, indexed month key on the normalized schema)."""
     conn = _connect()
-    try:
-        where: List[str] = []
-        params: List[Any] = []
-        f = dict(filters) if filters else {}
-        f["urgente"] = True
-        _apply_filters(where, params, f)
+    if (plan := _rollup_query(conn, filters, "mes")) is not None:
+        rollup, measure, where, params = plan
         where_clause = (" AND ".join(where)) if where else "1=1"
         sql = (
-            "SELECT r.categoria_problema AS categoria, COUNT(*) AS cnt FROM reports r WHERE "
+            f"SELECT r.mes AS mes_num, SUM({measure}) AS cnt FROM {rollup} r WHERE "
             + where_clause
-            + " GROUP BY r.categoria_problema ORDER BY cnt DESC"
+            + " GROUP BY r.mes HAVING cnt > 0 ORDER BY r.mes ASC"
         )
         rows = conn.execute(sql, params).fetchall()
-        return [{"categoria": row["categoria"], "count": int(row["cnt"])} for row in rows]
-    finally:
-        conn.close()
-
-
-def monthly_counts(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-    """Counts grouped by YYYY-MM month based on fecha_reporte string (first 7 chars)."""
-    conn = _connect()
-    try:
-        where: List[str] = []
-        params: List[Any] = []
-        _apply_filters(where, params, filters)
-        where_clause = (" AND ".join(where)) if where else "1=1"
+        return [{"mes": f"{row['mes_num'] // 100:04d}-{row['mes_num'] % 100:02d}", "count": int(row["cnt"])} for row in rows]
+    where: List[str] = []
+    params: List[Any] = []
+    normalized = _is_normalized(conn)
+    _apply_filters(where, params, filters, normalized)
+    where_clause = (" AND ".join(where)) if where else "1=1"
+    if normalized:
         sql = (
-            "SELECT substr(r.fecha_reporte, 1, 7) AS mes, COUNT(*) AS cnt FROM reports r WHERE "
+            "SELECT r.mes AS mes_num, COUNT(*) AS cnt FROM report_facts r WHERE "
             + where_clause
-            + " GROUP BY mes ORDER BY mes ASC"
+            + " GROUP BY r.mes ORDER BY r.mes ASC"
         )
         rows = conn.execute(sql, params).fetchall()
-        return [{"mes": row["mes"], "count": int(row["cnt"])} for row in rows]
-    finally:
-        conn.close()
+        return [{"mes": f"{row['mes_num'] // 100:04d}-{row['mes_num'] % 100:02d}", "count": int(row["cnt"])} for row in rows]
+    sql = (
+        "SELECT substr(r.fecha_reporte, 1, 7) AS mes, COUNT(*) AS cnt FROM reports r WHERE "
+        + where_clause
+        + " GROUP BY mes ORDER BY mes ASC"
+    )
+    rows = conn.execute(sql, params).fetchall()
+    return [{"mes": row["mes"], "count": int(row["cnt"])} for row in rows]
+
+
+_entity_cache: Dict[str, Any] = {"version": None, "ciudades": [], "categorias": []}
+
+
+def entity_names() -> Tuple[List[str], List[str]]:
+    """(cities, categories) present in the DB, most frequent first; recomputed only when data_version() changes."""
+    version = data_version()
+    if _entity_cache["version"] != version:
+        _entity_cache["ciudades"] = [c["ciudad"] for c in count_reports_by_city(None) if c["ciudad"]]
+        _entity_cache["categorias"] = [c["categoria"] for c in count_reports_by_category(None) if c["categoria"]]
+        _entity_cache["version"] = version
+    return _entity_cache["ciudades"], _entity_cache["categorias"]
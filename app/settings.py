@@ -1,4 +1,8 @@
 import os
+import time
+
+# Primer módulo de la app en importarse: referencia para medir el arranque en frío
+APP_IMPORT_STARTED = time.perf_counter()
 
 DB_PATH = os.getenv("DB_PATH", "data/db/reports.sqlite")
 LLM_URL = os.getenv("LLM_URL", "http://localhost:8081")
@@ -7,4 +11,71 @@ N_PREDICT = int(os.getenv("N_PREDICT", "80"))
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.2"))
 TOP_K = int(os.getenv("TOP_K", "40"))
 TOP_P = float(os.getenv("TOP_P", "0.9"))
-LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "180"))
\ No newline at end of file
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "180"))
+# Réplicas de llama.cpp separadas por comas (por defecto solo LLM_URL)
+LLM_URLS = [u.strip() for u in os.getenv("LLM_URLS", LLM_URL).split(",") if u.strip()]
+LLM_HEALTH_INTERVAL_SECONDS = float(os.getenv("LLM_HEALTH_INTERVAL_SECONDS", "5"))
+# Copia de la petición en otra réplica libre si la primera no responde en este tiempo (0 = desactivado)
+LLM_HEDGE_SECONDS = float(os.getenv("LLM_HEDGE_SECONDS", "20"))
+# Expulsión temporal tras N fallos (o respuestas más lentas que LLM_SLOW_SECONDS) seguidos
+LLM_EJECT_FAILURES = int(os.getenv("LLM_EJECT_FAILURES", "3"))
+LLM_EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", "30"))
+LLM_SLOW_SECONDS = float(os.getenv("LLM_SLOW_SECONDS", "90"))
+# Afinidad por prefijo del prompt: caracteres usados y holgura de carga antes de desviarse
+LLM_AFFINITY_CHARS = int(os.getenv("LLM_AFFINITY_CHARS", "512"))
+LLM_AFFINITY_SLACK = int(os.getenv("LLM_AFFINITY_SLACK", "1"))
+# Modo degradado: plazo total de /ask (0 = solo LLM_TIMEOUT_SECONDS) y peticiones en cola que lo activan (0 = sin límite)
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))
+LLM_QUEUE_THRESHOLD = int(os.getenv("LLM_QUEUE_THRESHOLD", "4"))
+# Límite por cliente (X-API-Key de API_KEY_WEIGHTS o IP) para /ask: token bucket por minuto con ráfaga (0 = sin límite)
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+# Cola justa hacia el LLM: turnos simultáneos (0 = uno por réplica), espera máxima por cliente y pesos "clave:peso,..."
+FAIR_QUEUE_SLOTS = int(os.getenv("FAIR_QUEUE_SLOTS", "0"))
+FAIR_QUEUE_MAX_PER_CLIENT = int(os.getenv("FAIR_QUEUE_MAX_PER_CLIENT", "8"))
+API_KEY_WEIGHTS = os.getenv("API_KEY_WEIGHTS", "")
+# Proxies (IPs o redes CIDR, separadas por comas) de los que se acepta X-Forwarded-For para saber la IP del cliente.
+# Detrás de Docker o de un proxy inverso, sin esto todos los anónimos comparten la IP del proxy y un solo bucket
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+# Presupuestos de generación por tipo de pregunta (N_PREDICT es el de preguntas generales)
+N_PREDICT_NUMERIC = int(os.getenv("N_PREDICT_NUMERIC", "48"))
+N_PREDICT_SUMMARY = int(os.getenv("N_PREDICT_SUMMARY", "192"))
+N_PREDICT_MAX = int(os.getenv("N_PREDICT_MAX", "384"))
+# Ventana de contexto del servidor llama.cpp (-c en docker-compose)
+LLM_CTX_TOKENS = int(os.getenv("LLM_CTX_TOKENS", "4096"))
+# Fecha "hoy" para expresiones relativas ("el año pasado"); vacío = fecha actual del sistema
+FECHA_REFERENCIA = os.getenv("FECHA_REFERENCIA", "")
+# Gráficas bajo demanda: procesos para dibujar y tamaño de la LRU de resultados
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "128"))
+# Caché de resultados de retrieval (bytes estimados; 0 la desactiva)
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Archivo SQLite de caché compartido entre workers (vacío = caché en memoria de cada proceso)
+CACHE_PATH = os.getenv("CACHE_PATH", "")
+# mmap de las conexiones de solo lectura a DB_PATH (0 = lectura normal)
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+# Ingesta en vivo (POST /reports): un solo escritor por proceso que confirma por lotes; desactivada por defecto
+INGEST_ENABLED = os.getenv("INGEST_ENABLED", "0") not in ("0", "false", "False", "")
+# Clave de POST /reports (cabecera X-Ingest-Token); si no se define se usa ADMIN_TOKEN. Sin ninguna, el endpoint no existe
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "") or os.getenv("ADMIN_TOKEN", "")
+# Procesos de uvicorn (--workers); la ingesta exige uno solo: el escritor único es por proceso
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "2000"))  # filas por transacción como máximo
+INGEST_FLUSH_MS = float(os.getenv("INGEST_FLUSH_MS", "50"))  # espera máxima antes de confirmar un lote
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "50000"))  # filas en memoria; más -> 503
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "1000"))  # filas por petición
+# Trazas por petición (spans por etapa con su SQL); desactivadas por defecto
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") not in ("0", "false", "False", "")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))  # últimas trazas consultables en /admin/traces
+# Peticiones trazadas que superan SLOW_REQUEST_MS (0 = ninguna) se guardan completas en /admin/slow y en SLOW_LOG_PATH (JSONL, opcional)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "5000"))
+SLOW_LOG_SIZE = int(os.getenv("SLOW_LOG_SIZE", "50"))
+SLOW_LOG_PATH = os.getenv("SLOW_LOG_PATH", "")
+# Clave de los endpoints /admin (cabecera X-Admin-Token); vacía = desactivados
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# Nivel de los logs de la app (módulos app.*): DEBUG, INFO, WARNING...
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Calentamiento al arrancar (SQLite, FTS y una completion mínima al LLM)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "False", "")
+LLM_WARMUP_TIMEOUT_SECONDS = float(os.getenv("LLM_WARMUP_TIMEOUT_SECONDS", "60"))
\ No newline at end of file
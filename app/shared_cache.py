@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    cost INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries(namespace, last_used);
+CREATE TABLE IF NOT EXISTS cache_versions (
+    namespace TEXT PRIMARY KEY,
+    version TEXT NOT NULL
+);
+"""
+
+# Los aciertos solo actualizan last_used si el valor guardado es más viejo que esto (evita una escritura por lectura)
+TOUCH_INTERVAL_SECONDS = 5.0
+
+
+class SharedCache:
+    """Caché en un archivo SQLite compartido por todos los workers de uvicorn.
+
+    Misma interfaz que retrieval.QueryCache (get/put/clear/stats). Cada `namespace` tiene su
+    propia versión de datos: al cambiar se borran sus entradas. Los valores se guardan con
+    pickle; el archivo es local y solo lo escriben los procesos de la API.
+    """
+
+    def __init__(self, path: str, namespace: str, max_bytes: int) -> None:
+        self.path = path
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.calls: Dict[str, Dict[str, int]] = {}
+        self.saved_seconds = 0.0
+        self.errors = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # es una caché: perderla en un corte no importa
+            conn.executescript(SCHEMA_SQL)
+            self._local.conn = conn
+        return conn
+
+    def _tally(self, name: str, field: str) -> None:
+        with self._lock:
+            self.calls.setdefault(name, {"hits": 0, "misses": 0})[field] += 1
+
+    def _sync(self, conn: sqlite3.Connection, version: str) -> bool:
+        """True si la versión guardada coincide; si no, borra el namespace y registra la nueva."""
+        row = conn.execute("SELECT version FROM cache_versions WHERE namespace = ?", (self.namespace,)).fetchone()
+        if row is not None and row[0] == version:
+            return True
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT version FROM cache_versions WHERE namespace = ?", (self.namespace,)).fetchone()
+            if row is None or row[0] != version:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+                conn.execute("INSERT OR REPLACE INTO cache_versions(namespace, version) VALUES (?, ?)", (self.namespace, version))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return False
+
+    def get(self, key: Tuple[Any, ...], version: Tuple[int, ...]) -> Tuple[bool, Any]:
+        name = str(key[0])
+        try:
+            conn = self._conn()
+            if not self._sync(conn, repr(version)):
+                self._tally(name, "misses")
+                return False, None
+            row = conn.execute(
+                "SELECT value, seconds, last_used FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, repr(key)),
+            ).fetchone()
+            if row is None:
+                self._tally(name, "misses")
+                return False, None
+            now = time.time()
+            if now - row[2] > TOUCH_INTERVAL_SECONDS:
+                conn.execute(
+                    "UPDATE cache_entries SET last_used = ? WHERE namespace = ? AND key = ?", (now, self.namespace, repr(key))
+                )
+            value = pickle.loads(row[0])
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError):
+            # La caché nunca debe tumbar una consulta: se trata como fallo de caché
+            self.errors += 1
+            self._tally(name, "misses")
+            return False, None
+        self._tally(name, "hits")
+        with self._lock:
+            self.saved_seconds += row[1]
+        return True, value
+
+    def put(self, key: Tuple[Any, ...], version: Tuple[int, ...], value: Any, seconds: float) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        cost = len(blob)
+        if cost > self.max_bytes // 4:
+            return
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT version FROM cache_versions WHERE namespace = ?", (self.namespace,)).fetchone()
+            if row is None or row[0] != repr(version):
+                return  # la base cambió mientras se calculaba el resultado
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries(namespace, key, value, cost, seconds, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.namespace, repr(key), blob, cost, seconds, time.time()),
+                )
+                total = conn.execute("SELECT COALESCE(SUM(cost), 0) FROM cache_entries WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+                if total > self.max_bytes:
+                    # Desaloja las menos usadas hasta volver al presupuesto
+                    excess = total - self.max_bytes
+                    rows = conn.execute(
+                        "SELECT key, cost FROM cache_entries WHERE namespace = ? ORDER BY last_used ASC", (self.namespace,)
+                    ).fetchall()
+                    victims = []
+                    for k, c in rows:
+                        if excess <= 0:
+                            break
+                        victims.append((self.namespace, k))
+                        excess -= c
+                    conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            self.errors += 1
+
+    def clear(self) -> None:
+        try:
+            self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        entries: Optional[int] = None
+        size: Optional[int] = None
+        try:
+            entries, size = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(cost), 0) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+        with self._lock:
+            hits = sum(c["hits"] for c in self.calls.values())
+            total = hits + sum(c["misses"] for c in self.calls.values())
+            return {
+                "shared_path": self.path,
+                "pid": os.getpid(),
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                # Aciertos/fallos y tiempo ahorrado son de este worker; entradas y bytes, de todos
+                "hits": hits,
+                "misses": total - hits,
+                "hit_rate": round(hits / total, 3) if total else None,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "errors": self.errors,
+                "by_function": {name: dict(c) for name, c in sorted(self.calls.items())},
+            }
@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .settings import SLOW_LOG_PATH, SLOW_LOG_SIZE, SLOW_REQUEST_MS, TRACE_BUFFER_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Máximo de sentencias SQL guardadas por span y de caracteres por sentencia
+MAX_SQL_PER_SPAN = 20
+MAX_SQL_CHARS = 2000
+
+_current: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+
+class Span:
+    """Etapa medida de una petición. Los hijos y el SQL se agregan mientras está activa."""
+
+    __slots__ = ("name", "attrs", "children", "sql", "started", "seconds", "_token")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.children: List[Span] = []
+        self.sql: List[str] = []
+        self.started = time.perf_counter()
+        self.seconds: Optional[float] = None
+        self._token = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.seconds = time.perf_counter() - self.started
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _current.reset(self._token)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 2),
+            "ms": round(self.seconds * 1000, 2) if self.seconds is not None else None,
+            **self.attrs,
+        }
+        if self.sql:
+            out["sql"] = self.sql
+        if self.children:
+            out["children"] = [c.to_dict(origin) for c in self.children]
+        return out
+
+
+class _NoSpan:
+    """Sustituto sin costo cuando la petición no se está trazando."""
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name: str, **attrs: Any) -> Any:
+    """Abre un span hijo del actual: `with span("search") as s: ...; s.set(used_fts=True)`."""
+    parent = _current.get()
+    if parent is None:
+        return NO_SPAN
+    child = Span(name, attrs)
+    parent.children.append(child)
+    return child
+
+
+def add_span(name: str, seconds: float, **attrs: Any) -> None:
+    """Agrega un span ya terminado (p. ej. una espera medida a mano) al span actual."""
+    parent = _current.get()
+    if parent is not None:
+        child = Span(name, attrs)
+        child.started -= seconds
+        child.seconds = seconds
+        parent.children.append(child)
+
+
+def annotate(**attrs: Any) -> None:
+    """Agrega atributos al span actual (si hay traza)."""
+    current = _current.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def record_sql(statement: str) -> None:
+    """Callback de sqlite3 (set_trace_callback): guarda el SQL ejecutado en el span actual."""
+    current = _current.get()
+    if current is not None and len(current.sql) < MAX_SQL_PER_SPAN:
+        current.sql.append(" ".join(statement.split())[:MAX_SQL_CHARS])
+
+
+class TraceStore:
+    """Últimas trazas completas y registro de peticiones lentas (memoria acotada, por proceso)."""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE, slow_ms: float = SLOW_REQUEST_MS, slow_size: int = SLOW_LOG_SIZE, slow_path: str = SLOW_LOG_PATH) -> None:
+        self.size = size
+        self.slow_ms = slow_ms
+        self.slow_path = slow_path
+        self._recent: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=max(1, slow_size))
+        self._ids = itertools.count(1)
+        self._prefix = f"{os.getpid():x}"
+        self._lock = threading.Lock()
+        # El JSONL lo escribe un hilo propio: add() corre en el event loop y no debe tocar el disco
+        self._slow_queue: "queue.SimpleQueue[Dict[str, Any]]" = queue.SimpleQueue()
+        self._slow_writer: Optional[threading.Thread] = None
+
+    def new_id(self) -> str:
+        # El pid distingue las trazas de cada worker
+        return f"{self._prefix}-{next(self._ids):x}"
+
+    def add(self, trace: Dict[str, Any]) -> None:
+        with self._lock:
+            self._recent[trace["id"]] = trace
+            while len(self._recent) > self.size:
+                self._recent.popitem(last=False)
+            slow = self.slow_ms > 0 and trace["ms"] >= self.slow_ms
+            if slow:
+                self._slow.append(trace)
+        if slow:
+            stages = ", ".join(f"{s['name']}={s['ms']}ms" for s in trace["spans"])
+            logger.warning("Petición lenta %s: %s %s %s ms (%s)", trace["id"], trace["method"], trace["path"], trace["ms"], stages)
+            if self.slow_path:
+                self._slow_queue.put(trace)
+                with self._lock:
+                    if self._slow_writer is None:
+                        self._slow_writer = threading.Thread(target=self._write_slow_log, name="slow-log", daemon=True)
+                        self._slow_writer.start()
+
+    def _write_slow_log(self) -> None:
+        while True:
+            traces = [self._slow_queue.get()]
+            # Lo que se haya acumulado mientras tanto va en la misma apertura del archivo
+            while True:
+                try:
+                    traces.append(self._slow_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.slow_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(t, ensure_ascii=False) + "\n" for t in traces)
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning("No se pudieron guardar %d peticiones lentas en %s (%r)", len(traces), self.slow_path, e)
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._recent.get(trace_id)
+
+    def recent(self, limit: int, min_ms: float = 0.0) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = [t for t in reversed(self._recent.values()) if t["ms"] >= min_ms][:limit]
+        return [{k: t[k] for k in ("id", "method", "path", "status", "ms", "started")} for t in traces]
+
+    def slow(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(reversed(self._slow))
+
+
+trace_store = TraceStore()
+
+
+class TraceMiddleware:
+    """Middleware ASGI: una traza por petición HTTP, con los spans de sus etapas.
+
+    Agrega `X-Trace-Id` y `Server-Timing` (etapas de primer nivel, visibles en las devtools del
+    navegador) y guarda la traza en `trace_store`. Las rutas /admin no se trazan.
+    """
+
+    def __init__(self, app: Any, store: TraceStore = trace_store) -> None:
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["path"].startswith("/admin"):
+            await self.app(scope, receive, send)
+            return
+        root = Span("request", {})
+        trace_id = self.store.new_id()
+        status = [0]
+
+        async def send_traced(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                timing = ", ".join(
+                    f"{c.name};dur={c.seconds * 1000:.1f}" for c in root.children if c.seconds is not None
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"x-trace-id", trace_id.encode()))
+                if timing:
+                    headers.append((b"server-timing", timing.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        started_at = time.time()
+        try:
+            with root:
+                await self.app(scope, receive, send_traced)
+        finally:
+            self.store.add({
+                "id": trace_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status[0] or 500,
+                "started": round(started_at, 3),
+                "ms": round(root.seconds * 1000, 2),
+                **root.attrs,
+                **({"sql": root.sql} if root.sql else {}),
+                "spans": [c.to_dict(root.started) for c in root.children],
+            })
+
+
+# --- Perfilador por muestreo ---
+
+# Hojas de pila que significan "esperando": se omiten salvo que se pida lo contrario
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """Toma muestras de las pilas de todos los hilos del proceso cada `interval` segundos.
+
+    Devuelve las pilas en formato "collapsed" (`hilo;f1;f2;f3 N` por línea), el que leen
+    flamegraph.pl, inferno y speedscope. Solo corre un perfil a la vez por proceso.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._labels: Dict[Any, str] = {}
+
+    def _label(self, code: Any) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+            path = "/".join(parts[-2:])
+            # ';' separa marcos en el formato collapsed (el conteo va tras el último espacio)
+            label = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ",")
+            self._labels[code] = label
+        return label
+
+    def _stack(self, frame: Any) -> Tuple[str, ...]:
+        labels: List[str] = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return tuple(labels)
+
+    def profile(self, seconds: float, interval: float, include_idle: bool = False) -> Tuple[str, Dict[str, Any]]:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("Ya hay un perfil en curso")
+        try:
+            me = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            counts: Counter = Counter()
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    code = frame.f_code
+                    leaf = (os.path.basename(code.co_filename), code.co_name)
+                    if not include_idle and leaf in _IDLE_LEAVES:
+                        continue
+                    if ident not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    thread = names.get(ident, str(ident)).replace(";", ",")
+                    counts[(thread,) + self._stack(frame)] += 1
+                samples += 1
+                time.sleep(interval)
+            lines = [f"{';'.join(stack)} {n}" for stack, n in counts.most_common()]
+            return "\n".join(lines) + ("\n" if lines else ""), {
+                "samples": samples,
+                "stacks": len(counts),
+                "seconds": seconds,
+                "interval_ms": round(interval * 1000, 2),
+            }
+        finally:
+            self._lock.release()
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict
+
+from fastapi.concurrency import run_in_threadpool
+
+from .intent import intent_parser
+from .llm import llm_router
+from .prompts import SYSTEM
+from .retrieval import count_reports, count_urgent_reports, entity_names, monthly_counts, search_reports
+from .settings import LLM_WARMUP_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_db() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+
+    t0 = time.perf_counter()
+    entity_names()
+    timings["entities"] = time.perf_counter() - t0
+
+    # Índice de nombres del parser de intenciones
+    t0 = time.perf_counter()
+    intent_parser()
+    timings["intent"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    count_reports(None)
+    count_urgent_reports(None)
+    monthly_counts(None)
+    timings["aggregates"] = time.perf_counter() - t0
+
+    # Una búsqueda real recorre el índice FTS y las páginas de report_facts
+    t0 = time.perf_counter()
+    search_reports("reporte problema calles", k=1)
+    timings["fts"] = time.perf_counter() - t0
+    return timings
+
+
+async def _prime_llm() -> bool:
+    """Completion mínima con el prefijo estático del prompt en cada réplica: deja sus slots y KV-cache listos."""
+    payload = {"prompt": SYSTEM, "n_predict": 1, "cache_prompt": True}
+    primed = await llm_router.prime(payload, timeout=LLM_WARMUP_TIMEOUT_SECONDS)
+    return all(primed.values())
+
+
+async def run_warmup(state: Dict[str, Any]) -> None:
+    """Calienta SQLite/FTS y el LLM; marca `state["ready"]` al terminar (aunque el LLM falle)."""
+    started = time.perf_counter()
+    try:
+        state["timings"] = await run_in_threadpool(_warm_db)
+        t0 = time.perf_counter()
+        state["llm_primed"] = await _prime_llm()
+        state["timings"]["llm"] = time.perf_counter() - t0
+    except Exception as e:  # no bloquear el arranque por un fallo de calentamiento
+        state["error"] = repr(e)
+        logger.warning("Warm-up incompleto: %r", e)
+    finally:
+        state["warmup_seconds"] = time.perf_counter() - started
+        state["ready"] = True
@@ -0,0 +1,286 @@
+"""Seeded synthetic dataset in the exact source CSV schema, for ETL and API load tests.
+
+Rows are generated in fixed-size chunks with numpy and streamed to disk, so memory stays flat at
+any size (100M rows is ~10 GB of CSV, ~1.5 GB with .gz). The same arguments always produce the
+same bytes.
+
+    python -m etl.extract.synthetic_dataset --rows 1000000 --seed 7 --out data/dataset/synthetic_1m.csv.gz
+    DATASET_PATH=data/dataset/synthetic_1m.csv.gz python -m etl.main_etl
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import gzip
+import io
+import os
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from etl.transform.clean_dataset import COLUMN_RENAME_MAP
+
+# Source header, in the original column order
+HEADER = list(COLUMN_RENAME_MAP.keys())
+
+# Rows per generated chunk. Part of the output definition: changing it changes the bytes for a seed
+CHUNK_ROWS = 100_000
+
+# Relative report volume per city (roughly urban population, millions)
+CITY_WEIGHTS = {
+    "Bogotá": 7.9,
+    "Medellín": 2.6,
+    "Cali": 2.3,
+    "Barranquilla": 1.3,
+    "Cartagena": 1.0,
+    "Cúcuta": 0.8,
+    "Bucaramanga": 0.6,
+    "Pereira": 0.5,
+    "Santa Marta": 0.5,
+    "Manizales": 0.4,
+}
+
+CATEGORIES = ["Seguridad", "Salud", "Educación", "Medio Ambiente"]
+
+# Probability of "Urgente" per category
+URGENCY_BY_CATEGORY = {"Seguridad": 0.6, "Salud": 0.65, "Educación": 0.35, "Medio Ambiente": 0.4}
+
+# Comment templates with the category they usually belong to
+TEMPLATES = [
+    ("las calles están muy oscuras y peligrosas.", "Seguridad"),
+    ("queremos más presencia policial.", "Seguridad"),
+    ("faltan médicos en el centro de salud.", "Salud"),
+    ("falta agua potable en varias casas.", "Salud"),
+    ("no hay suficientes escuelas públicas.", "Educación"),
+    ("no tenemos centros culturales ni bibliotecas.", "Educación"),
+    ("necesitamos más acceso a internet en la zona.", "Educación"),
+    ("las basuras no se recogen a tiempo.", "Medio Ambiente"),
+    ("hay problemas con la recolección de basura.", "Medio Ambiente"),
+    ("la contaminación del río está aumentando.", "Medio Ambiente"),
+]
+TEMPLATE_WEIGHTS = [1.4, 1.2, 1.3, 1.0, 0.9, 0.6, 0.8, 1.1, 0.9, 0.8]
+
+# Share of reports filed under the template's usual category (the rest pick any category)
+TEMPLATE_CATEGORY_AFFINITY = 0.7
+
+# Near-duplicate rewrites of a template (exercise comment clustering)
+VARIANT_RATE = 0.15
+VARIANTS: List[Callable[[str], str]] = [
+    lambda s: s.capitalize(),
+    lambda s: s.rstrip(".") + "!!",
+    lambda s: s.rstrip("."),
+    lambda s: s.replace("á", "a").replace("é", "e").replace("í", "i").replace("ó", "o").replace("ú", "u"),
+    lambda s: "por favor, " + s,
+    lambda s: s.rstrip(".") + " desde hace meses.",
+    lambda s: s.upper(),
+]
+
+NAMES = [
+    "María", "Valentina", "Laura", "Sofía", "Ana", "Camila", "Daniela", "Paula", "Isabella", "Mariana",
+    "Juan", "Carlos", "Andrés", "Jorge", "Pedro", "Camilo", "Santiago", "Luis", "Diego", "Felipe",
+]
+
+GENDERS = ["F", "M", "Otro", "O"]
+GENDER_WEIGHTS = [0.49, 0.47, 0.03, 0.01]
+
+AGE_MIN, AGE_MAX, AGE_MEAN, AGE_SD = 18, 90, 42.0, 15.0
+
+RURAL_RATE = 0.25
+# Internet access depends on the area
+INTERNET_RATE = {0: 0.82, 1: 0.45}
+PRIOR_ATTENTION_RATE = 0.42
+
+DEFAULT_START = date(2023, 1, 1)
+DEFAULT_END = date(2024, 12, 1)
+# Volume at the end of the range relative to the start, and on weekends relative to weekdays
+GROWTH = 1.8
+WEEKEND_FACTOR = 0.6
+
+# Share of rows with one dirty value (see _DIRTY) and of text fields padded with spaces
+DEFAULT_DIRTY_RATE = 0.05
+PADDING_RATE = 0.02
+
+
+def _dirty_id(row: List[str], rng: np.random.Generator) -> None:
+    # Duplicate of the previous id (dropped by drop_duplicates) or non-numeric
+    row[0] = str(max(1, int(row[0]) - 1)) if rng.random() < 0.8 else "ID-" + row[0]
+
+
+def _dirty_age(row: List[str], rng: np.random.Generator) -> None:
+    row[2] = str(rng.choice(["", "-3", "150.0", "veinte", "nan", f"{rng.uniform(18, 80):.1f}"]))
+
+
+def _dirty_gender(row: List[str], rng: np.random.Generator) -> None:
+    row[3] = str(rng.choice(["", "X", "masculino", "null"]))
+
+
+def _dirty_city(row: List[str], rng: np.random.Generator) -> None:
+    row[4] = str(rng.choice(["", "NA"]))
+
+
+def _dirty_comment(row: List[str], rng: np.random.Generator) -> None:
+    row[5] = str(rng.choice(["", "   ", "nan", "None", "NULL"]))
+
+
+def _dirty_category(row: List[str], rng: np.random.Generator) -> None:
+    row[6] = ""
+
+
+def _dirty_urgency(row: List[str], rng: np.random.Generator) -> None:
+    # Synonyms accepted by the cleaner, plus values it must reject
+    row[7] = str(rng.choice(["alta", "baja", "Alta urgencia", "baja urgencia", "media", ""]))
+
+
+def _dirty_date(row: List[str], rng: np.random.Generator) -> None:
+    row[8] = str(rng.choice(["", "2023-02-30", "sin fecha", "32/13/2023"]))
+
+
+def _dirty_flag(row: List[str], rng: np.random.Generator) -> None:
+    row[int(rng.integers(9, 12))] = str(rng.choice(["", "2", "si", "-1"]))
+
+
+_DIRTY = [_dirty_id, _dirty_age, _dirty_gender, _dirty_city, _dirty_comment, _dirty_category, _dirty_urgency, _dirty_date, _dirty_flag]
+
+
+def _probabilities(weights: Sequence[float]) -> np.ndarray:
+    w = np.asarray(weights, dtype=float)
+    return w / w.sum()
+
+
+def _date_table(start: date, end: date) -> Tuple[np.ndarray, np.ndarray]:
+    days = (end - start).days + 1
+    if days <= 0:
+        raise ValueError("end must not be before start")
+    dates = [start + timedelta(days=d) for d in range(days)]
+    t = np.arange(days) / max(1, days - 1)
+    weights = (1 + (GROWTH - 1) * t) * np.array([WEEKEND_FACTOR if d.weekday() >= 5 else 1.0 for d in dates])
+    return np.array([d.isoformat() for d in dates], dtype=object), _probabilities(weights)
+
+
+def generate_chunks(
+    rows: int,
+    seed: int = 0,
+    dirty_rate: float = DEFAULT_DIRTY_RATE,
+    start: date = DEFAULT_START,
+    end: date = DEFAULT_END,
+) -> Iterator[List[List[str]]]:
+    """Yield lists of CSV rows (strings, source column order) of at most CHUNK_ROWS rows each."""
+    rng = np.random.default_rng(seed)
+    cities = np.array(list(CITY_WEIGHTS), dtype=object)
+    p_city = _probabilities(list(CITY_WEIGHTS.values()))
+    p_template = _probabilities(TEMPLATE_WEIGHTS)
+    categories = np.array(CATEGORIES, dtype=object)
+    template_category = np.array([CATEGORIES.index(c) for _, c in TEMPLATES])
+    urgency = np.array([URGENCY_BY_CATEGORY[c] for c in CATEGORIES])
+    names = np.array(NAMES, dtype=object)
+    genders = np.array(GENDERS, dtype=object)
+    p_gender = _probabilities(GENDER_WEIGHTS)
+    dates, p_date = _date_table(start, end)
+    # Every template with every variant, indexed [template, 0 = original | 1.. = variant]
+    comments = np.array([[t] + [v(t) for v in VARIANTS] for t, _ in TEMPLATES], dtype=object)
+
+    next_id = 1
+    while next_id <= rows:
+        n = min(CHUNK_ROWS, rows - next_id + 1)
+        ids = np.arange(next_id, next_id + n)
+        next_id += n
+
+        template = rng.choice(len(TEMPLATES), size=n, p=p_template)
+        variant = np.where(rng.random(n) < VARIANT_RATE, rng.integers(1, len(VARIANTS) + 1, size=n), 0)
+        category = np.where(rng.random(n) < TEMPLATE_CATEGORY_AFFINITY, template_category[template], rng.integers(0, len(CATEGORIES), size=n))
+        urgent = rng.random(n) < urgency[category]
+        rural = (rng.random(n) < RURAL_RATE).astype(int)
+        internet = (rng.random(n) < np.where(rural == 1, INTERNET_RATE[1], INTERNET_RATE[0])).astype(int)
+        attention = (rng.random(n) < PRIOR_ATTENTION_RATE).astype(int)
+        age = np.clip(np.rint(rng.normal(AGE_MEAN, AGE_SD, size=n)), AGE_MIN, AGE_MAX).astype(int)
+
+        columns = [
+            ids.astype(str),
+            names[rng.integers(0, len(NAMES), size=n)],
+            np.char.add(age.astype(str), ".0"),  # the source stores ages as floats
+            genders[rng.choice(len(GENDERS), size=n, p=p_gender)],
+            cities[rng.choice(len(cities), size=n, p=p_city)],
+            comments[template, variant],
+            categories[category],
+            np.where(urgent, "Urgente", "No urgente"),
+            dates[rng.choice(len(dates), size=n, p=p_date)],
+            internet.astype(str),
+            attention.astype(str),
+            rural.astype(str),
+        ]
+        chunk = [list(r) for r in zip(*(c.tolist() for c in columns))]
+
+        for i in np.flatnonzero(rng.random(n) < dirty_rate):
+            _DIRTY[int(rng.integers(0, len(_DIRTY)))](chunk[i], rng)
+        for i in np.flatnonzero(rng.random(n) < PADDING_RATE):
+            col = int(rng.choice([1, 4, 5, 6, 7]))
+            chunk[i][col] = f"  {chunk[i][col]} "
+        yield chunk
+
+
+def _open_output(path: str) -> io.TextIOBase:
+    if path == "-":
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.endswith(".gz"):
+        # mtime=0: the same seed produces the same compressed bytes
+        return io.TextIOWrapper(gzip.GzipFile(path, "wb", compresslevel=5, mtime=0), encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def write_dataset(
+    path: str,
+    rows: int,
+    seed: int = 0,
+    dirty_rate: float = DEFAULT_DIRTY_RATE,
+    start: date = DEFAULT_START,
+    end: date = DEFAULT_END,
+    progress: Optional[Callable[[int], None]] = None,
+) -> str:
+    """Stream a synthetic CSV to `path` ('.gz' compresses, '-' is stdout). Returns the absolute path."""
+    out = _open_output(path)
+    try:
+        writer = csv.writer(out)
+        writer.writerow(HEADER)
+        written = 0
+        for chunk in generate_chunks(rows, seed, dirty_rate, start, end):
+            writer.writerows(chunk)
+            written += len(chunk)
+            if progress:
+                progress(written)
+    finally:
+        if path == "-":
+            out.flush()
+            out.detach()
+        else:
+            out.close()
+    return path if path == "-" else os.path.abspath(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic reports CSV in the source schema")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dirty", type=float, default=DEFAULT_DIRTY_RATE, help="Share of rows with one dirty value")
+    parser.add_argument("--start", type=date.fromisoformat, default=DEFAULT_START)
+    parser.add_argument("--end", type=date.fromisoformat, default=DEFAULT_END)
+    parser.add_argument("--out", default=os.path.join("data", "dataset", "synthetic.csv"), help="'.gz' compresses; '-' writes to stdout")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def progress(written: int) -> None:
+        if written % (10 * CHUNK_ROWS) == 0 or written == args.rows:
+            elapsed = time.perf_counter() - started
+            print(f"{written:>12,} rows  {written / elapsed:>10,.0f} rows/s", file=sys.stderr)
+
+    path = write_dataset(args.out, args.rows, args.seed, args.dirty, args.start, args.end, progress)
+    print(f"Synthetic dataset: {path} ({args.rows} rows, seed={args.seed})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import os
+import shutil
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PARQUET_OUTPUT_DIR = os.path.join("data", "processed", "reports_parquet")
+
+# Hive-style partition column (mes=YYYY-MM) derived from fecha_reporte
+PARTITION_COLUMN = "mes"
+
+# Low-cardinality text columns stored as Parquet dictionaries
+DICTIONARY_COLUMNS = ["ciudad", "categoria_problema", "genero"]
+
+
+def _ensure_dirs(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+def _to_columnar_frame(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    fechas = pd.to_datetime(out["fecha_reporte"], errors="coerce")
+    out[PARTITION_COLUMN] = fechas.dt.strftime("%Y-%m")
+    # date32 in Parquet enables min/max statistics and range pushdown
+    out["fecha_reporte"] = fechas.dt.date
+    for col in DICTIONARY_COLUMNS:
+        if col in out.columns:
+            out[col] = out[col].astype("category")
+    return out
+
+
+def build_parquet_dataset(df: pd.DataFrame, output_dir: str = PARQUET_OUTPUT_DIR) -> str:
+    """Write the cleaned dataset as a Parquet dataset partitioned by report month.
+
+    Returns the absolute path to the dataset directory.
+    """
+    _ensure_dirs(output_dir)
+    # Rebuild from scratch so stale partitions never survive an ETL run
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+
+    table = pa.Table.from_pandas(_to_columnar_frame(df), preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root_path=output_dir,
+        partition_cols=[PARTITION_COLUMN],
+        use_dictionary=[c for c in DICTIONARY_COLUMNS if c in table.column_names],
+        compression="zstd",
+    )
+    return os.path.abspath(output_dir)
+
+
+def _parse_date(value: Any) -> date:
+    return date.fromisoformat(str(value)[:10])
+
+
+def _build_filter(filters: Optional[Dict[str, Any]]) -> Optional[ds.Expression]:
+    """Translate the API filter dict (see app.retrieval._apply_filters) to an Arrow expression.
+
+    Date bounds are also applied to the partition column so whole months are pruned.
+    """
+    if not filters:
+        return None
+    exprs: List[ds.Expression] = []
+    if (city := filters.get("ciudad")):
+        exprs.append(ds.field("ciudad") == city)
+    if (cat := filters.get("categoria_problema")):
+        exprs.append(ds.field("categoria_problema") == cat)
+    if (urg := filters.get("urgente")) is not None:
+        exprs.append(ds.field("urgente") == int(urg))
+    if (dfrom := filters.get("fecha_desde")):
+        d = _parse_date(dfrom)
+        exprs.append(ds.field(PARTITION_COLUMN) >= f"{d.year:04d}-{d.month:02d}")
+        exprs.append(ds.field("fecha_reporte") >= pa.scalar(d, pa.date32()))
+    if (dbefore := filters.get("fecha_antes")):
+        # Exclusive upper bound (half-open range)
+        d = _parse_date(dbefore)
+        exprs.append(ds.field(PARTITION_COLUMN) <= f"{d.year:04d}-{d.month:02d}")
+        exprs.append(ds.field("fecha_reporte") < pa.scalar(d, pa.date32()))
+    if (dto := filters.get("fecha_hasta")):
+        # fecha_hasta may carry an out-of-range day (e.g. YYYY-MM-31); compare on the month first
+        month = str(dto)[:7]
+        exprs.append(ds.field(PARTITION_COLUMN) <= month)
+        try:
+            exprs.append(ds.field("fecha_reporte") <= pa.scalar(_parse_date(dto), pa.date32()))
+        except ValueError:
+            pass
+    if not exprs:
+        return None
+    expr = exprs[0]
+    for e in exprs[1:]:
+        expr = expr & e
+    return expr
+
+
+def read_parquet_reports(
+    dataset_dir: str = PARQUET_OUTPUT_DIR,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """Read reports from the partitioned Parquet dataset.
+
+    - Only `columns` are decoded (all columns when None)
+    - `filters` uses the same keys as the API (ciudad, categoria_problema, urgente, fecha_desde, fecha_antes, fecha_hasta)
+      and is pushed down to partition pruning and row-group statistics
+    """
+    partitioning = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive")
+    dataset = ds.dataset(dataset_dir, format="parquet", partitioning=partitioning)
+    table = dataset.to_table(columns=columns, filter=_build_filter(filters))
+    return table.to_pandas()
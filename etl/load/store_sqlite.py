@@ -6,6 +6,8 @@ from typing import Iterable
 
 import pandas as pd
 
+from etl.transform.cluster_comments import cluster_comments
+
 DB_OUTPUT_PATH = os.path.join("data", "db", "reports.sqlite")
 
 
@@ -15,28 +17,263 @@ PRAGMA synchronous = NORMAL;
 PRAGMA temp_store = MEMORY;
 PRAGMA cache_size = -20000; -- 20MB page cache
 
-CREATE TABLE IF NOT EXISTS reports (
+-- Dimension tables: each repeated text value is stored once and referenced by integer key
+CREATE TABLE IF NOT EXISTS ciudades (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS categorias (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS generos (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS niveles_urgencia (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE
+);
+
+-- Near-duplicate comment clusters (see etl/transform/cluster_comments.py). A cluster is one
+-- comment group within one ciudad + categoria; its id is the id of the representative report
+CREATE TABLE IF NOT EXISTS comment_clusters (
+    id INTEGER PRIMARY KEY,
+    grupo INTEGER, -- near-duplicate text group; NULL for rows inserted without clustering
+    ciudad_id INTEGER NOT NULL REFERENCES ciudades (id),
+    categoria_id INTEGER NOT NULL REFERENCES categorias (id),
+    comentario TEXT NOT NULL, -- representative comment
+    size INTEGER NOT NULL
+);
+
+-- Distinct comment texts of each cluster. They are the FTS content: every variant of a cluster
+-- is searchable, while reports repeating the same text are indexed once
+CREATE TABLE IF NOT EXISTS cluster_texts (
+    id INTEGER PRIMARY KEY,
+    cluster_id INTEGER NOT NULL REFERENCES comment_clusters (id),
+    comentario TEXT NOT NULL,
+    UNIQUE (cluster_id, comentario)
+);
+
+-- Normalized comment text -> group, so later loads can place new comments in an existing group
+CREATE TABLE IF NOT EXISTS comment_variants (
+    clave TEXT PRIMARY KEY,
+    grupo INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS report_facts (
     id INTEGER PRIMARY KEY,
     nombre TEXT NOT NULL,
     edad INTEGER NOT NULL,
-    genero TEXT NOT NULL,
-    ciudad TEXT NOT NULL,
+    genero_id INTEGER NOT NULL REFERENCES generos (id),
+    ciudad_id INTEGER NOT NULL REFERENCES ciudades (id),
     comentario TEXT NOT NULL,
-    categoria_problema TEXT NOT NULL,
-    nivel_urgencia TEXT NOT NULL,
+    categoria_id INTEGER NOT NULL REFERENCES categorias (id),
+    nivel_urgencia_id INTEGER NOT NULL REFERENCES niveles_urgencia (id),
     urgente INTEGER NOT NULL, -- 1 urgente, 0 no urgente
-    fecha_reporte TEXT NOT NULL, -- ISO YYYY-MM-DD
+    fecha_dia INTEGER NOT NULL, -- YYYYMMDD
+    mes INTEGER NOT NULL, -- YYYYMM (clave de mes almacenada: agrupación sin cálculos por fila)
     acceso_internet INTEGER NOT NULL, -- 0 carencia, 1 dispone
     atencion_previa_gobierno INTEGER NOT NULL,
-    zona_rural INTEGER NOT NULL
+    zona_rural INTEGER NOT NULL,
+    cluster_id INTEGER NOT NULL REFERENCES comment_clusters (id),
+    texto_id INTEGER NOT NULL REFERENCES cluster_texts (id) -- distinct text of the cluster (FTS rowid)
 );
 
-CREATE INDEX IF NOT EXISTS idx_reports_fecha ON reports (fecha_reporte);
-CREATE INDEX IF NOT EXISTS idx_reports_ciudad ON reports (ciudad);
-CREATE INDEX IF NOT EXISTS idx_reports_categoria ON reports (categoria_problema);
-CREATE INDEX IF NOT EXISTS idx_reports_urgente ON reports (urgente);
+CREATE INDEX IF NOT EXISTS idx_reports_fecha ON report_facts (fecha_dia);
+CREATE INDEX IF NOT EXISTS idx_reports_mes ON report_facts (mes, fecha_dia);
+CREATE INDEX IF NOT EXISTS idx_reports_ciudad ON report_facts (ciudad_id, fecha_dia);
+CREATE INDEX IF NOT EXISTS idx_reports_categoria ON report_facts (categoria_id, fecha_dia);
+CREATE INDEX IF NOT EXISTS idx_reports_urgente ON report_facts (urgente, fecha_dia);
+CREATE INDEX IF NOT EXISTS idx_reports_cluster ON report_facts (cluster_id, fecha_dia);
+CREATE INDEX IF NOT EXISTS idx_reports_texto ON report_facts (texto_id, fecha_dia, cluster_id);
+
+-- Compatibility view: same columns and text values as the former reports table,
+-- plus the integer keys so readers can filter/group without decoding text
+CREATE VIEW IF NOT EXISTS reports AS
+SELECT
+    f.id AS id,
+    f.nombre AS nombre,
+    f.edad AS edad,
+    g.nombre AS genero,
+    c.nombre AS ciudad,
+    f.comentario AS comentario,
+    k.nombre AS categoria_problema,
+    n.nombre AS nivel_urgencia,
+    f.urgente AS urgente,
+    printf('%04d-%02d-%02d', f.fecha_dia / 10000, f.fecha_dia / 100 % 100, f.fecha_dia % 100) AS fecha_reporte,
+    f.acceso_internet AS acceso_internet,
+    f.atencion_previa_gobierno AS atencion_previa_gobierno,
+    f.zona_rural AS zona_rural,
+    f.fecha_dia AS fecha_dia,
+    f.mes AS mes,
+    f.ciudad_id AS ciudad_id,
+    f.categoria_id AS categoria_id,
+    f.cluster_id AS cluster_id,
+    f.texto_id AS texto_id,
+    -- Correlated subquery instead of a join: only evaluated by queries that select it
+    (SELECT cc.size FROM comment_clusters cc WHERE cc.id = f.cluster_id) AS cluster_size
+FROM report_facts f
+JOIN ciudades c ON c.id = f.ciudad_id
+JOIN categorias k ON k.id = f.categoria_id
+JOIN generos g ON g.id = f.genero_id
+JOIN niveles_urgencia n ON n.id = f.nivel_urgencia_id;
+
+-- FTS content: one row per distinct text of a cluster instead of one per report
+CREATE VIEW IF NOT EXISTS cluster_text_search AS
+SELECT t.id AS id, t.comentario AS comentario, c.nombre AS ciudad, k.nombre AS categoria_problema
+FROM cluster_texts t
+JOIN comment_clusters cc ON cc.id = t.cluster_id
+JOIN ciudades c ON c.id = cc.ciudad_id
+JOIN categorias k ON k.id = cc.categoria_id;
+
+-- Writes through the view keep working for row-at-a-time producers
+CREATE TRIGGER IF NOT EXISTS reports_insert INSTEAD OF INSERT ON reports
+BEGIN
+    INSERT OR IGNORE INTO ciudades (nombre) VALUES (NEW.ciudad);
+    INSERT OR IGNORE INTO categorias (nombre) VALUES (NEW.categoria_problema);
+    INSERT OR IGNORE INTO generos (nombre) VALUES (NEW.genero);
+    INSERT OR IGNORE INTO niveles_urgencia (nombre) VALUES (NEW.nivel_urgencia);
+    -- Without a cluster_id the report becomes its own (singleton) cluster
+    INSERT OR IGNORE INTO comment_clusters (id, grupo, ciudad_id, categoria_id, comentario, size) VALUES (
+        COALESCE(NEW.cluster_id, NEW.id), NULL,
+        (SELECT id FROM ciudades WHERE nombre = NEW.ciudad),
+        (SELECT id FROM categorias WHERE nombre = NEW.categoria_problema),
+        NEW.comentario, 0
+    );
+    INSERT OR IGNORE INTO cluster_texts (cluster_id, comentario) VALUES (COALESCE(NEW.cluster_id, NEW.id), NEW.comentario);
+    -- Explicit delete (instead of OR REPLACE) so rollup triggers see the old row
+    DELETE FROM report_facts WHERE id = NEW.id;
+    INSERT INTO report_facts (
+        id, nombre, edad, genero_id, ciudad_id, comentario,
+        categoria_id, nivel_urgencia_id, urgente, fecha_dia, mes,
+        acceso_internet, atencion_previa_gobierno, zona_rural, cluster_id, texto_id
+    ) VALUES (
+        NEW.id, NEW.nombre, NEW.edad,
+        (SELECT id FROM generos WHERE nombre = NEW.genero),
+        (SELECT id FROM ciudades WHERE nombre = NEW.ciudad),
+        NEW.comentario,
+        (SELECT id FROM categorias WHERE nombre = NEW.categoria_problema),
+        (SELECT id FROM niveles_urgencia WHERE nombre = NEW.nivel_urgencia),
+        NEW.urgente,
+        CAST(replace(substr(NEW.fecha_reporte, 1, 10), '-', '') AS INTEGER),
+        CAST(replace(substr(NEW.fecha_reporte, 1, 7), '-', '') AS INTEGER),
+        NEW.acceso_internet, NEW.atencion_previa_gobierno, NEW.zona_rural,
+        COALESCE(NEW.cluster_id, NEW.id),
+        (SELECT id FROM cluster_texts WHERE cluster_id = COALESCE(NEW.cluster_id, NEW.id) AND comentario = NEW.comentario)
+    );
+END;
+"""
+
+# Materialized rollups at month grain. Counts (total) and urgent sums (urgentes) let
+# the API answer count/group-by/monthly questions without scanning report_facts.
+ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS rollup_mes_ciudad_categoria (
+    mes INTEGER NOT NULL, -- YYYYMM
+    ciudad_id INTEGER NOT NULL,
+    categoria_id INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    urgentes INTEGER NOT NULL,
+    PRIMARY KEY (mes, ciudad_id, categoria_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_mes_flags (
+    mes INTEGER NOT NULL, -- YYYYMM
+    zona_rural INTEGER NOT NULL,
+    acceso_internet INTEGER NOT NULL,
+    atencion_previa_gobierno INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    urgentes INTEGER NOT NULL,
+    PRIMARY KEY (mes, zona_rural, acceso_internet, atencion_previa_gobierno)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_POPULATE_SQL = """
+DELETE FROM rollup_mes_ciudad_categoria;
+INSERT INTO rollup_mes_ciudad_categoria (mes, ciudad_id, categoria_id, total, urgentes)
+SELECT mes, ciudad_id, categoria_id, COUNT(*), SUM(urgente)
+FROM report_facts
+GROUP BY mes, ciudad_id, categoria_id;
+
+DELETE FROM rollup_mes_flags;
+INSERT INTO rollup_mes_flags (mes, zona_rural, acceso_internet, atencion_previa_gobierno, total, urgentes)
+SELECT mes, zona_rural, acceso_internet, atencion_previa_gobierno, COUNT(*), SUM(urgente)
+FROM report_facts
+GROUP BY mes, zona_rural, acceso_internet, atencion_previa_gobierno;
 """
 
+# Incremental maintenance: every row-level change to report_facts adjusts the rollups.
+# Created after the bulk load so the initial build aggregates in one pass instead.
+ROLLUP_TRIGGERS_SQL = """
+CREATE TRIGGER IF NOT EXISTS report_facts_rollup_insert AFTER INSERT ON report_facts
+BEGIN
+    INSERT INTO rollup_mes_ciudad_categoria (mes, ciudad_id, categoria_id, total, urgentes)
+    VALUES (NEW.mes, NEW.ciudad_id, NEW.categoria_id, 1, NEW.urgente)
+    ON CONFLICT (mes, ciudad_id, categoria_id)
+    DO UPDATE SET total = total + 1, urgentes = urgentes + excluded.urgentes;
+    INSERT INTO rollup_mes_flags (mes, zona_rural, acceso_internet, atencion_previa_gobierno, total, urgentes)
+    VALUES (NEW.mes, NEW.zona_rural, NEW.acceso_internet, NEW.atencion_previa_gobierno, 1, NEW.urgente)
+    ON CONFLICT (mes, zona_rural, acceso_internet, atencion_previa_gobierno)
+    DO UPDATE SET total = total + 1, urgentes = urgentes + excluded.urgentes;
+END;
+
+CREATE TRIGGER IF NOT EXISTS report_facts_rollup_delete AFTER DELETE ON report_facts
+BEGIN
+    UPDATE rollup_mes_ciudad_categoria SET total = total - 1, urgentes = urgentes - OLD.urgente
+    WHERE mes = OLD.mes AND ciudad_id = OLD.ciudad_id AND categoria_id = OLD.categoria_id;
+    UPDATE rollup_mes_flags SET total = total - 1, urgentes = urgentes - OLD.urgente
+    WHERE mes = OLD.mes AND zona_rural = OLD.zona_rural
+        AND acceso_internet = OLD.acceso_internet AND atencion_previa_gobierno = OLD.atencion_previa_gobierno;
+END;
+
+CREATE TRIGGER IF NOT EXISTS report_facts_rollup_update AFTER UPDATE ON report_facts
+BEGIN
+    UPDATE rollup_mes_ciudad_categoria SET total = total - 1, urgentes = urgentes - OLD.urgente
+    WHERE mes = OLD.mes AND ciudad_id = OLD.ciudad_id AND categoria_id = OLD.categoria_id;
+    UPDATE rollup_mes_flags SET total = total - 1, urgentes = urgentes - OLD.urgente
+    WHERE mes = OLD.mes AND zona_rural = OLD.zona_rural
+        AND acceso_internet = OLD.acceso_internet AND atencion_previa_gobierno = OLD.atencion_previa_gobierno;
+    INSERT INTO rollup_mes_ciudad_categoria (mes, ciudad_id, categoria_id, total, urgentes)
+    VALUES (NEW.mes, NEW.ciudad_id, NEW.categoria_id, 1, NEW.urgente)
+    ON CONFLICT (mes, ciudad_id, categoria_id)
+    DO UPDATE SET total = total + 1, urgentes = urgentes + excluded.urgentes;
+    INSERT INTO rollup_mes_flags (mes, zona_rural, acceso_internet, atencion_previa_gobierno, total, urgentes)
+    VALUES (NEW.mes, NEW.zona_rural, NEW.acceso_internet, NEW.atencion_previa_gobierno, 1, NEW.urgente)
+    ON CONFLICT (mes, zona_rural, acceso_internet, atencion_previa_gobierno)
+    DO UPDATE SET total = total + 1, urgentes = urgentes + excluded.urgentes;
+END;
+"""
+
+# Cluster sizes follow report_facts the same way (created after the bulk load as well)
+CLUSTER_TRIGGERS_SQL = """
+CREATE TRIGGER IF NOT EXISTS report_facts_cluster_insert AFTER INSERT ON report_facts
+BEGIN
+    UPDATE comment_clusters SET size = size + 1 WHERE id = NEW.cluster_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS report_facts_cluster_delete AFTER DELETE ON report_facts
+BEGIN
+    UPDATE comment_clusters SET size = size - 1 WHERE id = OLD.cluster_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS report_facts_cluster_update AFTER UPDATE OF cluster_id ON report_facts
+BEGIN
+    UPDATE comment_clusters SET size = size - 1 WHERE id = OLD.cluster_id;
+    UPDATE comment_clusters SET size = size + 1 WHERE id = NEW.cluster_id;
+END;
+"""
+
+# Dimension table for each text column that is dictionary-encoded in report_facts
+DIMENSIONS = {
+    "ciudad": ("ciudades", "ciudad_id"),
+    "categoria_problema": ("categorias", "categoria_id"),
+    "genero": ("generos", "genero_id"),
+    "nivel_urgencia": ("niveles_urgencia", "nivel_urgencia_id"),
+}
+
 
 def _ensure_dirs(path: str) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -52,34 +289,81 @@ def _remove_db_files(path: str) -> None:
                 pass
 
 
+def _insert_dimension(conn: sqlite3.Connection, table: str, values: pd.Series) -> pd.Series:
+    """Insert distinct values into a dimension table and return them mapped to their ids."""
+    names = sorted(str(v) for v in values.dropna().unique())
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (nombre) VALUES (?)", [(n,) for n in names])
+    ids = dict(conn.execute(f"SELECT nombre, id FROM {table}").fetchall())
+    return values.astype(str).map(ids)
+
+
 def _insert_reports(conn: sqlite3.Connection, df: pd.DataFrame) -> None:
-    # Use executemany inside a single transaction for speed
-    rows = df[[
+    # Encode text dimensions and dates as integers, then executemany in a single transaction
+    facts = df.copy()
+    for col, (table, key_col) in DIMENSIONS.items():
+        facts[key_col] = _insert_dimension(conn, table, facts[col])
+    facts["fecha_dia"] = facts["fecha_reporte"].astype(str).str.slice(0, 10).str.replace("-", "", regex=False).astype(int)
+    facts["mes"] = facts["fecha_dia"] // 100
+    # Each distinct text of a cluster gets an integer id (its FTS rowid); reports point at theirs
+    texts = facts[["cluster_id", "comentario"]].drop_duplicates().sort_values(["cluster_id", "comentario"], ignore_index=True)
+    texts["texto_id"] = texts.index + 1
+    facts = facts.merge(texts, on=["cluster_id", "comentario"], how="left")
+
+    rows = facts[[
         "id",
         "nombre",
         "edad",
-        "genero",
-        "ciudad",
+        "genero_id",
+        "ciudad_id",
         "comentario",
-        "categoria_problema",
-        "nivel_urgencia",
+        "categoria_id",
+        "nivel_urgencia_id",
         "urgente",
-        "fecha_reporte",
+        "fecha_dia",
+        "mes",
         "acceso_internet",
         "atencion_previa_gobierno",
         "zona_rural",
+        "cluster_id",
+        "texto_id",
     ]].itertuples(index=False, name=None)
 
     conn.executemany(
         """
-        INSERT OR REPLACE INTO reports (
-            id, nombre, edad, genero, ciudad, comentario,
-            categoria_problema, nivel_urgencia, urgente, fecha_reporte,
-            acceso_internet, atencion_previa_gobierno, zona_rural
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT OR REPLACE INTO report_facts (
+            id, nombre, edad, genero_id, ciudad_id, comentario,
+            categoria_id, nivel_urgencia_id, urgente, fecha_dia, mes,
+            acceso_internet, atencion_previa_gobierno, zona_rural, cluster_id, texto_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
         list(rows),
     )
+    _insert_clusters(conn, facts)
+
+
+def _insert_clusters(conn: sqlite3.Connection, facts: pd.DataFrame) -> None:
+    # One row per cluster, taken from its representative report (id == cluster_id)
+    reps = facts[facts["id"] == facts["cluster_id"]]
+    conn.executemany(
+        "INSERT OR REPLACE INTO comment_clusters (id, grupo, ciudad_id, categoria_id, comentario, size) VALUES (?, ?, ?, ?, ?, ?)",
+        list(reps[["cluster_id", "grupo", "ciudad_id", "categoria_id", "comentario", "cluster_size"]].itertuples(index=False, name=None)),
+    )
+    texts = facts[["texto_id", "cluster_id", "comentario"]].drop_duplicates("texto_id")
+    conn.executemany(
+        "INSERT OR REPLACE INTO cluster_texts (id, cluster_id, comentario) VALUES (?, ?, ?)",
+        list(texts.itertuples(index=False, name=None)),
+    )
+    variants = facts[["comentario_clave", "grupo"]].drop_duplicates("comentario_clave")
+    conn.executemany(
+        "INSERT OR REPLACE INTO comment_variants (clave, grupo) VALUES (?, ?)",
+        list(variants.itertuples(index=False, name=None)),
+    )
+
+
+def _build_rollups(conn: sqlite3.Connection) -> None:
+    conn.executescript(ROLLUP_SQL)
+    conn.executescript("BEGIN;" + ROLLUP_POPULATE_SQL + "COMMIT;")
+    conn.executescript(ROLLUP_TRIGGERS_SQL)
 
 
 def _setup_fts(conn: sqlite3.Connection) -> None:
@@ -87,7 +371,7 @@ def _setup_fts(conn: sqlite3.Connection) -> None:
         conn.execute(
             """
             CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5(
-                comentario, ciudad, categoria_problema, content='reports'
+                comentario, ciudad, categoria_problema, content='cluster_text_search', content_rowid='id'
             );
             """
         )
@@ -98,13 +382,8 @@ def _setup_fts(conn: sqlite3.Connection) -> None:
 
 def _populate_fts(conn: sqlite3.Connection) -> None:
     try:
-        conn.execute("DELETE FROM report_search")
-        conn.execute(
-            """
-            INSERT INTO report_search(rowid, comentario, ciudad, categoria_problema)
-            SELECT id, comentario, ciudad, categoria_problema FROM reports
-            """
-        )
+        # External-content table: 'rebuild' re-reads each distinct text of every comment cluster
+        conn.execute("INSERT INTO report_search(report_search) VALUES('rebuild')")
     except sqlite3.DatabaseError as e:
         # FTS5 puede no estar disponible o hay corrupción de DB: continuar sin FTS
         print(f"No se pudo poblar FTS5 (soporte inexistente o DB corrupta). Motivo: {e}")
@@ -115,6 +394,8 @@ def build_sqlite_db(df: pd.DataFrame, output_path: str = DB_OUTPUT_PATH) -> str:
 
     Returns the absolute path to the generated database file.
     """
+    if "cluster_id" not in df.columns:
+        df = cluster_comments(df)
     _ensure_dirs(output_path)
     # Rebuild DB from scratch and clear any WAL/SHM sidecars
     _remove_db_files(output_path)
@@ -126,10 +407,19 @@ def build_sqlite_db(df: pd.DataFrame, output_path: str = DB_OUTPUT_PATH) -> str:
         _insert_reports(conn, df)
         conn.commit()
 
+        # Month-grain rollups (+ triggers that keep them in sync afterwards)
+        _build_rollups(conn)
+        conn.executescript(CLUSTER_TRIGGERS_SQL)
+        conn.commit()
+
         # Try to enable FTS5 and populate
         _setup_fts(conn)
         _populate_fts(conn)
         conn.commit()
+
+        # Planner statistics: lets SQLite pick the selective index when filters combine
+        conn.execute("ANALYZE")
+        conn.commit()
     finally:
         conn.close()
 
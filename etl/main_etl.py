@@ -7,7 +7,9 @@ import pandas as pd
 
 from etl.extract.dataset import read_dataset
 from etl.transform.clean_dataset import transform_dataset
+from etl.transform.cluster_comments import cluster_comments
 from etl.load.store_sqlite import build_sqlite_db
+from etl.load.store_parquet import build_parquet_dataset
 
 
 PROCESSED_CSV_PATH = os.path.join("data", "processed", "dataset_clean.csv")
@@ -23,7 +25,7 @@ def _verify_file_written(path: str) -> None:
 
 
 def run_etl(input_path: str | None = None) -> Tuple[str, str]:
-    """Run ETL on the dataset and export CSV and SQLite DB.
+    """Run ETL on the dataset and export CSV, Parquet dataset and SQLite DB.
 
     Returns (processed_csv_abs_path, sqlite_abs_path)
     """
@@ -40,12 +42,23 @@ def run_etl(input_path: str | None = None) -> Tuple[str, str]:
     clean_df.to_csv(PROCESSED_CSV_PATH, index=False, encoding="utf-8")
     _verify_file_written(PROCESSED_CSV_PATH)
 
+    # Export columnar dataset (partitioned by month) for scan-heavy analytics
+    parquet_path = build_parquet_dataset(clean_df)
+
+    # Cluster near-duplicate comments: SQLite stores cluster_id/cluster_size per report
+    # and indexes each distinct text of a cluster once in FTS
+    clustered_df = cluster_comments(clean_df)
+    n_groups = clustered_df["grupo"].nunique()
+    n_clusters = clustered_df["cluster_id"].nunique()
+
     # Build SQLite DB
-    sqlite_path = build_sqlite_db(clean_df)
+    sqlite_path = build_sqlite_db(clustered_df)
 
     print(
         f"ETL completed. Rows: source={src_count}, cleaned={clean_count}.\n"
+        f"Comment clusters: {n_clusters} ({n_groups} near-duplicate groups).\n"
         f"CSV: {os.path.abspath(PROCESSED_CSV_PATH)}\n"
+        f"Parquet: {parquet_path}\n"
         f"SQLite: {sqlite_path}"
     )
 
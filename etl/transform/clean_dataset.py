@@ -5,6 +5,8 @@ from typing import List
 
 import pandas as pd
 
+from etl.transform.rules import COMMENT_NULL_PATTERNS, EDAD_MAX, EDAD_MIN, FLAG_COLUMNS, GENERO_MAP, parse_urgencia
+
 # Column mapping from source (Spanish) to normalized snake_case
 COLUMN_RENAME_MAP = {
     "ID": "id",
@@ -42,19 +44,11 @@ URGENCIA_MAP = {
     "No urgente": 0,
 }
 
-# Normalize genero values
-GENERO_MAP = {
-    "M": "M",
-    "F": "F",
-    "Otro": "Otro",
-    "O": "Otro",
-}
-
-
 def _trim_strings(df: pd.DataFrame) -> pd.DataFrame:
     for col in df.columns:
         if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
-            df[col] = df[col].astype("string").str.strip()
+            # Whitespace-only values become empty after stripping: treat them as missing
+            df[col] = df[col].astype("string").str.strip().replace("", pd.NA)
     return df
 
 
@@ -79,7 +73,7 @@ def _normalize_edad(df: pd.DataFrame) -> pd.DataFrame:
     df["edad"] = pd.to_numeric(df["edad"], errors="coerce")
     df["edad"] = df["edad"].round().astype("Int64")
     # Filter unrealistic ages
-    df = df[(df["edad"].notna()) & (df["edad"] >= 0) & (df["edad"] <= 120)]
+    df = df[(df["edad"].notna()) & (df["edad"] >= EDAD_MIN) & (df["edad"] <= EDAD_MAX)]
     return df
 
 
@@ -89,28 +83,21 @@ def _normalize_genero(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def _normalize_booleans(df: pd.DataFrame) -> pd.DataFrame:
-    for col in ["acceso_internet", "atencion_previa_gobierno", "zona_rural"]:
+    for col in FLAG_COLUMNS:
         df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
         df[col] = df[col].where(df[col].isin([0, 1]))  # keep only 0/1
     return df
 
 
 def _normalize_urgencia(df: pd.DataFrame) -> pd.DataFrame:
-    def map_urg(v: object) -> int | None:
-        s = str(v).strip().lower()
-        if s in ("urgente", "alta", "alta urgencia"):
-            return 1
-        if s in ("no urgente", "baja", "baja urgencia"):
-            return 0
-        return None
-    df["urgente"] = df["nivel_urgencia"].map(map_urg)
+    df["urgente"] = df["nivel_urgencia"].map(parse_urgencia)
     return df
 
 
 def _clean_nan_comentario(df: pd.DataFrame) -> pd.DataFrame:
     if "comentario" in df.columns:
         df["comentario"] = df["comentario"].replace(
-            to_replace=[r"^\s*$", r"(?i)^nan$", r"(?i)^none$", r"(?i)^null$"],
+            to_replace=COMMENT_NULL_PATTERNS,
             value=pd.NA,
             regex=True,
         )
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import pandas as pd
+
+from etl.transform.minhash import group_keys
+from etl.transform.rules import normalize_comment
+
+
+def cluster_comments(df: pd.DataFrame) -> pd.DataFrame:
+    """Assign near-duplicate comment clusters.
+
+    Adds:
+    - comentario_clave: normalized comment text
+    - grupo: near-duplicate group of the comment text (same template phrasing)
+    - cluster_id: id of the representative report (lowest id) of its (grupo, ciudad, categoria_problema)
+    - cluster_size: number of reports in that cluster
+
+    Clusters never cross ciudad/categoria_problema, so filtering or matching on them stays exact
+    when each distinct text is indexed once per cluster.
+    """
+    out = df.copy()
+    out["comentario_clave"] = out["comentario"].map(normalize_comment)
+    keys = sorted(out["comentario_clave"].unique())
+    groups = dict(zip(keys, group_keys(keys)))
+    out["grupo"] = out["comentario_clave"].map(groups).astype(int)
+    by_cluster = out.groupby(["grupo", "ciudad", "categoria_problema"], sort=False)["id"]
+    out["cluster_id"] = by_cluster.transform("min").astype(int)
+    out["cluster_size"] = by_cluster.transform("size").astype(int)
+    return out
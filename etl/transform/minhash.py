@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import functools
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from etl.transform.rules import SIMILARITY_THRESHOLD, comment_shingles, jaccard
+
+# MinHash signature = BANDS x ROWS_PER_BAND permutations. Two texts become LSH candidates when
+# any band matches entirely; with 20 x 3 the detection probability is ~99% at Jaccard 0.6 and
+# ~42% at 0.3, and every candidate pair is verified against SIMILARITY_THRESHOLD afterwards
+BANDS = 20
+ROWS_PER_BAND = 3
+# Keys kept per band bucket by VariantIndex (one per group): bounds the candidates of a live insert
+BUCKET_SIZE = 8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_SEED = 20251
+
+
+def _shingles(key: str) -> np.ndarray:
+    return np.array(sorted(comment_shingles(key)), dtype=np.uint64)
+
+
+@functools.lru_cache(maxsize=1)
+def _coefficients() -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(_SEED)
+    n = BANDS * ROWS_PER_BAND
+    return rng.integers(1, 1 << 31, size=n, dtype=np.uint64), rng.integers(0, 1 << 31, size=n, dtype=np.uint64)
+
+
+def _signatures(shingles: List[np.ndarray]) -> np.ndarray:
+    a, b = _coefficients()
+    sigs = np.empty((len(shingles), len(a)), dtype=np.uint64)
+    for i, sh in enumerate(shingles):
+        # (a*x + b) mod p over 32-bit hashes and 31-bit coefficients fits in uint64 without overflow
+        sigs[i] = ((np.outer(sh, a) + b) % _MERSENNE_PRIME).min(axis=0)
+    return sigs
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def group_keys(keys: List[str]) -> List[int]:
+    """Near-duplicate group index for each distinct normalized key (MinHash/LSH + Jaccard check)."""
+    shingles = [_shingles(k) for k in keys]
+    sets = [set(sh.tolist()) for sh in shingles]
+    parent = list(range(len(keys)))
+    if len(keys) > 1:
+        sigs = _signatures(shingles)
+        for band in range(BANDS):
+            buckets: Dict[bytes, List[int]] = {}
+            for i, row in enumerate(sigs[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]):
+                buckets.setdefault(row.tobytes(), []).append(i)
+            for members in buckets.values():
+                # Each member is checked against one anchor per group seen in the bucket, not against
+                # every earlier member: skewed template data puts most keys in one bucket, and all-pairs
+                # checks there are O(n^2). A member joins every anchor it matches, so groups still chain
+                anchors: List[int] = []
+                for j in members:
+                    joined = False
+                    for a in anchors:
+                        ra, rj = _find(parent, a), _find(parent, j)
+                        if ra == rj:
+                            joined = True
+                        elif jaccard(sets[a], sets[j]) >= SIMILARITY_THRESHOLD:
+                            parent[max(ra, rj)] = min(ra, rj)
+                            joined = True
+                    if not joined:
+                        anchors.append(j)
+    roots = [_find(parent, i) for i in range(len(keys))]
+    # Dense group numbers in first-seen order
+    dense: Dict[int, int] = {}
+    return [dense.setdefault(r, len(dense) + 1) for r in roots]
+
+
+class VariantIndex:
+    """Near-duplicate group lookup for one key at a time, on the same MinHash bands as group_keys.
+
+    Used by the live ingest writer: a new key is verified only against the keys that share a band
+    bucket with it, so the cost of an insert does not grow with the number of known variants.
+    Each bucket keeps the first key of at most BUCKET_SIZE groups (the same anchors group_keys uses).
+    """
+
+    def __init__(self, bucket_size: int = BUCKET_SIZE) -> None:
+        self.bucket_size = bucket_size
+        self._buckets: Dict[Tuple[int, bytes], Dict[int, Tuple[str, Set[int]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    @staticmethod
+    def _bands(shingles: Set[int]) -> List[Tuple[int, bytes]]:
+        sig = _signatures([np.array(sorted(shingles), dtype=np.uint64)])[0]
+        return [(band, sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()) for band in range(BANDS)]
+
+    def add(self, key: str, group: int) -> None:
+        shingles = comment_shingles(key)
+        for band in self._bands(shingles):
+            bucket = self._buckets.setdefault(band, {})
+            if group not in bucket and len(bucket) < self.bucket_size:
+                bucket[group] = (key, shingles)
+
+    def update(self, variants: Iterable[Tuple[str, int]]) -> None:
+        for key, group in variants:
+            self.add(key, group)
+
+    def discard(self, key: str) -> None:
+        """Forget a key added earlier (e.g. its transaction was rolled back)."""
+        for band in self._bands(comment_shingles(key)):
+            bucket = self._buckets.get(band)
+            if bucket is None:
+                continue
+            for group, (anchor, _) in list(bucket.items()):
+                if anchor == key:
+                    del bucket[group]
+            if not bucket:
+                del self._buckets[band]
+
+    def best(self, key: str) -> Tuple[float, int]:
+        """(Jaccard, group) of a group anchor similar to `key`, or of the closest candidate; (0.0, 0) if none.
+
+        Like group_keys, the first anchor at or above SIMILARITY_THRESHOLD decides the group.
+        """
+        shingles = comment_shingles(key)
+        best = (0.0, 0)
+        seen: Set[str] = set()
+        for band in self._bands(shingles):
+            for group, (anchor, anchor_shingles) in self._buckets.get(band, {}).items():
+                if anchor not in seen:
+                    seen.add(anchor)
+                    best = max(best, (jaccard(shingles, anchor_shingles), group))
+                    if best[0] >= SIMILARITY_THRESHOLD:
+                        return best
+        return best
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import math
+import re
+import unicodedata
+import zlib
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Row-level cleaning rules shared by the batch ETL (clean_dataset.py, vectorized with pandas)
+# and the live ingestion API (app/ingest.py, one record at a time). Pure Python: the API image
+# does not install pandas.
+
+# Comment values that mean "no comment"
+COMMENT_NULL_PATTERNS = [r"^\s*$", r"(?i)^nan$", r"(?i)^none$", r"(?i)^null$"]
+
+# Valid age range (inclusive); ages are rounded to the nearest integer first
+EDAD_MIN = 0
+EDAD_MAX = 120
+
+# Normalize genero values
+GENERO_MAP = {
+    "M": "M",
+    "F": "F",
+    "Otro": "Otro",
+    "O": "Otro",
+}
+
+# Accepted nivel_urgencia spellings (lowercased) -> urgente flag
+URGENTE_VALUES = ("urgente", "alta", "alta urgencia")
+NO_URGENTE_VALUES = ("no urgente", "baja", "baja urgencia")
+
+# 0/1 columns (0 carencia, 1 dispone)
+FLAG_COLUMNS = ["acceso_internet", "atencion_previa_gobierno", "zona_rural"]
+
+# Text columns that are required after trimming
+TEXT_COLUMNS = ["nombre", "genero", "ciudad", "comentario", "categoria_problema", "nivel_urgencia"]
+
+_COMMENT_NULL_RE = [re.compile(p) for p in COMMENT_NULL_PATTERNS]
+
+
+def parse_urgencia(value: object) -> Optional[int]:
+    s = str(value).strip().lower()
+    if s in URGENTE_VALUES:
+        return 1
+    if s in NO_URGENTE_VALUES:
+        return 0
+    return None
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    s = str(value).strip()
+    return s or None
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return float(value)
+    try:
+        n = float(str(value).strip())
+    except ValueError:
+        return None
+    return n if math.isfinite(n) else None
+
+
+def clean_record(raw: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """Apply the ETL cleaning rules to one report given with snake_case column names.
+
+    Returns (row, []) with the same columns and types as transform_dataset output (`id` may be
+    None: the writer assigns one), or (None, errors) when the row would be dropped by the ETL.
+    Dates must be ISO (YYYY-MM-DD, optionally followed by a time).
+    """
+    errors: List[str] = []
+    row: Dict[str, Any] = {}
+
+    if raw.get("id") is not None:
+        n = _number(raw.get("id"))
+        if n is None or n != int(n) or n <= 0:
+            errors.append("id: debe ser un entero positivo")
+        else:
+            row["id"] = int(n)
+    else:
+        row["id"] = None
+
+    for col in TEXT_COLUMNS:
+        row[col] = _text(raw.get(col))
+        if row[col] is None:
+            errors.append(f"{col}: requerido")
+    if row["comentario"] is not None and any(p.match(row["comentario"]) for p in _COMMENT_NULL_RE):
+        errors.append("comentario: requerido")
+
+    edad = _number(raw.get("edad"))
+    if edad is None or not EDAD_MIN <= round(edad) <= EDAD_MAX:
+        errors.append(f"edad: número entre {EDAD_MIN} y {EDAD_MAX}")
+    else:
+        row["edad"] = int(round(edad))
+
+    if row["genero"] is not None:
+        row["genero"] = GENERO_MAP.get(row["genero"])
+        if row["genero"] is None:
+            errors.append("genero: M, F u Otro")
+
+    if row["nivel_urgencia"] is not None:
+        row["urgente"] = parse_urgencia(row["nivel_urgencia"])
+        if row["urgente"] is None:
+            errors.append("nivel_urgencia: Urgente o No urgente")
+
+    fecha = _text(raw.get("fecha_reporte"))
+    try:
+        row["fecha_reporte"] = date.fromisoformat(fecha[:10]).isoformat() if fecha else None
+    except ValueError:
+        row["fecha_reporte"] = None
+    if row["fecha_reporte"] is None:
+        errors.append("fecha_reporte: fecha YYYY-MM-DD")
+
+    for col in FLAG_COLUMNS:
+        n = _number(raw.get(col))
+        if n not in (0, 1):
+            errors.append(f"{col}: 0 o 1")
+        else:
+            row[col] = int(n)
+
+    return (None, errors) if errors else (row, [])
+
+
+# Comment identity (near-duplicate clustering, see cluster_comments.py)
+
+# Character shingles: robust to small wording/typo differences in short comments
+SHINGLE_SIZE = 4
+
+# Minimum Jaccard similarity of shingle sets for two comments to be near-duplicates
+# ("falta agua potable en varias casas" / "... en muchas casas" is ~0.63)
+SIMILARITY_THRESHOLD = 0.6
+
+
+def normalize_comment(text: object) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace: exact-duplicate key."""
+    s = unicodedata.normalize("NFKD", str(text or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def comment_shingles(key: str) -> Set[int]:
+    """Hashed character shingles of a normalized comment."""
+    if len(key) <= SHINGLE_SIZE:
+        return {zlib.crc32(key.encode("utf-8"))}
+    return {zlib.crc32(key[i:i + SHINGLE_SIZE].encode("utf-8")) for i in range(len(key) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter) if (a or b) else 1.0
@@ -0,0 +1,23 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+from etl.extract.dataset import read_dataset
+from etl.load.store_sqlite import build_sqlite_db
+from etl.transform.clean_dataset import transform_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# La app lee DB_PATH al importarse: antes de cualquier test se construye la base con el ETL
+# (esquema normalizado report_facts + clústeres + FTS) en vez de usar data/db/reports.sqlite
+_tmp = tempfile.mkdtemp(prefix="reports-test-")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+DB_PATH = build_sqlite_db(
+    transform_dataset(read_dataset(os.path.join(ROOT, "data", "dataset", "dataset.csv"))),
+    os.path.join(_tmp, "reports.sqlite"),
+)
+os.environ["DB_PATH"] = DB_PATH
+os.environ["CACHE_PATH"] = ""
+os.environ.setdefault("WARMUP_ENABLED", "0")
+os.environ.setdefault("LLM_HEALTH_INTERVAL_SECONDS", "0")
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+import app.main as main
+
+client = TestClient(main.app)
+
+
+def test_client_stats_need_admin_token(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    assert client.get("/stats/clients").status_code == 404
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secreto")
+    assert client.get("/stats/clients").status_code == 403
+    r = client.get("/stats/clients", headers={"X-Admin-Token": "secreto"})
+    assert r.status_code == 200 and "clients" in r.json()
+
+
+def test_forwarded_for_only_from_trusted_proxy():
+    from app.admission import client_ip, parse_networks
+
+    proxies = parse_networks("10.0.0.0/8, 172.17.0.1, basura")
+    assert len(proxies) == 2
+    assert client_ip("172.17.0.1", "203.0.113.7", proxies) == "203.0.113.7"
+    # Lo que el cliente ponga a la izquierda no cuenta: manda la última dirección no confiable
+    assert client_ip("172.17.0.1", "1.2.3.4, 203.0.113.7, 10.0.0.3", proxies) == "203.0.113.7"
+    assert client_ip("198.51.100.2", "203.0.113.7", proxies) == "198.51.100.2"
+    assert client_ip("172.17.0.1", None, proxies) == "172.17.0.1"
+    assert client_ip("172.17.0.1", "203.0.113.7", []) == "172.17.0.1"
@@ -0,0 +1,26 @@
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.llm import LLMRouter
+
+# Salida típica de una plantilla de chat de llama.cpp: la respuesta empieza con una línea en blanco
+GENERATED = "\n\nHubo 1234 reportes en total.\n\nAdemás, la mayoría fueron urgentes."
+
+
+def _fake_llama(request: httpx.Request) -> httpx.Response:
+    # Como llama.cpp: el texto se corta en la primera aparición de cualquier stop
+    stops = json.loads(request.content).get("stop", [])
+    cut = min([GENERATED.find(s) for s in stops if s in GENERATED], default=len(GENERATED))
+    return httpx.Response(200, json={"content": GENERATED[:cut], "tokens_predicted": 12})
+
+
+def test_numeric_question_gets_first_paragraph(monkeypatch):
+    monkeypatch.setattr(main, "llm_router", LLMRouter(["http://llm"], transport=httpx.MockTransport(_fake_llama)))
+    r = TestClient(main.app).post("/ask", json={"texto": "¿Cuántos reportes hay en total?"})
+    assert r.status_code == 200
+    body = r.json()
+    assert not body["degraded"]
+    assert body["answer"] == "Hubo 1234 reportes en total."
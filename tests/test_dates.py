@@ -0,0 +1,30 @@
+from datetime import date
+
+import pytest
+
+from app.dates import parse_date_range
+from app.intent import check_corpus
+
+TODAY = date(2025, 3, 15)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "¿Cuántos reportes hubo en los últimos 5000 años?",
+        "reportes de los últimos 99999999 días",
+        "reportes de las últimas 99999999999999999999 semanas",
+        "reportes de los últimos 30000 meses",
+    ],
+)
+def test_out_of_calendar_relative_range_has_no_date_range(question):
+    assert parse_date_range(question, TODAY) is None
+
+
+def test_relative_range_still_parsed():
+    assert parse_date_range("últimos 3 meses", TODAY) == (date(2024, 12, 15), date(2025, 3, 16))
+    assert parse_date_range("últimos 2000 años", TODAY) == (date(25, 3, 15), date(2025, 3, 16))
+
+
+def test_intent_corpus():
+    assert check_corpus() == []
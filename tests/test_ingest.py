@@ -0,0 +1,118 @@
+import asyncio
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from app.ingest import IngestConflict, IngestUnavailable, ReportWriter
+from etl.load.store_sqlite import build_sqlite_db
+from etl.transform.rules import clean_record, normalize_comment
+
+BASE = {
+    "nombre": "Ana", "edad": 30, "genero": "F", "ciudad": "Cali", "categoria_problema": "Salud",
+    "nivel_urgencia": "Urgente", "fecha_reporte": "2024-05-01", "acceso_internet": 1,
+    "atencion_previa_gobierno": 0, "zona_rural": 0,
+}
+
+
+def _row(comentario, **extra):
+    row, errors = clean_record({**BASE, "comentario": comentario, **extra})
+    assert row, errors
+    return row
+
+
+@pytest.fixture
+def db(tmp_path):
+    rows = [{**_row(f"falta agua potable en el barrio {i}"), "id": i} for i in range(1, 11)]
+    path = str(tmp_path / "reports.sqlite")
+    build_sqlite_db(pd.DataFrame(rows), path)
+    return path
+
+
+def _count(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM report_facts").fetchone()[0]
+
+
+async def _submit_all(path, requests):
+    writer = ReportWriter(path, flush_rows=1000, flush_seconds=0.05)
+    writer.start()
+    try:
+        return await asyncio.gather(*(writer.submit(rows) for rows in requests), return_exceptions=True)
+    finally:
+        await writer.stop()
+
+
+def test_conflicting_request_fails_alone(db):
+    ok, conflict, ok2 = asyncio.run(_submit_all(db, [
+        [_row("las basuras no se recogen")],
+        [_row("no hay luz en la vereda", id=3)],
+        [_row("huecos en la vía principal"), _row("huecos en la vía principal")],
+    ]))
+    assert isinstance(conflict, IngestConflict) and conflict.ids == [3]
+    assert len(ok) == 1 and len(ok2) == 2
+    assert len(set(ok + ok2)) == 3 and min(ok + ok2) > 10
+    assert _count(db) == 13
+
+
+def test_explicit_id_never_reuses_cluster_id(db):
+    with sqlite3.connect(db) as conn:
+        # El representante se borra pero su clúster sigue con los demás reportes
+        conn.execute("DELETE FROM report_facts WHERE id = 1")
+        assert conn.execute("SELECT COUNT(*) FROM comment_clusters WHERE id = 1").fetchone()[0] == 1
+    (result,) = asyncio.run(_submit_all(db, [[_row("otra queja", id=1)]]))
+    assert isinstance(result, IngestConflict) and result.ids == [1]
+
+
+def test_duplicate_id_in_request_is_rejected():
+    from app.main import _validate_reports
+
+    rows, rejected = _validate_reports([{**BASE, "comentario": "a", "id": 5}, {**BASE, "comentario": "b", "id": 5}])
+    assert [r["id"] for r in rows] == [5]
+    assert rejected == [{"index": 1, "errors": ["id: repetido en la petición"]}]
+
+
+def test_ingest_requires_token(monkeypatch):
+    import app.main as main
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    body = [{**BASE, "comentario": "falta agua"}]
+    monkeypatch.setattr(main, "INGEST_ENABLED", False)
+    monkeypatch.setattr(main, "INGEST_TOKEN", "secreto")
+    assert client.post("/reports", json=body).status_code == 404
+    monkeypatch.setattr(main, "INGEST_ENABLED", True)
+    assert client.post("/reports", json=body).status_code == 403
+    assert client.post("/reports", json=body, headers={"X-Ingest-Token": "otro"}).status_code == 403
+
+
+def test_rolled_back_request_leaves_no_cache_entries(db):
+    writer = ReportWriter(db, flush_rows=1000, flush_seconds=0.05)
+    # Id repetido dentro de la petición (sin pasar por _validate_reports): falla al insertar, ya con cachés llenas
+    bad = [_row("una queja nueva sobre el alumbrado público", ciudad="Pasto", id=50)] * 2
+    (result,) = writer._write([bad])
+    assert isinstance(result, sqlite3.IntegrityError)
+    assert "Pasto" not in writer._dims["ciudades"]
+    assert not any("alumbrado" in key for key in writer._variants)
+    assert writer._variant_index.best(normalize_comment("una queja nueva sobre el alumbrado público")) == (0.0, 0)
+
+    (ids,) = writer._write([[_row("una queja nueva sobre el alumbrado público", ciudad="Pasto")]])
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT ciudad FROM reports WHERE id = ?", ids).fetchone() == ("Pasto",)
+    writer._conn.close()
+
+
+def test_one_writer_per_database(db):
+    async def run():
+        first, second = ReportWriter(db), ReportWriter(db)
+        first.start()
+        try:
+            with pytest.raises(IngestUnavailable):
+                second.start()
+        finally:
+            await first.stop()
+        # Al detenerse suelta el candado
+        second.start()
+        await second.stop()
+
+    asyncio.run(run())
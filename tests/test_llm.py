@@ -0,0 +1,33 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.llm import LLMRouter
+
+
+def _router(handler, urls=("http://a", "http://b")):
+    return LLMRouter(list(urls), transport=httpx.MockTransport(handler), hedge_seconds=0, eject_failures=1)
+
+
+@pytest.mark.parametrize("body", [b'{"content": "trunc', b"<html>502</html>", b"[1, 2]"])
+def test_invalid_body_strikes_backend_and_retries(body):
+    def handler(request):
+        if request.url.host == "a":
+            return httpx.Response(200, content=body)
+        return httpx.Response(200, json={"content": "ok"})
+
+    router = _router(handler)
+    router.backends[1].in_flight = 5  # la primera elección es "a"
+    data = asyncio.run(router.complete({"prompt": "x"}, timeout=1))
+    router.backends[1].in_flight -= 5
+    assert data == {"content": "ok"}
+    a = router.backends[0]
+    assert a.errors == 1 and a.ejections == 1
+
+
+def test_invalid_body_on_every_backend_is_http_error():
+    router = _router(lambda request: httpx.Response(200, content=b"no es json"), urls=("http://a",))
+    with pytest.raises(httpx.HTTPError):
+        asyncio.run(router.complete({"prompt": "x"}, timeout=1))
+    assert router.backends[0].errors == 1
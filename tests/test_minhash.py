@@ -0,0 +1,45 @@
+from etl.transform import minhash
+from etl.transform.rules import jaccard, normalize_comment
+
+
+def _templated(n):
+    return sorted({normalize_comment(f"la comunidad reporta fallas en el servicio de agua del sector {i} desde hace semanas") for i in range(n)})
+
+
+def test_near_duplicates_share_a_group_and_others_do_not():
+    keys = _templated(50) + [normalize_comment("los huecos de la vía principal causan accidentes a diario")]
+    groups = minhash.group_keys(keys)
+    assert len(set(groups[:-1])) == 1
+    assert groups[-1] != groups[0]
+
+
+def test_skewed_bucket_is_not_all_pairs(monkeypatch):
+    calls = [0]
+
+    def counting(a, b):
+        calls[0] += 1
+        return jaccard(a, b)
+
+    monkeypatch.setattr(minhash, "jaccard", counting)
+    keys = _templated(2000)
+    assert len(set(minhash.group_keys(keys))) < 20
+    # Todas las parejas de un bucket serían ~n²/2 = 2e6 comparaciones por banda
+    assert calls[0] < 5 * len(keys) * minhash.BANDS
+
+
+def test_variant_index_matches_near_duplicates_only():
+    index = minhash.VariantIndex()
+    index.add(normalize_comment("falta agua potable en el barrio norte"), 1)
+    index.add(normalize_comment("los huecos de la vía principal causan accidentes"), 2)
+    score, group = index.best(normalize_comment("falta agua potable en el barrio sur"))
+    assert group == 1 and score >= minhash.SIMILARITY_THRESHOLD
+    assert index.best(normalize_comment("el parque no tiene iluminación de noche"))[0] < minhash.SIMILARITY_THRESHOLD
+    index.discard(normalize_comment("falta agua potable en el barrio norte"))
+    assert index.best(normalize_comment("falta agua potable en el barrio sur")) == (0.0, 0)
+
+
+def test_variant_index_bucket_is_bounded():
+    index = minhash.VariantIndex(bucket_size=4)
+    for i, key in enumerate(_templated(200)):
+        index.add(key, i)
+    assert max(len(b) for b in index._buckets.values()) <= 4
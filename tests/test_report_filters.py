@@ -0,0 +1,43 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import retrieval
+from app.main import app
+
+client = TestClient(app)
+
+ROUTES = [
+    "/reports/search?format=json&limit=5",
+    "/reports/search?format=ndjson",
+    "/reports/search?format=csv",
+    "/charts/mensual?format=json",
+    "/charts/ciudades?format=png",
+]
+BAD_DATES = ["abc", "2024-03", "2024", "2024-02-30", "2024-13-01", "03/01/2024"]
+
+
+@pytest.mark.parametrize("route", ROUTES)
+@pytest.mark.parametrize("param", ["fecha_desde", "fecha_antes", "fecha_hasta"])
+@pytest.mark.parametrize("value", BAD_DATES)
+def test_malformed_or_partial_date_is_422(route, param, value):
+    r = client.get(f"{route}&{param}={value}")
+    assert r.status_code == 422
+    assert r.json()["detail"][0]["loc"] == ["query", param]
+
+
+@pytest.mark.parametrize("route", ["/reports/search?format=json&limit=5", "/charts/mensual?format=json"])
+def test_full_date_is_accepted(route):
+    r = client.get(f"{route}&fecha_desde=2024-03-01&fecha_antes=2024-04-01")
+    assert r.status_code == 200
+
+
+def test_page_respects_date_bounds():
+    r = client.get("/reports/search?format=json&orden=fecha&limit=50&fecha_desde=2024-03-01&fecha_antes=2024-04-01")
+    assert r.status_code == 200
+    fechas = [item["fecha_reporte"][:10] for item in r.json()["items"]]
+    assert fechas and all("2024-03-01" <= f < "2024-04-01" for f in fechas)
+
+
+def test_runs_on_the_normalized_schema():
+    conn = retrieval._connect()
+    assert retrieval._is_normalized(conn) and retrieval._has_clusters(conn) and retrieval._has_fts(conn)
@@ -0,0 +1,16 @@
+import json
+import time
+
+from app.tracing import TraceStore
+
+
+def test_slow_log_written_off_the_caller(tmp_path):
+    path = tmp_path / "slow.jsonl"
+    store = TraceStore(slow_ms=5, slow_path=str(path))
+    for ms in (10.0, 1.0, 20.0):
+        store.add({"id": store.new_id(), "method": "GET", "path": "/ask", "ms": ms, "spans": []})
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and len(path.read_text().splitlines() if path.exists() else []) < 2:
+        time.sleep(0.01)
+    assert [json.loads(line)["ms"] for line in path.read_text().splitlines()] == [10.0, 20.0]
+    assert [t["ms"] for t in store.slow()] == [20.0, 10.0]